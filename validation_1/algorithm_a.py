@@ -0,0 +1,163 @@
+"""
+Algoritmo A por lotes (Python).
+
+Winsorizacion iterativa (ISO 13528:2022 Anexo C) sobre una matriz
+combos x participantes rellena con NaN. Todas las filas iteran a la vez;
+las que convergen salen del conjunto activo. La traza por iteracion es
+opcional y se guarda en arreglos preasignados (filas x (max_iter + 1)).
+Las medianas se toman de OrderStats: los valores se ordenan una vez y la
+winsorizacion de cada iteracion no vuelve a ordenar.
+
+Se conserva la semantica de las etapas 4 y 4b: x* queda fijo en la
+mediana inicial y solo se actualiza sigma.
+"""
+
+import numpy as np
+
+from helpers import pad_rows
+from order_stats import OrderStats
+
+MAX_ITER = 50
+TOL_REL = 0.5
+SIGMA_EPS = 1e-15
+MIN_VALUES = 4
+
+TRACE_FIELDS = ("sigma", "x_w_median", "x_w_mad", "sigma_w", "max_abs_z", "converged")
+
+
+def algorithm_a_rows(matrix, max_iter=MAX_ITER, tol=TOL_REL, trace=False):
+    """Ejecutar el Algoritmo A para cada fila de `matrix`.
+
+    Retorna dict de arreglos por fila: n, valid (n >= 4), assigned_value,
+    robust_sd, iterations, converged, x_mad y winsorized (matriz). Con
+    trace=True agrega "trace" (arreglos filas x (max_iter + 1)) y
+    "trace_len" (numero de pasos registrados por fila, incluido el inicial).
+    """
+    stats = OrderStats(matrix)
+    sorted_arr, n = stats.sorted, stats.n
+    rows = sorted_arr.shape[0]
+    valid = n >= MIN_VALUES
+
+    x_median = stats.median()
+    x_mad = stats.abs_dev_median(x_median)
+    sigma = 1.483 * x_mad
+
+    robust_sd = np.full(rows, np.nan)
+    iterations = np.zeros(rows, dtype=np.int64)
+    converged = np.zeros(rows, dtype=bool)
+    winsorized = sorted_arr.copy()
+
+    tr = None
+    trace_len = np.zeros(rows, dtype=np.int64)
+    if trace:
+        tr = {name: np.full((rows, max_iter + 1), np.nan) for name in TRACE_FIELDS}
+        tr["converged"] = np.zeros((rows, max_iter + 1), dtype=bool)
+        tr["sigma"][:, 0] = sigma
+        tr["x_w_median"][:, 0] = x_median
+        tr["x_w_mad"][:, 0] = x_mad
+        tr["sigma_w"][:, 0] = sigma
+        tr["max_abs_z"][:, 0] = 0.0
+        trace_len[valid] = 1
+
+    # Dispersion inicial nula: converge sin iterar
+    done0 = valid & (sigma < SIGMA_EPS)
+    robust_sd[done0] = sigma[done0]
+    converged[done0] = True
+
+    active = np.nonzero(valid & ~done0)[0]
+    for iter_num in range(1, max_iter + 1):
+        if active.size == 0:
+            break
+        x = sorted_arr[active]
+        med = x_median[active]
+        sig = sigma[active]
+
+        z = (x - med[:, None]) / (1.5 * sig)[:, None]
+        lower = (med - 1.5 * sig)[:, None]
+        upper = (med + 1.5 * sig)[:, None]
+        x_w = np.where(z < -1, lower, np.where(z > 1, upper, x))
+
+        # x ya esta ordenada y la winsorizacion conserva el orden
+        w_stats = stats.rows(active).replace(x_w)
+        x_w_median = w_stats.median()
+        x_w_mad = w_stats.abs_dev_median(x_w_median)
+        sigma_w = 1.06 * x_w_mad
+        conv = np.abs(sigma_w - sig) <= tol * sig
+
+        winsorized[active] = x_w
+        if trace:
+            tr["sigma"][active, iter_num] = sig
+            tr["x_w_median"][active, iter_num] = x_w_median
+            tr["x_w_mad"][active, iter_num] = x_w_mad
+            tr["sigma_w"][active, iter_num] = sigma_w
+            tr["max_abs_z"][active, iter_num] = np.nanmax(np.abs(z), axis=1)
+            tr["converged"][active, iter_num] = conv
+            trace_len[active] = iter_num + 1
+
+        finished = active[conv]
+        robust_sd[finished] = sigma_w[conv]
+        iterations[finished] = iter_num
+        converged[finished] = True
+
+        pending = ~conv
+        sigma[active[pending]] = sigma_w[pending]
+        active = active[pending]
+
+    # Sin convergencia: se reporta el ultimo sigma
+    robust_sd[active] = sigma[active]
+    iterations[active] = max_iter
+
+    result = {
+        "n": n,
+        "valid": valid,
+        "assigned_value": np.where(valid, x_median, np.nan),
+        "robust_sd": robust_sd,
+        "iterations": iterations,
+        "converged": converged,
+        "x_mad": x_mad,
+        "winsorized": winsorized,
+    }
+    if trace:
+        result["trace"] = tr
+        result["trace_len"] = trace_len
+        result["initial_converged"] = done0
+    return result
+
+
+def trace_records(result, i):
+    """Reconstruir la traza de la fila i como lista de dicts (formato Etapa 4b)."""
+    tr = result["trace"]
+    n = int(result["n"][i])
+    x_median = float(result["assigned_value"][i])
+    x_mad = float(result["x_mad"][i])
+    records = []
+    for step in range(int(result["trace_len"][i])):
+        records.append({
+            "iteration": step,
+            "step": "initial" if step == 0 else "update",
+            "n": n,
+            "x_median": x_median,
+            "x_mad": x_mad,
+            "sigma": float(tr["sigma"][i, step]),
+            "x_w_median": float(tr["x_w_median"][i, step]),
+            "x_w_mad": float(tr["x_w_mad"][i, step]),
+            "sigma_w": float(tr["sigma_w"][i, step]),
+            "max_abs_z": float(tr["max_abs_z"][i, step]),
+            "converged": bool(tr["converged"][i, step]),
+        })
+    if result["initial_converged"][i]:
+        records.append({**records[0], "converged": True})
+    return records
+
+
+def run_algorithm_a(values, max_iter=MAX_ITER, tol=TOL_REL):
+    """Version escalar (un combo) sobre el motor por lotes."""
+    res = algorithm_a_rows(pad_rows([values]), max_iter=max_iter, tol=tol)
+    if not res["valid"][0]:
+        return {"error": "Algoritmo A requiere al menos 4 valores"}
+    return {
+        "assigned_value": float(res["assigned_value"][0]),
+        "robust_sd": float(res["robust_sd"][0]),
+        "iterations": int(res["iterations"][0]),
+        "converged": bool(res["converged"][0]),
+    }
@@ -0,0 +1,120 @@
+"""
+Bootstrap de x_pt y sigma_pt por metodo (Python).
+
+Remuestrea los resultados de participantes de un combo B veces con
+reemplazo, como un unico arreglo B x n, y evalua los estimadores de la
+Etapa 4 sobre todas las filas a la vez (robust_stats_rows y
+algorithm_a_rows ya trabajan por filas):
+
+    Consenso MADe  -> x_pt = mediana, sigma_pt = MADe
+    Consenso nIQR  -> x_pt = mediana, sigma_pt = nIQR
+    Algoritmo A    -> x_pt = mediana inicial, sigma_pt = s* del Algoritmo A
+
+Para cada metodo se reporta el error estandar bootstrap (sd, ddof=1) y el
+intervalo percentil (cuantiles tipo 7) junto al u_xpt analitico
+1.25 * sigma_pt / sqrt(n).
+"""
+
+import numpy as np
+
+from algorithm_a import algorithm_a_rows
+from helpers import robust_stats_rows
+from order_stats import OrderStats
+from random_streams import CHUNK_SIZE, DEFAULT_SEED, chunk_streams
+
+CI_LEVEL = 0.95
+
+BOOT_METHODS = ("Consenso MADe", "Consenso nIQR", "Algoritmo A")
+BOOT_FIELDS = [
+    "combo_id", "pollutant", "level", "method", "metric", "n", "B",
+    "estimate", "u_analytic", "boot_mean", "boot_se", "ci_low", "ci_high",
+    "se_ratio",
+]
+
+
+def resample(values, n_boot, rng):
+    """Matriz B x n de remuestras con reemplazo de `values`."""
+    values = np.asarray(values, dtype=float)
+    idx = rng.integers(0, values.size, size=(n_boot, values.size))
+    return values[idx]
+
+
+def method_estimates(matrix):
+    """(x_pt, sigma_pt) por metodo para cada fila de `matrix`."""
+    robust = robust_stats_rows(matrix)
+    algo = algorithm_a_rows(matrix, max_iter=50, tol=0.5)
+    return {
+        "Consenso MADe": (robust["median"], robust["MADe"]),
+        "Consenso nIQR": (robust["median"], robust["nIQR"]),
+        "Algoritmo A": (algo["assigned_value"], algo["robust_sd"]),
+    }
+
+
+def summarize(boot, level=CI_LEVEL):
+    """Media, SE (ddof=1) e intervalo percentil de las replicas finitas."""
+    boot = boot[np.isfinite(boot)]
+    if boot.size < 2:
+        return float("nan"), float("nan"), float("nan"), float("nan")
+    stats = OrderStats(boot)
+    alpha = (1.0 - level) / 2.0
+    return (
+        float(boot.mean()),
+        float(boot.std(ddof=1)),
+        float(stats.quantile(alpha)[0]),
+        float(stats.quantile(1.0 - alpha)[0]),
+    )
+
+
+def bootstrap_rows(combo_id, pollutant, level, values, n_boot, seed=DEFAULT_SEED,
+                   chunk_size=CHUNK_SIZE):
+    """Filas BOOT_FIELDS (metodo x {x_pt, sigma_pt}) de un combo.
+
+    Las B remuestras se generan por bloques de `chunk_size`, cada uno con
+    su flujo (random_streams.chunk_streams); solo se guardan los B
+    estimadores por metodo, no las remuestras.
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    n = values.size
+    point = method_estimates(values[None, :])
+    blocks = [
+        method_estimates(resample(values, size, rng))
+        for size, rng in chunk_streams(seed, combo_id, n_boot, chunk_size)
+    ]
+    boot = {
+        method: tuple(
+            np.concatenate([block[method][i] for block in blocks]) for i in range(2)
+        )
+        for method in BOOT_METHODS
+    }
+
+    rows = []
+    for method in BOOT_METHODS:
+        x_pt, sigma_pt = (float(a[0]) for a in point[method])
+        analytic = {
+            "x_pt": 1.25 * sigma_pt / np.sqrt(n) if n > 0 else float("nan"),
+            "sigma_pt": float("nan"),
+        }
+        for metric, estimate, samples in (
+            ("x_pt", x_pt, boot[method][0]),
+            ("sigma_pt", sigma_pt, boot[method][1]),
+        ):
+            mean, se, lo, hi = summarize(samples)
+            u = float(analytic[metric])
+            rows.append({
+                "combo_id": combo_id,
+                "pollutant": pollutant,
+                "level": level,
+                "method": method,
+                "metric": metric,
+                "n": n,
+                "B": n_boot,
+                "estimate": estimate,
+                "u_analytic": u,
+                "boot_mean": mean,
+                "boot_se": se,
+                "ci_low": lo,
+                "ci_high": hi,
+                "se_ratio": se / u if np.isfinite(u) and u > 0 else float("nan"),
+            })
+    return rows
@@ -0,0 +1,203 @@
+"""
+Generador bootstrap de datasets de homogeneidad/estabilidad (Python).
+
+Equivalente de session_outputs/adicionales/build_bootstrap_homogeneity_stability.R:
+
+    - pools: minutos de referencia (<pollutant>_ref|calaire_<ppm|ppb>) con
+      generador y timestamp, ordenados por timestamp; el nivel es el valor
+      del generador y cada tramo con el mismo nivel es una corrida
+      ("corrida_k"); un pool = (pollutant, run, level);
+    - por pool y dataset se remuestrean SIMULATED_MINUTES = 60 minutos con
+      reemplazo y el valor horario es round(mean, 3) (mean_rows_r y
+      round_r reproducen la aritmetica de R);
+    - asignacion: datasets 1..20 -> homogeneidad (2 replicas x 10
+      muestras), datasets 1..4 -> estabilidad (2 replicas x 2 muestras).
+
+Cada pool se remuestrea en un solo draw vectorizado: una matriz de
+indices n_datasets x 60 (rng.integers) que indexa los arreglos del pool.
+El generador del pool sale de random_streams.stream_rng(seed, clave del
+pool), por lo que el resultado depende solo de la semilla y del pool, no
+del orden ni de cuantos workers procesen los pools. El RNG de R
+(Mersenne-Twister + sample por rechazo) no se reproduce: con la misma
+semilla los valores difieren de los registros de R, pero los pools, la
+asignacion y la aritmetica son las mismas.
+"""
+
+import re
+
+import numpy as np
+
+from hourly_averages import level_labels, mean_rows_r, round_r
+from random_streams import DEFAULT_SEED, stream_rng
+
+SIMULATED_MINUTES = 60
+N_DATASETS = 20
+STUDY_LAYOUT = {
+    # study_type -> (replicas, muestras por replica)
+    "homogeneity": (2, 10),
+    "stability": (2, 2),
+}
+REF_PATTERN = re.compile(r"^(.+)_(ref|calaire)_(ppm|ppb)$")
+
+REGISTER_FIELDS = [
+    "study_type", "pollutant", "run", "level", "replicate", "sample_id", "dataset_id",
+    "value", "minute_pool_n", "simulated_minutes_n", "seed", "input_path",
+]
+HOURLY_FIELDS = ["pollutant", "run", "level", "dataset_id", "value", "minute_pool_n"]
+MINUTE_FIELDS = [
+    "pollutant", "run", "level", "dataset_id", "simulated_minute", "value",
+    "source_timestamp", "source_column", "generator_column",
+]
+STUDY_FIELDS = ["pollutant", "run", "level", "replicate", "sample_id", "value"]
+
+
+def reference_specs(columns):
+    """Pares (pollutant, ref_col, gen_col, unit) ordenados por contaminante."""
+    specs = []
+    for name in columns:
+        match = REF_PATTERN.match(name)
+        if not match or "_gen_" in name:
+            continue
+        pollutant = match.group(1)
+        gen_cols = [c for c in columns if re.match(rf"^{re.escape(pollutant)}_gen_(ppm|ppb)$", c)]
+        if len(gen_cols) != 1:
+            continue
+        unit = "\u00b5mol/mol" if name.endswith("_ppm") else "nmol/mol"
+        specs.append({"pollutant": pollutant, "ref_col": name, "gen_col": gen_cols[0], "unit": unit})
+    if not specs:
+        raise ValueError(
+            "No reference/generator column pairs detected. Expected names like "
+            "co_ref/co_gen or co_calaire/co_gen after normalization."
+        )
+    return sorted(specs, key=lambda s: s["pollutant"])
+
+
+def minute_pools(columns, specs):
+    """Pools (pollutant, run, level) con sus minutos, en el orden de R
+    (pollutant, run, level como texto)."""
+    timestamps = columns["timestamp"]
+    pools = []
+    for spec in specs:
+        value = np.asarray(columns[spec["ref_col"]], dtype=float)
+        gen = np.asarray(columns[spec["gen_col"]], dtype=float)
+        ok = ~np.isnat(timestamps) & ~np.isnan(value) & ~np.isnan(gen)
+        order = np.argsort(timestamps[ok], kind="stable")
+        ts, value, gen = timestamps[ok][order], value[ok][order], gen[ok][order]
+        if ts.size == 0:
+            continue
+        labels = level_labels(gen, spec["unit"])
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        ends = np.r_[starts[1:], labels.size]
+        segments = []
+        for run, (lo, hi) in enumerate(zip(starts.tolist(), ends.tolist()), start=1):
+            finite = np.isfinite(value[lo:hi])
+            if finite.any():
+                segments.append((f"corrida_{run}", str(labels[lo]), ts[lo:hi][finite], value[lo:hi][finite]))
+        for run, level, pool_ts, pool_values in sorted(segments, key=lambda s: s[:2]):
+            pools.append({
+                "pollutant": spec["pollutant"], "run": run, "level": level,
+                "timestamps": pool_ts, "values": pool_values,
+                "source_column": spec["ref_col"], "generator_column": spec["gen_col"],
+            })
+    return pools
+
+
+def pool_key(pool):
+    """Clave del flujo aleatorio de un pool ("co|corrida_2|6.3-umol/mol")."""
+    return f"{pool['pollutant']}|{pool['run']}|{pool['level']}"
+
+
+def draw_pool(pool, n_datasets, seed=DEFAULT_SEED, minutes=SIMULATED_MINUTES):
+    """Indices remuestreados (n_datasets x minutes) de un pool, un solo draw."""
+    rng = stream_rng(seed, pool_key(pool))
+    return rng.integers(0, pool["values"].size, size=(n_datasets, minutes))
+
+
+def bootstrap_pools(n_datasets, seed, pools):
+    """Datasets horarios y minutos simulados de cada pool (lista por pool;
+    funcion de modulo para helpers.map_combos)."""
+    results = []
+    for pool in pools:
+        idx = draw_pool(pool, n_datasets, seed)
+        simulated = pool["values"][idx]
+        results.append({
+            "pool": {k: pool[k] for k in ("pollutant", "run", "level", "source_column", "generator_column")},
+            "minute_pool_n": int(pool["values"].size),
+            "hourly": round_r(mean_rows_r(simulated)),
+            "minute_values": simulated,
+            "minute_timestamps": pool["timestamps"][idx],
+        })
+    return results
+
+
+def make_assignment(n_datasets):
+    """Filas (study_type, dataset_id, replicate, sample_id) como make_assignment de R."""
+    needed = max(reps * samples for reps, samples in STUDY_LAYOUT.values())
+    if n_datasets < needed:
+        raise ValueError(f"At least {needed} datasets are required.")
+    rows = []
+    for study_type, (reps, samples) in STUDY_LAYOUT.items():
+        for d in range(reps * samples):
+            rows.append({
+                "study_type": study_type, "dataset_id": d + 1,
+                "replicate": d // samples + 1, "sample_id": d % samples + 1,
+            })
+    return rows
+
+
+def hourly_rows(results):
+    """Filas HOURLY_FIELDS (bootstrap_hourly_datasets.csv)."""
+    rows = []
+    for res in results:
+        p = res["pool"]
+        for d, value in enumerate(res["hourly"].tolist(), start=1):
+            rows.append({
+                "pollutant": p["pollutant"], "run": p["run"], "level": p["level"],
+                "dataset_id": d, "value": value, "minute_pool_n": res["minute_pool_n"],
+            })
+    return rows
+
+
+def minute_rows(results):
+    """Filas MINUTE_FIELDS (bootstrap_minute_simulations.csv)."""
+    rows = []
+    for res in results:
+        p = res["pool"]
+        stamps = np.char.replace(
+            np.datetime_as_string(res["minute_timestamps"].astype("datetime64[s]"), unit="s"), "T", " "
+        ).tolist()
+        for d, (values, times) in enumerate(zip(res["minute_values"].tolist(), stamps), start=1):
+            for m, (value, stamp) in enumerate(zip(values, times), start=1):
+                rows.append({
+                    "pollutant": p["pollutant"], "run": p["run"], "level": p["level"],
+                    "dataset_id": d, "simulated_minute": m, "value": value,
+                    "source_timestamp": stamp, "source_column": p["source_column"],
+                    "generator_column": p["generator_column"],
+                })
+    return rows
+
+
+def register_rows(hourly, assignment, input_path, seed):
+    """Registro (REGISTER_FIELDS) y tablas por estudio (STUDY_FIELDS),
+    ordenados como en R."""
+    by_dataset = {}
+    for row in hourly:
+        by_dataset.setdefault(row["dataset_id"], []).append(row)
+    register = []
+    for a in assignment:
+        for row in by_dataset.get(a["dataset_id"], []):
+            register.append({
+                "study_type": a["study_type"], "pollutant": row["pollutant"],
+                "run": row["run"], "level": row["level"], "replicate": a["replicate"],
+                "sample_id": a["sample_id"], "dataset_id": a["dataset_id"],
+                "value": row["value"], "minute_pool_n": row["minute_pool_n"],
+                "simulated_minutes_n": SIMULATED_MINUTES, "seed": seed,
+                "input_path": input_path,
+            })
+    register.sort(key=lambda r: (r["study_type"], r["pollutant"], r["run"], r["level"],
+                                 r["replicate"], r["sample_id"]))
+    studies = {
+        study: [{k: r[k] for k in STUDY_FIELDS} for r in register if r["study_type"] == study]
+        for study in STUDY_LAYOUT
+    }
+    return register, studies
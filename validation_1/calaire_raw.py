@@ -0,0 +1,363 @@
+"""
+Lectura y limpieza de archivos crudos CALAIRE por minuto (Python).
+
+Equivalente de R/preprocessing/read_calaire_raw.R y clean_calaire_raw.R:
+
+    - read_calaire_raw(path): detecta el delimitador (';', ',', tab o
+      espacios) y la fila de unidades (segunda fila que no empieza con
+      fecha M/D/YY o M/D/YYYY); las celdas quedan como texto. Como
+      read.table de R (comment.char = "#", fill = TRUE), en las filas de
+      datos todo lo que sigue a un '#' fuera de comillas se descarta y
+      las celdas faltantes quedan vacias: una celda "#VALUE!" de Excel
+      deja en NA esa columna y todas las siguientes de la fila.
+    - clean_calaire_raw(raw): recorta celdas, vacios -> NA, coma decimal
+      -> punto, quita filas vacias, normaliza nombres de columna
+      (normalize_col_names), arma el timestamp y convierte las demas
+      columnas a float. Retorna el marco tipado (ColumnarTable) y el log
+      (check, status, message) con los mismos chequeos que R.
+
+Fecha y hora se convierten a datetime64[s] en una sola pasada vectorizada
+(parse_timestamps) en lugar de un strptime por fila. Se aceptan los
+formatos de R: "%m/%d/%Y %H:%M", "%m/%d/%y %H:%M" y sus variantes de 12
+horas "%I:%M:%S %p". El resultado es hora local (America/Bogota no tiene
+horario de verano), sin zona.
+"""
+
+import csv
+import io
+import re
+
+import numpy as np
+
+from data_store import ColumnarTable
+
+NA_TOKENS = ("", " ", "NA")
+DATE_PATTERN = re.compile(r"^[0-9]{1,2}/[0-9]{1,2}/([0-9]{2}|[0-9]{4})$")
+
+# Nombres estandar (mismo orden que .normalize_col_names de R: el ultimo
+# patron que coincide gana)
+COLUMN_PATTERNS = {
+    "date":              r"^[Dd]ate",
+    "time":              r"^[Tt]ime",
+    "co_tapi_ppm":       r"^[Cc][Oo]\.TAPI|^[Cc][Oo]-TAPI",
+    "co_gen_ppm":        r"^[Cc][Oo]\.ppm$|^[Cc][Oo]\.generado|^[Cc][Oo]\.gen$|^[Cc][Oo]_?gen$",
+    "co_calaire_ppm":    r"^[Cc][Oo]\.CALAIRE|^[Cc][Oo]_?ref$|^[Cc][Oo]\.ref$",
+    "co_part_p1":        r"^[Cc][Oo]_?p1$|^[Cc][Oo]\.p1$|^[Cc][Oo]_?part_?1$",
+    "co_invitado1_ppm":  r"^[Cc][Oo]\.\.Invitado|^[Cc][Oo]\.Invitado",
+    "so2_ppb":           r"^[Ss][Oo]2$",
+    "so2_gen_ppb":       r"^[Ss][Oo]2\.ppb$|^[Ss][Oo]2\.Generado|^[Ss][Oo]2\.gen$|^[Ss][Oo]2_?gen$",
+    "so2_calaire_ppb":   r"^[Ss][Oo]2\.CALAIRE|^[Ss][Oo]2_?ref$|^[Ss][Oo]2\.ref$",
+    "so2_part_p1":       r"^[Ss][Oo]2_?p1$|^[Ss][Oo]2\.p1$|^[Ss][Oo]2_?part_?1$",
+    "so2_invitado1_ppb": r"^[Ss][Oo]2\.\.Invitado|^[Ss][Oo]2\.Invitado",
+    "no_gen_ppb":        r"^[Nn][Oo]_?gen$|^[Nn][Oo]\.gen$",
+    "no_calaire_ppb":    r"^[Nn][Oo]_?ref$|^[Nn][Oo]\.ref$|^[Nn][Oo]\.CALAIRE",
+    "no_part_p1":        r"^[Nn][Oo]_?p1$|^[Nn][Oo]\.p1$|^[Nn][Oo]_?part_?1$",
+    "no2_gen_ppb":       r"^[Nn][Oo]2_?gen$|^[Nn][Oo]2\.gen$",
+    "no2_calaire_ppb":   r"^[Nn][Oo]2_?ref$|^[Nn][Oo]2\.ref$|^[Nn][Oo]2\.CALAIRE",
+    "no2_part_p1":       r"^[Nn][Oo]2_?p1$|^[Nn][Oo]2\.p1$|^[Nn][Oo]2_?part_?1$",
+    "nox_gen_ppb":       r"^[Nn]ox_?gen$|^[Nn]ox\.gen$|^[Nn][Oo]x_?gen$|^[Nn][Oo]x\.gen$",
+    "nox_calaire_ppb":   (r"^[Nn]ox_?ref$|^[Nn]ox\.ref$|^[Nn]ox\.CALAIRE|^[Nn][Oo]x_?ref$"
+                          r"|^[Nn][Oo]x\.ref$|^[Nn][Oo]x\.CALAIRE"),
+    "nox_part_p1":       (r"^[Nn]ox_?p1$|^[Nn]ox\.p1$|^[Nn]ox_?part_?1$|^[Nn][Oo]x_?p1$"
+                          r"|^[Nn][Oo]x\.p1$|^[Nn][Oo]x_?part_?1$"),
+    "o3_gen_ppb":        r"^[Oo]3_?gen$|^[Oo]3\.gen$",
+    "o3_calaire_ppb":    r"^[Oo]3_?ref$|^[Oo]3\.ref$|^[Oo]3\.CALAIRE",
+    "o3_part_p1":        r"^[Oo]3_?p1$|^[Oo]3\.p1$|^[Oo]3_?part_?1$",
+}
+PARTICIPANT_POLLUTANTS = ("co", "so2", "no", "no2", "nox", "o3")
+RESERVED_LABELS = {
+    "gen", "generado", "generator", "ref", "referencia", "calaire",
+    "tapi", "ppm", "ppb", "nmol", "umol",
+}
+
+
+# ---------------------------------------------------------------------------
+# Nombres de columna
+# ---------------------------------------------------------------------------
+
+def make_names(names):
+    """Equivalente de make.names(trimws(x), unique = TRUE) de R."""
+    out = []
+    for name in names:
+        name = re.sub(r"[^A-Za-z0-9._]", ".", name.strip())
+        if not re.match(r"^([A-Za-z]|\.(?![0-9]))", name):
+            name = "X" + name
+        out.append(name)
+    seen = {}
+    unique = []
+    for name in out:
+        if name in seen:
+            seen[name] += 1
+            candidate = f"{name}.{seen[name]}"
+            while candidate in seen:
+                seen[name] += 1
+                candidate = f"{name}.{seen[name]}"
+            seen[candidate] = 0
+            unique.append(candidate)
+        else:
+            seen[name] = 0
+            unique.append(name)
+    return unique
+
+
+def _label_token(label):
+    token = re.sub(r"[^0-9A-Za-z]+", "_", label.strip().lower())
+    return token.strip("_")
+
+
+def normalize_col_names(raw_names):
+    """Nombres estandar de columna (port de .normalize_col_names de R)."""
+    names = make_names(raw_names)
+    result = list(names)
+    for target, pattern in COLUMN_PATTERNS.items():
+        regex = re.compile(pattern)
+        for j, name in enumerate(names):
+            if regex.search(name):
+                result[j] = target
+    for pollutant in PARTICIPANT_POLLUTANTS:
+        regex = re.compile(
+            rf"^{pollutant}[._]?(p[0-9]+|part[._]?[0-9]+|[A-Za-z][A-Za-z0-9]*)$", re.IGNORECASE
+        )
+        for j, name in enumerate(names):
+            match = regex.match(name)
+            if not match:
+                continue
+            label = re.sub(r"^part[._]?", "p", match.group(1), flags=re.IGNORECASE)
+            label = _label_token(label)
+            if label not in RESERVED_LABELS:
+                result[j] = f"{pollutant}_part_{label}"
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Lectura
+# ---------------------------------------------------------------------------
+
+def detect_delimiter(line):
+    """';', ',', tab o None (espacios), con el mismo criterio que R (> 2 campos)."""
+    for delimiter in (";", ",", "\t"):
+        if len(line.split(delimiter)) > 2:
+            return delimiter
+    return None
+
+
+def strip_comment(line, comment="#"):
+    """Linea sin el comentario (desde el primer '#' fuera de comillas)."""
+    if comment not in line:
+        return line
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == comment and not quoted:
+            return line[:i]
+    return line
+
+
+def _split(lines, delimiter):
+    if delimiter is None:
+        return [line.split() for line in lines]
+    return list(csv.reader(io.StringIO("\n".join(lines)), delimiter=delimiter))
+
+
+def read_calaire_raw(path):
+    """Leer un archivo crudo CALAIRE. Retorna dict con data (columnas de
+    texto por nombre make.names), header, units, n_rows, delimiter y path."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        lines = [line.rstrip("\r\n") for line in f]
+    lines = [line for line in lines if line.strip()]
+    if len(lines) < 2:
+        raise ValueError(f"El archivo tiene menos de 2 lineas no vacias: {path}")
+
+    delimiter = detect_delimiter(lines[0])
+    header_raw, second_raw = _split(lines[:2], delimiter)
+    header = [h.strip() for h in header_raw]
+    has_units_row = not DATE_PATTERN.match(second_raw[0].strip() if second_raw else "")
+    units = [u.strip() for u in second_raw] if has_units_row else [None] * len(header)
+    data_lines = [strip_comment(line) for line in (lines[2:] if has_units_row else lines[1:])]
+    records = _split([line for line in data_lines if line.strip()], delimiter)
+
+    n_cols = len(header)
+    padded = [
+        (rec + [""] * (n_cols - len(rec)))[:n_cols] for rec in records
+    ]
+    matrix = np.array(padded, dtype=str).reshape(len(padded), n_cols)
+    names = make_names(header_raw)
+    return {
+        "data": {name: matrix[:, j] for j, name in enumerate(names)},
+        "header": header,
+        "units": dict(zip(header, (units + [None] * n_cols)[:n_cols])),
+        "n_rows": len(padded),
+        "delimiter": delimiter or "whitespace",
+        "has_units_row": has_units_row,
+        "path": path,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Timestamps vectorizados
+# ---------------------------------------------------------------------------
+
+def _digits(arr, min_len=1, max_len=2):
+    """Enteros de un arreglo de texto; ok=False si no son digitos de largo valido."""
+    lengths = np.char.str_len(arr)
+    ok = np.char.isdigit(arr) & (lengths >= min_len) & (lengths <= max_len)
+    return np.where(ok, arr, "0").astype(np.int64), ok
+
+
+def parse_timestamps(date_col, time_col):
+    """datetime64[s] a partir de columnas de fecha (M/D/YY o M/D/YYYY) y hora
+    (H:MM[:SS] en 24 h o HH:MM:SS AM/PM), todo con operaciones de arreglo.
+    Las celdas no interpretables quedan NaT; "24:00" pasa al dia siguiente."""
+    date_col = np.char.strip(np.asarray(date_col, dtype=str))
+    time_col = np.char.strip(np.asarray(time_col, dtype=str))
+
+    month_s, _, rest = np.moveaxis(np.char.partition(date_col, "/"), -1, 0)
+    day_s, _, year_s = np.moveaxis(np.char.partition(rest, "/"), -1, 0)
+    month, ok_month = _digits(month_s)
+    day, ok_day = _digits(day_s)
+    year, ok_year = _digits(year_s, 2, 4)
+    short_year = np.char.str_len(year_s) == 2
+    ok_year &= np.char.str_len(year_s) != 3
+    # %y de R: 00-68 -> 20xx, 69-99 -> 19xx
+    year = np.where(short_year, np.where(year <= 68, 2000 + year, 1900 + year), year)
+
+    upper = np.char.upper(time_col)
+    is_pm = np.char.endswith(upper, "PM")
+    has_ampm = is_pm | np.char.endswith(upper, "AM")
+    clock = np.where(has_ampm, np.char.strip(np.char.rstrip(upper, "APM")), upper)
+    hour_s, _, rest = np.moveaxis(np.char.partition(clock, ":"), -1, 0)
+    minute_s, _, second_s = np.moveaxis(np.char.partition(rest, ":"), -1, 0)
+    hour, ok_hour = _digits(hour_s)
+    minute, ok_minute = _digits(minute_s, 2, 2)
+    second, ok_second = _digits(second_s, 2, 2)
+    # 24 h ("%H:%M"): los segundos sobrantes se ignoran; 12 h exige segundos
+    second = np.where(has_ampm, second, 0)
+    ok_second = np.where(has_ampm, ok_second, True)
+    # strptime de R acepta "24:00" (ISO 8601) como medianoche del dia siguiente
+    ok_hour &= np.where(
+        has_ampm, (hour >= 1) & (hour <= 12), (hour <= 23) | ((hour == 24) & (minute == 0))
+    )
+    hour = np.where(has_ampm, hour % 12 + 12 * is_pm, hour)
+
+    ok = (
+        ok_month & ok_day & ok_year & ok_hour & ok_minute & ok_second
+        & (month >= 1) & (month <= 12) & (day >= 1) & (minute <= 59) & (second <= 61)
+    )
+    month_start = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+    day_value = month_start.astype("datetime64[D]") + (day - 1)
+    ok &= day_value.astype("datetime64[M]") == month_start  # dia dentro del mes
+    seconds = hour * 3600 + minute * 60 + second
+    ts = day_value.astype("datetime64[s]") + seconds.astype("timedelta64[s]")
+    return np.where(ok, ts, np.datetime64("NaT", "s"))
+
+
+# ---------------------------------------------------------------------------
+# Limpieza
+# ---------------------------------------------------------------------------
+
+def _parse_floats(arr):
+    """float64 de un arreglo de texto (NA -> NaN). Retorna (valores, n_malos)."""
+    na = np.isin(arr, NA_TOKENS)
+    text = np.where(na, "nan", arr)
+    try:
+        return text.astype(float), 0
+    except ValueError:
+        out = np.full(arr.shape, np.nan)
+        bad = 0
+        for i, s in enumerate(text.tolist()):
+            try:
+                out[i] = float(s)
+            except ValueError:
+                bad += 1
+        return out, bad
+
+
+def clean_calaire_raw(raw):
+    """Limpiar la salida de read_calaire_raw. Retorna {"table": ColumnarTable
+    (timestamp datetime64[s] + columnas numericas float), "log": lista de
+    dicts check/status/message}."""
+    log = []
+
+    def entry(check, status, message):
+        log.append({"check": check, "status": status, "message": message})
+
+    names = list(raw["data"].keys())
+    norm = normalize_col_names(raw["header"])
+    cells = {name: np.char.strip(raw["data"][name]) for name in names}
+    is_na = {name: np.isin(cells[name], NA_TOKENS) for name in names}
+
+    # Coma decimal -> punto en columnas numericas
+    for name, target in zip(names, norm):
+        if target in ("date", "time"):
+            continue
+        converted = np.char.replace(cells[name], ",", ".")
+        ambiguous = [
+            bool(re.search(r"[0-9],[0-9]{3}[.]|[0-9][.][0-9]{3},", s)) for s in converted.tolist()
+        ]
+        if any(ambiguous):
+            entry("decimal_format", "WARN", f"Ambiguous decimal format in column '{name}'")
+        changed = ~is_na[name] & (converted != cells[name])
+        if changed.any():
+            entry("comma_decimal", "PASS", f"Converted {int(changed.sum())} comma decimals in '{name}'")
+            cells[name] = converted
+
+    # Filas completamente vacias
+    all_na = np.logical_and.reduce([is_na[name] for name in names]) if names else np.zeros(0, bool)
+    if all_na.any():
+        entry("empty_rows", "PASS", f"Removed {int(all_na.sum())} completely empty rows")
+    keep = ~all_na
+    cells = {name: col[keep] for name, col in cells.items()}
+    is_na = {name: col[keep] for name, col in is_na.items()}
+    n_rows = int(keep.sum())
+
+    if "date" not in norm:
+        raise ValueError("No date column")
+    if "time" not in norm:
+        raise ValueError("No time column")
+    # Con nombres repetidos, R toma la primera columna
+    date_col = cells[names[norm.index("date")]]
+    time_col = cells[names[norm.index("time")]]
+    ts = parse_timestamps(date_col, time_col)
+
+    n_failed = int(np.isnat(ts).sum())
+    if n_failed > 0:
+        entry("timestamp_parse", "WARN", f"{n_failed} timestamps failed to parse")
+    else:
+        entry("timestamp_parse", "PASS", f"All {n_rows} timestamps parsed")
+
+    valid_ts = ts[~np.isnat(ts)]
+    if valid_ts.size > 1 and (np.diff(valid_ts) < np.timedelta64(0, "s")).any():
+        entry("chronological_order", "WARN", "Timestamps not in chronological order")
+    else:
+        entry("chronological_order", "PASS", "Timestamps in chronological order")
+
+    n_dup = valid_ts.size - np.unique(valid_ts).size
+    if n_dup > 0:
+        entry("duplicate_timestamps", "WARN", f"{n_dup} duplicate timestamps")
+    else:
+        entry("duplicate_timestamps", "PASS", "No duplicate timestamps")
+
+    if valid_ts.size > 1:
+        diffs = np.diff(valid_ts).astype(np.int64) / 60.0
+        n_gaps = int((np.round(diffs) > 1).sum())
+        if n_gaps > 0:
+            entry("minute_gaps", "WARN", f"{n_gaps} gaps > 1 min detected")
+        else:
+            entry("minute_gaps", "PASS", "No minute gaps")
+
+    columns = {}
+    na_counts = []
+    for name, target in zip(names, norm):
+        if target in ("date", "time"):
+            columns[target] = cells[name]
+            continue
+        values, n_bad = _parse_floats(cells[name])
+        if n_bad > 0:
+            entry("non_parseable", "WARN", f"{n_bad} non-parseable values in ' {target} '")
+        columns[target] = values
+        na_counts.append(f"{target}:{int(np.isnan(values).sum())}")
+    columns["timestamp"] = ts
+    entry("na_counts", "PASS", "; ".join(na_counts))
+
+    return {"table": ColumnarTable(raw["path"], columns), "log": log}
@@ -0,0 +1,144 @@
+"""
+Salidas binarias columnares (.npz) para las etapas de validacion (Python).
+
+Cada tabla se guarda como columnas NumPy tipadas (float64, int64, bool o
+texto) en un .npz junto al CSV equivalente (`stage_02_homogeneity_py.csv`
+-> `stage_02_homogeneity_py.npz`). Los floats se guardan en binario, sin
+pasar por repr/fmt_float/float(), por lo que no hay perdida de precision.
+El CSV se sigue escribiendo como exportacion.
+
+`load_rows(csv_path)` prefiere el .npz hermano si existe y no es mas
+antiguo que el CSV; si no, lee el CSV como texto (comportamiento previo).
+Los CSV de R pueden convertirse una vez con:
+
+    python3 validation_1/columnar_io.py outputs/*_r.csv
+"""
+
+import csv
+import os
+import sys
+
+import numpy as np
+
+NPZ_SUFFIX = ".npz"
+FIELDS_KEY = "__fields__"
+NA_STRINGS = {"", "NA", "NaN", "nan"}
+
+
+def npz_path(csv_path):
+    """Ruta .npz hermana de un CSV."""
+    return os.path.splitext(csv_path)[0] + NPZ_SUFFIX
+
+
+def _typed_column(values):
+    """Columna NumPy tipada a partir de valores Python de una etapa."""
+    if values and all(isinstance(v, (bool, np.bool_)) for v in values):
+        return np.array(values, dtype=bool)
+    if values and all(
+        isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_))
+        for v in values
+    ):
+        return np.array(values, dtype=np.int64)
+    if values and all(
+        v is None or (isinstance(v, (int, float, np.number)) and not isinstance(v, (bool, np.bool_)))
+        for v in values
+    ):
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+    return np.array(["" if v is None else str(v) for v in values], dtype=str)
+
+
+def _parsed_column(raw):
+    """Columna tipada a partir de texto CSV (int, float con NA, o texto)."""
+    present = [s.strip() for s in raw if s.strip() not in NA_STRINGS]
+    if not present:
+        return np.array(raw, dtype=str)
+    try:
+        if len(present) == len(raw):
+            return np.array([int(s) for s in present], dtype=np.int64)
+    except ValueError:
+        pass
+    try:
+        return np.array(
+            [np.nan if s.strip() in NA_STRINGS else float(s) for s in raw], dtype=float
+        )
+    except ValueError:
+        return np.array(raw, dtype=str)
+
+
+def write_npz(path, rows, fieldnames=None):
+    """Guardar una lista de dicts como columnas tipadas en `path` (.npz)."""
+    rows = list(rows)
+    if fieldnames is None:
+        fieldnames = list(rows[0].keys()) if rows else []
+    columns = {name: _typed_column([row.get(name) for row in rows]) for name in fieldnames}
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        np.savez(f, **{FIELDS_KEY: np.array(fieldnames, dtype=str)}, **columns)
+    return path
+
+
+def write_columns_npz(path, columns):
+    """Guardar columnas ya tipadas (p.ej. datetime64) sin convertirlas."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        np.savez(f, **{FIELDS_KEY: np.array(list(columns), dtype=str)}, **columns)
+    return path
+
+
+def read_npz(path):
+    """Leer un .npz de etapa. Retorna (fieldnames, dict nombre -> ndarray)."""
+    with np.load(path, allow_pickle=False) as data:
+        fieldnames = data[FIELDS_KEY].tolist()
+        return fieldnames, {name: data[name] for name in fieldnames}
+
+
+def columns_to_rows(fieldnames, columns):
+    """Convertir columnas a lista de dicts con escalares Python."""
+    lists = [columns[name].tolist() for name in fieldnames]
+    return [dict(zip(fieldnames, values)) for values in zip(*lists)]
+
+
+def csv_to_npz(csv_path, out_path=None):
+    """Convertir un CSV de texto (p.ej. salida de R) a .npz tipado."""
+    with open(csv_path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        raw = [[] for _ in header]
+        for record in reader:
+            for j in range(len(header)):
+                raw[j].append(record[j] if j < len(record) else "")
+    out_path = out_path or npz_path(csv_path)
+    with open(out_path, "wb") as f:
+        np.savez(
+            f,
+            **{FIELDS_KEY: np.array(header, dtype=str)},
+            **{name: _parsed_column(raw[j]) for j, name in enumerate(header)},
+        )
+    return out_path
+
+
+def has_fresh_npz(csv_path):
+    """True si existe el .npz hermano y no es mas antiguo que el CSV."""
+    binary = npz_path(csv_path)
+    if not os.path.exists(binary):
+        return False
+    return not os.path.exists(csv_path) or os.path.getmtime(binary) >= os.path.getmtime(csv_path)
+
+
+def table_exists(csv_path):
+    """True si la tabla existe como CSV o como .npz."""
+    return os.path.exists(csv_path) or os.path.exists(npz_path(csv_path))
+
+
+def load_rows(csv_path):
+    """Filas de una tabla de etapa: desde el .npz tipado si esta vigente,
+    si no desde el CSV (valores como texto)."""
+    if has_fresh_npz(csv_path):
+        return columns_to_rows(*read_npz(npz_path(csv_path)))
+    with open(csv_path, "r", newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        print(f"  NPZ escrito: {csv_to_npz(arg)}")
@@ -0,0 +1,188 @@
+"""
+Motor de comparacion tripartita R / Python / app (Python).
+
+Las tablas de resultados se cargan en indices con clave (tupla de
+columnas -> posicion) y columnas float tipadas. La union con las filas
+Python se resuelve con una busqueda por clave (no un recorrido de la
+tabla por fila) y las diferencias y estados se calculan en una sola
+pasada NumPy (helpers.compare_values_table, misma semantica que
+helpers.compare_values).
+
+Uso tipico (Etapas 2 y 3, tablas anchas por combo):
+    rows, processed, discrepancies, edge_cases = compare_wide(
+        py_results, r_rows, combos, metrics, metric_labels,
+        "stage_02_homogeneity", "homogeneity", TOL_DEFAULT)
+"""
+
+import math
+
+import numpy as np
+
+from helpers import (
+    STATUS_CODE_FAIL, STATUS_CODE_PASS, canonical_table, make_combo_id,
+)
+
+NA_STRINGS = {"", "NA", "NaN", "nan"}
+
+
+def to_float(value):
+    """Valor de tabla (texto de CSV o ya tipado) a float; NA/vacio -> nan."""
+    if value is None:
+        return float("nan")
+    if isinstance(value, str):
+        value = value.strip()
+        if value in NA_STRINGS:
+            return float("nan")
+        try:
+            return float(value)
+        except ValueError:
+            return float("nan")
+    return float(value)
+
+
+class KeyedIndex:
+    """Tabla indexada por clave con columnas numericas tipadas.
+
+    key_fields: columnas que forman la clave (tupla). value_fields: columnas
+    convertidas a float64. Si una clave se repite gana la ultima fila (igual
+    que el dict que reemplaza).
+    """
+
+    def __init__(self, rows, key_fields, value_fields=()):
+        self.rows = list(rows)
+        self.key_fields = tuple(key_fields)
+        self.positions = {}
+        for i, row in enumerate(self.rows):
+            self.positions[tuple(row[f] for f in self.key_fields)] = i
+        self.columns = {
+            name: np.array([to_float(row.get(name)) for row in self.rows], dtype=float)
+            for name in value_fields
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.positions
+
+    def get(self, key, default=None):
+        """Fila original (dict) de una clave."""
+        pos = self.positions.get(key)
+        return default if pos is None else self.rows[pos]
+
+    def take(self, keys):
+        """Posiciones de las claves (-1 si no existen)."""
+        get = self.positions.get
+        return np.fromiter((get(k, -1) for k in keys), dtype=np.int64, count=len(keys))
+
+    def values(self, name, keys):
+        """Columna `name` alineada con `keys` (nan si la clave no existe)."""
+        pos = self.take(keys)
+        found = pos >= 0
+        out = np.full(len(keys), np.nan)
+        out[found] = self.columns[name][pos[found]]
+        return out
+
+    def values_at(self, keys, fields):
+        """Valores de una tabla ancha: fila `keys[i]`, columna `fields[i]`."""
+        pos = self.take(keys)
+        fields = np.asarray(fields, dtype=object)
+        out = np.full(len(keys), np.nan)
+        for name in dict.fromkeys(fields.tolist()):
+            sel = (fields == name) & (pos >= 0)
+            out[sel] = self.columns[name][pos[sel]]
+        return out
+
+
+def compare_wide(py_results, r_rows, combos, metrics, metric_labels, stage, section,
+                 tolerance, int_metrics=("g", "m")):
+    """Comparacion de tablas anchas por combo (una fila por combo_id).
+
+    Indexa Python y R por combo_id, arma el producto combo x metrica de los
+    combos presentes en ambas fuentes y sin edge case, y lo compara en una
+    sola pasada con app = R. Las metricas de `int_metrics` se truncan a
+    entero y usan tolerancia 0.5.
+    Retorna (filas canonicas, combos procesados, discrepancias, edge cases).
+    """
+    py_index = KeyedIndex(py_results, ("combo_id",))
+    r_index = KeyedIndex(r_rows, ("combo_id",), metrics)
+
+    processed, discrepancies, edge_cases = [], [], []
+    meta = {"combo_id": [], "pollutant": [], "level": [], "metric": []}
+    keys, fields, py_vals, tols = [], [], [], []
+    for combo in combos:
+        combo_id = make_combo_id(combo["pollutant"], combo["level"])
+        py_row = py_index.get((combo_id,))
+        if py_row is None or (combo_id,) not in r_index:
+            discrepancies.append(f"{combo_id}: datos faltantes en una fuente")
+            continue
+        if py_row.get("edge_case", False):
+            edge_cases.append(f"{combo_id}: edge case (g o m insuficiente)")
+            continue
+        for metric in metrics:
+            py_val = py_row[metric]
+            if isinstance(py_val, bool):
+                py_val = float(py_val)
+            meta["combo_id"].append(combo_id)
+            meta["pollutant"].append(combo["pollutant"])
+            meta["level"].append(combo["level"])
+            meta["metric"].append(metric_labels.get(metric, metric))
+            keys.append((combo_id,))
+            fields.append(metric)
+            py_vals.append(py_val)
+            tols.append(0.5 if metric in int_metrics else tolerance)
+        processed.append(combo_id)
+
+    r_vals = r_index.values_at(keys, fields)
+    as_int = np.isin(np.asarray(fields, dtype=object), list(int_metrics))
+    if as_int.any():
+        # Enteros exactos: truncar hacia cero (int()) en R y Python
+        r_vals[as_int] = np.trunc(r_vals[as_int]) + 0.0
+        py_float = np.asarray(py_vals, dtype=float)
+        for i in np.nonzero(as_int)[0]:
+            py_vals[i] = float(np.trunc(py_float[i]) + 0.0)
+
+    meta.update(stage=stage, section=section, participant_id="ALL")
+    rows = canonical_table(meta, app=r_vals, r=r_vals, python=py_vals, tol=tols)
+    return rows, processed, discrepancies, edge_cases
+
+
+def round_half_even(values, decimals):
+    """Redondeo igual a round(x, decimals) de Python sobre un arreglo.
+
+    np.round escala y redondea, y puede diferir de round() en valores casi
+    equidistantes; esos pocos casos se recalculan con round().
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.round(values, decimals)
+    scaled = values * 10.0 ** decimals
+    with np.errstate(invalid="ignore"):
+        slack = np.maximum(1e-6, np.abs(scaled) * 1e-12)
+        near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) < slack
+    for i in np.nonzero(near_tie & np.isfinite(values))[0]:
+        out[i] = round(float(values[i]), decimals)
+    return out
+
+
+def compare_rounded(r, python, decimals, tol):
+    """Comparacion R vs Python tras redondear (regla de la Etapa 5).
+
+    Retorna (status_code, diff): PASS si ambos son no finitos; FAIL si solo
+    uno es finito; si ambos son finitos diff = round(r) - round(py) y PASS
+    si |diff| <= tol. diff es nan cuando no se calcula.
+    """
+    r = np.asarray(r, dtype=float)
+    python = np.asarray(python, dtype=float)
+    r_fin = np.isfinite(r)
+    py_fin = np.isfinite(python)
+    both = r_fin & py_fin
+    diff = np.full(r.shape, np.nan)
+    diff[both] = round_half_even(r[both], decimals) - round_half_even(python[both], decimals)
+    with np.errstate(invalid="ignore"):
+        passed = (both & (np.abs(diff) <= tol)) | (~r_fin & ~py_fin)
+    return np.where(passed, STATUS_CODE_PASS, STATUS_CODE_FAIL).astype(np.int8), diff
+
+
+def fmt_diff(diff):
+    """repr() de una diferencia calculada; "nan" si no se calculo."""
+    return repr(diff) if math.isfinite(diff) else "nan"
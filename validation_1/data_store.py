@@ -0,0 +1,342 @@
+"""
+Almacen columnar compartido por las etapas de validacion (Python).
+
+Cada CSV de entrada se lee una sola vez y se guarda como columnas NumPy
+tipadas. Las filas quedan indexadas por (pollutant, level) para que las
+etapas filtren por combo sin volver a recorrer el archivo.
+
+Las columnas clave (KEY_COLS) se codifican como enteros con un
+diccionario compartido por todas las tablas del almacen (KeyDictionary):
+agrupar, unir y buscar se hace sobre codigos (argsort / comparacion de
+enteros) y el texto solo se reconstruye para las salidas. Al codificar,
+las etiquetas se normalizan: el signo micro U+03BC (μ, data/*.csv) pasa
+a U+00B5 (µ, data_use_cases), de modo que "6-μmol/mol" y "6-µmol/mol"
+son el mismo nivel en vez de dos combos distintos.
+
+Uso:
+    from data_store import load_data_store
+    store = load_data_store(summary_path="../data/for_validation/summary_n4.csv")
+    values = store.participant_values("o3", "80-nmol/mol")["mean_value"]
+"""
+
+import csv
+import hashlib
+import os
+
+import numpy as np
+
+DATA_HOMOGENEITY = "../data/for_validation/homogeneity_n4.csv"
+DATA_STABILITY = "../data/for_validation/stability_n4.csv"
+DATA_SUMMARY = "../data/for_validation/summary_n4.csv"
+DATA_PT_DATA = "../data/pt_data_n13.csv"
+
+# Columnas con tipo conocido; el resto se guarda como texto
+FLOAT_COLS = {"value", "mean_value", "sd_value", "u_i"}
+INT_COLS = {"replicate", "sample_id"}
+NA_STRINGS = {"", "NA", "NaN", "nan"}
+
+# Columnas clave codificadas como enteros (KeyDictionary)
+KEY_COLS = ("pollutant", "level", "run", "participant_id")
+MICRO_SIGNS = {"\u03bc": "\u00b5"}
+
+
+def normalize_label(label):
+    """Etiqueta clave normalizada (μ U+03BC -> µ U+00B5)."""
+    label = str(label)
+    for src, dst in MICRO_SIGNS.items():
+        label = label.replace(src, dst)
+    return label
+
+
+def is_ref_participant(participant_id):
+    """True si el participant_id es la referencia ("ref", sin distinguir
+    mayusculas); regla unica para excluirla de los participantes."""
+    return str(participant_id).strip().lower() == "ref"
+
+
+def _parse_float(s):
+    s = s.strip()
+    if s in NA_STRINGS:
+        return float("nan")
+    try:
+        return float(s)
+    except ValueError:
+        return float("nan")
+
+
+def _to_column(name, raw):
+    """Convertir una columna de texto a arreglo NumPy tipado."""
+    if name in FLOAT_COLS:
+        return np.array([_parse_float(s) for s in raw], dtype=float)
+    if name in INT_COLS:
+        try:
+            return np.array([int(s) for s in raw], dtype=np.int64)
+        except ValueError:
+            pass
+    return np.array(raw, dtype=object)
+
+
+class KeyDictionary:
+    """Diccionario de codigos enteros por columna clave.
+
+    Cada etiqueta (normalizada) recibe el siguiente codigo libre de su
+    columna en orden de primera aparicion; los codigos no cambian al
+    agregar tablas, por lo que son comparables entre tablas del almacen.
+    """
+
+    def __init__(self):
+        self.labels = {name: [] for name in KEY_COLS}
+        self.index = {name: {} for name in KEY_COLS}
+
+    def encode(self, name, values):
+        """Codigos (int32) de una columna de etiquetas; agrega las nuevas."""
+        labels, index = self.labels[name], self.index[name]
+        uniq, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        first = np.full(uniq.size, inverse.size, dtype=np.int64)
+        np.minimum.at(first, inverse, np.arange(inverse.size))
+        codes = np.empty(uniq.size, dtype=np.int32)
+        for j in np.argsort(first, kind="stable").tolist():
+            label = normalize_label(uniq[j])
+            if label not in index:
+                index[label] = len(labels)
+                labels.append(label)
+            codes[j] = index[label]
+        return codes[inverse.reshape(-1)]
+
+    def code(self, name, label):
+        """Codigo de una etiqueta (-1 si no aparece en ninguna tabla)."""
+        return self.index[name].get(normalize_label(label), -1)
+
+    def decode(self, name, codes):
+        """Etiquetas (arreglo object) de un arreglo de codigos."""
+        return np.array(self.labels[name], dtype=object)[np.asarray(codes, dtype=np.int64)]
+
+
+def first_seen_groups(keys):
+    """Grupos de una clave entera en orden de primera aparicion.
+
+    Retorna (claves, lista de indices de fila por grupo, en orden de
+    archivo) con un argsort estable, sin recorrer filas en Python.
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    if keys.size == 0:
+        return keys, []
+    order = np.argsort(keys, kind="stable")
+    starts = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1]])
+    groups = np.split(order, starts[1:])
+    seen = np.argsort(order[starts], kind="stable")
+    return keys[order[starts]][seen], [groups[j] for j in seen.tolist()]
+
+
+class ColumnarTable:
+    """Tabla leida una sola vez: columnas NumPy + indice por (pollutant, level).
+
+    Las columnas de KEY_COLS presentes se guardan ademas como codigos en
+    `codes`; `columns[name]` conserva las etiquetas normalizadas.
+    """
+
+    def __init__(self, path, columns, keys=None):
+        self.path = path
+        self.keys = keys if keys is not None else KeyDictionary()
+        self.codes = {
+            name: self.keys.encode(name, columns[name])
+            for name in KEY_COLS if name in columns
+        }
+        self.columns = dict(columns)
+        for name, codes in self.codes.items():
+            self.columns[name] = self.keys.decode(name, codes)
+        self.n_rows = len(next(iter(columns.values()))) if columns else 0
+        self.groups = {}
+        if "pollutant" in self.codes and "level" in self.codes:
+            width = len(self.keys.labels["level"])
+            combo = self.codes["pollutant"].astype(np.int64) * width + self.codes["level"]
+            combo_keys, idx = first_seen_groups(combo)
+            self.groups = {
+                (int(k) // width, int(k) % width): rows
+                for k, rows in zip(combo_keys.tolist(), idx)
+            }
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def combo_code(self, pollutant, level):
+        """Par de codigos (pollutant, level) de un combo."""
+        return (self.keys.code("pollutant", pollutant), self.keys.code("level", level))
+
+    def rows(self, pollutant, level):
+        """Indices de fila (orden de archivo) para un combo."""
+        return self.groups.get(self.combo_code(pollutant, level), np.empty(0, dtype=np.int64))
+
+    def column(self, name, pollutant=None, level=None):
+        col = self.columns[name]
+        if pollutant is None:
+            return col
+        return col[self.rows(pollutant, level)]
+
+
+def read_columnar_csv(path, keys=None):
+    """Leer un CSV completo en una pasada y devolver ColumnarTable.
+
+    keys: KeyDictionary compartido (None = diccionario propio de la tabla).
+    """
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        raw = [[] for _ in header]
+        for record in reader:
+            for j in range(len(header)):
+                raw[j].append(record[j] if j < len(record) else "")
+    columns = {name: _to_column(name, raw[j]) for j, name in enumerate(header)}
+    return ColumnarTable(path, columns, keys)
+
+
+class DataStore:
+    """Entradas de una corrida de validacion, cada una parseada una vez."""
+
+    def __init__(self, homogeneity=None, stability=None, summary=None, pt_data=None):
+        self.tables = {
+            "homogeneity": homogeneity,
+            "stability": stability,
+            "summary": summary,
+            "pt_data": pt_data,
+        }
+
+    def table(self, name):
+        tbl = self.tables.get(name)
+        if tbl is None:
+            raise KeyError(f"Tabla '{name}' no cargada en el almacen")
+        return tbl
+
+    def has_table(self, name):
+        return self.tables.get(name) is not None
+
+    def all_values(self, name, pollutant, level):
+        """Todos los valores ('value') de homogeneidad/estabilidad de un combo."""
+        return self.table(name).column("value", pollutant, level)
+
+    def wide_matrix(self, name, pollutant, level):
+        """Pivotear a matriz g x m (sample_id x replicate).
+
+        Equivalente a pivot_table(index="sample_id", columns="replicate",
+        values="value") con agregacion por media y orden ascendente.
+        Retorna (sample_ids, matrix) con matrix como ndarray float.
+        """
+        tbl = self.table(name)
+        idx = tbl.rows(pollutant, level)
+        if idx.size == 0:
+            return [], np.empty((0, 0))
+        sample_ids, s_pos = np.unique(tbl.columns["sample_id"][idx], return_inverse=True)
+        replicates, r_pos = np.unique(tbl.columns["replicate"][idx], return_inverse=True)
+        values = tbl.columns["value"][idx]
+        finite = np.isfinite(values)
+        sums = np.zeros((len(sample_ids), len(replicates)))
+        counts = np.zeros((len(sample_ids), len(replicates)))
+        np.add.at(sums, (s_pos[finite], r_pos[finite]), values[finite])
+        np.add.at(counts, (s_pos[finite], r_pos[finite]), 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            matrix = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+        # pivot_table descarta filas/columnas sin ningun valor
+        keep_rows = counts.sum(axis=1) > 0
+        keep_cols = counts.sum(axis=0) > 0
+        matrix = matrix[keep_rows][:, keep_cols]
+        return [str(s) for s in sample_ids[keep_rows]], matrix
+
+    def participant_values(self, pollutant, level, exclude_ref=True):
+        """Filas de summary de un combo como columnas (orden de archivo)."""
+        tbl = self.table("summary")
+        idx = tbl.rows(pollutant, level)
+        if exclude_ref:
+            ref_codes = [
+                c for c, label in enumerate(tbl.keys.labels["participant_id"])
+                if is_ref_participant(label)
+            ]
+            idx = idx[~np.isin(tbl.codes["participant_id"][idx], ref_codes)]
+        return {name: col[idx] for name, col in tbl.columns.items()}
+
+    def combos(self, names=("homogeneity", "stability", "summary")):
+        """Combinaciones (pollutant, level, run) presentes en las tablas cargadas.
+
+        Orden de primera aparicion; `run` es la corrida del grupo (vacio si
+        ninguna tabla trae columna run o valor de corrida). Un mismo
+        (pollutant, level) con corridas distintas levanta ValueError: sus
+        filas se mezclarian en un solo combo.
+        """
+        found = {}
+        for name in names:
+            tbl = self.tables.get(name)
+            if tbl is None:
+                continue
+            labels = tbl.keys.labels
+            runs = tbl.codes.get("run")
+            for (p, l), idx in tbl.groups.items():
+                entry = found.setdefault((labels["pollutant"][p], labels["level"][l]), [])
+                if runs is not None:
+                    for r in first_seen_groups(runs[idx])[0].tolist():
+                        run = labels["run"][r]
+                        if run and run not in entry:
+                            entry.append(run)
+        mixed = [f"{p} {l}: {', '.join(runs)}" for (p, l), runs in found.items() if len(runs) > 1]
+        if mixed:
+            raise ValueError(
+                "Combos con mas de una corrida (las filas se mezclarian): " + "; ".join(mixed)
+            )
+        return [(p, l, runs[0] if runs else "") for (p, l), runs in found.items()]
+
+    def combo_digest(self, pollutant, level, names=("summary",)):
+        """SHA-256 de las filas de un combo en las tablas `names`.
+
+        Cambia solo si cambian (o se agregan) filas de ese combo, lo que
+        permite recalcular unicamente los combos afectados.
+        """
+        h = hashlib.sha256()
+        for name in names:
+            tbl = self.tables.get(name)
+            if tbl is None:
+                continue
+            idx = tbl.rows(pollutant, level)
+            h.update(name.encode("utf-8"))
+            for col in sorted(tbl.columns):
+                h.update(col.encode("utf-8"))
+                h.update(repr(tbl.columns[col][idx].tolist()).encode("utf-8"))
+        return h.hexdigest()
+
+    def u_map(self):
+        """Mapa (pollutant, level, participant_id) -> u_i desde pt_data."""
+        tbl = self.tables.get("pt_data")
+        if tbl is None:
+            return {}
+        return {
+            (p, l, pid): u
+            for p, l, pid, u in zip(
+                tbl.columns["pollutant"], tbl.columns["level"],
+                tbl.columns["participant_id"], tbl.columns["u_i"].tolist(),
+            )
+        }
+
+
+def load_data_store(
+    homogeneity_path=None,
+    stability_path=None,
+    summary_path=None,
+    pt_data_path=None,
+):
+    """Construir el almacen leyendo cada archivo indicado una sola vez.
+
+    Las rutas omitidas (None) no se cargan; pt_data es opcional y se omite
+    si el archivo no existe. Todas las tablas comparten un KeyDictionary.
+    """
+    keys = KeyDictionary()
+
+    def _read(path, optional=False):
+        if path is None:
+            return None
+        if optional and not os.path.exists(path):
+            return None
+        return read_columnar_csv(path, keys)
+
+    return DataStore(
+        homogeneity=_read(homogeneity_path),
+        stability=_read(stability_path),
+        summary=_read(summary_path),
+        pt_data=_read(pt_data_path, optional=True),
+    )
@@ -4,10 +4,14 @@
 # ===================================================================
 
 import csv
+import fnmatch
 import math
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-# --- Combos O3 × 3 niveles (validación primaria) ---
+import numpy as np
+
+# --- Combos O3 × 3 niveles (validación primaria; unicos con referencia R) ---
 COMBOS = [
     {"pollutant": "o3", "level": "0-nmol/mol",  "label": "O3_0"},
     {"pollutant": "o3", "level": "80-nmol/mol",  "label": "O3_80"},
@@ -19,6 +23,13 @@ STATUS_PASS  = "PASS"
 STATUS_FAIL  = "FAIL"
 STATUS_EDGE  = "EDGE_CASE"
 STATUS_KNOWN_DISC = "KNOWN_DISCREPANCY"
+STATUS_SKIPPED = "SKIPPED"
+
+# Codigos de estado para comparaciones por tabla (columna int8)
+STATUS_CODE_PASS = 0
+STATUS_CODE_FAIL = 1
+STATUS_CODE_EDGE = 2
+STATUS_LABELS = (STATUS_PASS, STATUS_FAIL, STATUS_EDGE)
 
 CANONICAL_COLS = [
     "combo_id", "pollutant", "level", "stage", "section",
@@ -27,12 +38,130 @@ CANONICAL_COLS = [
     "status", "tolerance", "notes",
 ]
 
+# --- Rutas de salida por corrida ---
+def resolve_path(path, directory=None):
+    """Reubicar una ruta de etapa dentro de `directory` (None = ruta por defecto)."""
+    if directory is None:
+        return path
+    return os.path.join(directory, os.path.basename(path))
+
 # --- IDs de combo ---
 def make_combo_id(pollutant, level):
     prefix = pollutant.upper()
     level_num = level.split("-")[0]
     return f"{prefix}_{level_num}"
 
+# --- Descubrimiento de combos ---
+def level_sort_key(level):
+    """Ordenar niveles por su valor numerico ("80-nmol/mol" -> 80.0)."""
+    try:
+        return (float(level.split("-")[0]), level)
+    except ValueError:
+        return (float("inf"), level)
+
+
+def combo_matches(combo, patterns):
+    """True si algun patron (glob, sin distinguir mayusculas) coincide con
+    el label del combo (p.ej. "O3_80", "NO*") o con su contaminante ("so2")."""
+    label = combo["label"].upper()
+    pollutant = combo["pollutant"].upper()
+    for pattern in patterns:
+        pattern = pattern.strip().upper()
+        if pattern and (fnmatch.fnmatchcase(label, pattern) or fnmatch.fnmatchcase(pollutant, pattern)):
+            return True
+    return False
+
+
+def filter_combos(combos, include=None, exclude=None):
+    """Aplicar filtros include/exclude (listas de patrones) a una lista de combos."""
+    if include:
+        combos = [c for c in combos if combo_matches(c, include)]
+    if exclude:
+        combos = [c for c in combos if not combo_matches(c, exclude)]
+    return combos
+
+
+def discover_combos(store, tables=("homogeneity", "stability", "summary"), include=None, exclude=None):
+    """Combos (contaminante, nivel, corrida) presentes en las tablas del almacen.
+
+    Retorna dicts con el mismo formato que COMBOS (mas "run"), ordenados por
+    contaminante y nivel numerico, despues de aplicar include/exclude.
+    make_combo_id descarta la unidad: dos niveles que solo difieren en ella
+    ("80-nmol/mol" y "80-µmol/mol") levantan ValueError en vez de compartir
+    combo_id.
+    """
+    combos = [
+        {"pollutant": p, "level": l, "run": run, "label": make_combo_id(p, l)}
+        for p, l, run in store.combos(tables)
+    ]
+    by_label = {}
+    for c in combos:
+        by_label.setdefault(c["label"], []).append(f"{c['pollutant']} {c['level']}")
+    collisions = [f"{label} ({' / '.join(found)})" for label, found in by_label.items() if len(found) > 1]
+    if collisions:
+        raise ValueError("combo_id repetido para combos distintos: " + "; ".join(collisions))
+    combos.sort(key=lambda c: (c["pollutant"], level_sort_key(c["level"])))
+    return filter_combos(combos, include=include, exclude=exclude)
+
+
+def parse_combo_patterns(text):
+    """Separar una lista de patrones por comas ("so2,O3_80" -> ["so2", "O3_80"])."""
+    if not text:
+        return None
+    return [p.strip() for p in text.split(",") if p.strip()]
+
+# --- Paralelismo por combos ---
+def split_chunks(items, n_chunks):
+    """Dividir `items` en hasta n_chunks bloques contiguos (orden preservado)."""
+    n_chunks = max(1, min(n_chunks, len(items)))
+    size, extra = divmod(len(items), n_chunks)
+    chunks, start = [], 0
+    for i in range(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+def map_combos(func, combos, workers=1, args=(), memo=None):
+    """Aplicar func(*args, bloque_de_combos) y concatenar las listas resultantes.
+
+    Con workers > 1 los bloques contiguos se reparten en un
+    ProcessPoolExecutor; los resultados se unen en el orden de `combos`,
+    por lo que la salida es identica a la corrida serial. `func` debe ser
+    una funcion de modulo (serializable) que retorne una lista.
+
+    Con `memo` (pipeline_cache.ComboMemo) cada combo se resuelve por
+    separado: los que ya tienen resultado para sus entradas actuales se
+    toman del memo y solo los demas se calculan (y se guardan).
+    """
+    combos = list(combos)
+    if memo is not None:
+        return _map_combos_memo(func, combos, workers, args, memo)
+    if not workers or workers <= 1 or len(combos) <= 1:
+        return list(func(*args, combos))
+    chunks = split_chunks(combos, workers)
+    with ProcessPoolExecutor(max_workers=len(chunks)) as pool:
+        futures = [pool.submit(func, *args, chunk) for chunk in chunks]
+        return [item for future in futures for item in future.result()]
+
+
+def _map_combos_memo(func, combos, workers, args, memo):
+    parts = [memo.load(combo) for combo in combos]
+    missing = [i for i, part in enumerate(parts) if part is None]
+    print(f"  Combos sin cambios (cache): {len(combos) - len(missing)}; a recalcular: {len(missing)}")
+    if workers and workers > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            futures = {i: pool.submit(func, *args, [combos[i]]) for i in missing}
+            for i in missing:
+                parts[i] = list(futures[i].result())
+    else:
+        for i in missing:
+            parts[i] = list(func(*args, [combos[i]]))
+    for i in missing:
+        memo.save(combos[i], parts[i])
+    return [item for part in parts for item in part]
+
 # --- Carga de datos en formato ancho ---
 def load_wide_data(filepath, pollutant, level):
     """Carga homogeneity CSV y pivota a formato ancho (sample_id × replicates)."""
@@ -60,26 +189,114 @@ def load_summary_combo(filepath, pollutant, level, exclude_ref=True):
     """Alias de compatibilidad para cargar summary por combo."""
     return load_summary_data(filepath, pollutant, level, exclude_ref=exclude_ref)
 
+# --- Estadisticos robustos por lotes (combos x participantes) ---
+# Cada fila de la matriz es un combo; las celdas no finitas (relleno NaN)
+# se ignoran, igual que el filtro math.isfinite de las versiones escalares.
+
+def pad_rows(rows):
+    """Apilar listas de distinto largo en una matriz 2-D rellena con NaN."""
+    rows = [np.asarray(r, dtype=float).ravel() for r in rows]
+    width = max((len(r) for r in rows), default=0)
+    out = np.full((len(rows), width), np.nan)
+    for i, r in enumerate(rows):
+        out[i, :len(r)] = r
+    return out
+
+def sort_rows(matrix):
+    """Ordenar cada fila (no finitos al final). Retorna (ordenada, n_finitos)."""
+    arr = np.array(matrix, dtype=float, ndmin=2)
+    arr[~np.isfinite(arr)] = np.nan
+    arr.sort(axis=1)
+    return arr, np.isfinite(arr).sum(axis=1)
+
+def _take_rows(sorted_arr, idx):
+    """Tomar sorted_arr[i, idx[i]] con idx fuera de rango -> NaN."""
+    out = np.full(sorted_arr.shape[0], np.nan)
+    ok = (idx >= 0) & (idx < sorted_arr.shape[1])
+    rows = np.nonzero(ok)[0]
+    out[rows] = sorted_arr[rows, idx[rows]]
+    return out
+
+def median_sorted_rows(sorted_arr, n):
+    """Mediana por fila de una matriz ya ordenada con n valores finitos."""
+    lo = _take_rows(sorted_arr, (n - 1) // 2)
+    hi = _take_rows(sorted_arr, n // 2)
+    med = (lo + hi) / 2.0
+    med[n == 0] = np.nan
+    return med
+
+def select_median_rows(matrix, n):
+    """Mediana por fila eligiendo solo los dos estadisticos de orden necesarios.
+
+    matrix: filas con sus n[i] valores finitos en las primeras posiciones
+    (en cualquier orden). Las filas con el mismo n se resuelven juntas con
+    np.partition. Resultado identico a ordenar y tomar (s[lo] + s[hi]) / 2.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    n = np.asarray(n)
+    med = np.full(matrix.shape[0], np.nan)
+    for count in np.unique(n):
+        if count == 0:
+            continue
+        rows = np.nonzero(n == count)[0]
+        lo, hi = (count - 1) // 2, count // 2
+        part = np.partition(matrix[rows, :count], (lo, hi), axis=1)
+        med[rows] = (part[:, lo] + part[:, hi]) / 2.0
+    return med
+
+def median_rows(matrix):
+    """Mediana por fila (compatible con R median())."""
+    sorted_arr, n = sort_rows(matrix)
+    return median_sorted_rows(sorted_arr, n)
+
+def quantile_sorted_rows(sorted_arr, n, prob):
+    """Cuantil tipo 7 por fila sobre matriz ordenada (misma aritmetica que R)."""
+    index = 1 + np.maximum(n - 1, 0) * prob
+    lo = np.floor(index).astype(np.int64)
+    hi = np.ceil(index).astype(np.int64)
+    q_lo = _take_rows(sorted_arr, lo - 1)
+    q_hi = _take_rows(sorted_arr, hi - 1)
+    h = index - lo
+    interp = (index > lo) & (q_hi != q_lo)
+    q = np.where(interp, (1 - h) * q_lo + h * q_hi, q_lo)
+    q[n == 0] = np.nan
+    return q
+
+def quantile_type7_rows(matrix, prob):
+    """Cuantil tipo 7 por fila (compatible con R quantile(type = 7))."""
+    sorted_arr, n = sort_rows(matrix)
+    return quantile_sorted_rows(sorted_arr, n, prob)
+
+def robust_stats_rows(matrix):
+    """Mediana, MAD, MADe y nIQR de cada fila en una sola llamada.
+
+    Retorna dict de arreglos de largo n_filas: n, median, mad, MADe, nIQR.
+    """
+    sorted_arr, n = sort_rows(matrix)
+    med = median_sorted_rows(sorted_arr, n)
+    abs_dev = np.abs(sorted_arr - med[:, None])
+    mad = select_median_rows(abs_dev, n)
+    q1 = quantile_sorted_rows(sorted_arr, n, 0.25)
+    q3 = quantile_sorted_rows(sorted_arr, n, 0.75)
+    return {
+        "n": n,
+        "median": med,
+        "mad": mad,
+        "MADe": 1.483 * mad,
+        "nIQR": 0.7413 * (q3 - q1),
+    }
+
+# --- Versiones escalares (una sola lista de valores) ---
+
 # --- Mediana (compatible con R median()) ---
 def median(values):
-    sorted_vals = sorted(v for v in values if math.isfinite(v))
-    n = len(sorted_vals)
-    if n == 0:
-        return float("nan")
-    mid = n // 2
-    if n % 2 == 1:
-        return sorted_vals[mid]
-    return (sorted_vals[mid - 1] + sorted_vals[mid]) / 2.0
+    return float(median_rows(pad_rows([values]))[0])
 
 # --- Cuartiles tipo 7 (compatible con R quantile type=7) ---
 def quantile_type7(values, probs):
-    """Calcula cuantiles usando el método lineal (R type=7, numpy default)."""
-    import numpy as np
-    arr = np.array([v for v in values if math.isfinite(v)])
-    if len(arr) == 0:
-        return [float("nan")] * len(probs)
-    # numpy uses linear interpolation by default (equivalent to R type=7)
-    return np.percentile(arr, [p * 100 for p in probs]).tolist()
+    """Calcula cuantiles tipo 7 (interpolacion lineal como R quantile())."""
+    sorted_arr, n = sort_rows(pad_rows([values]))
+    return [float(quantile_sorted_rows(sorted_arr, n, p)[0]) for p in probs]
 
 def iqr_type7(values):
     """IQR usando cuartiles tipo 7 (R type=7)."""
@@ -88,20 +305,11 @@ def iqr_type7(values):
 
 def mad_e(values):
     """MADe = 1.483 * MAD, usando mediana de desviaciones absolutas."""
-    finite_vals = [v for v in values if math.isfinite(v)]
-    if not finite_vals:
-        return float("nan")
-    med = median(finite_vals)
-    abs_dev = [abs(v - med) for v in finite_vals]
-    mad = median(abs_dev)
-    return 1.483 * mad
+    return float(robust_stats_rows(pad_rows([values]))["MADe"][0])
 
 def niqr(values):
     """nIQR = 0.7413 * IQR con cuartiles tipo 7."""
-    iqr = iqr_type7(values)
-    if not math.isfinite(iqr):
-        return float("nan")
-    return 0.7413 * iqr
+    return float(robust_stats_rows(pad_rows([values]))["nIQR"][0])
 
 # --- Comparación con tolerancia ---
 def compare_values(val_app, val_r, val_python, tol=TOL_DEFAULT):
@@ -161,17 +369,144 @@ def canonical_row(
         "participant_id": participant_id,
     }
 
+def status_labels(codes):
+    """Codigos de estado (STATUS_CODE_*) a etiquetas PASS/FAIL/EDGE_CASE."""
+    return np.array(STATUS_LABELS, dtype=object)[np.asarray(codes, dtype=np.intp)].tolist()
+
+
+def compare_values_table(app, r, python, tol=TOL_DEFAULT):
+    """compare_values sobre columnas alineadas, en una sola pasada NumPy.
+
+    app, r, python: arreglos de igual largo; tol: escalar o arreglo (una
+    tolerancia por fila/metrica). Retorna las tres columnas de diferencias
+    (nan si algun valor no es finito) y "status_code" (int8): FAIL si
+    alguna diferencia finita supera tol, PASS si los tres valores son NaN.
+    """
+    app, r, python, tol = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in (app, r, python, tol))
+    )
+    fin_app, fin_r, fin_py = np.isfinite(app), np.isfinite(r), np.isfinite(python)
+    with np.errstate(invalid="ignore"):
+        diff_app_r = np.where(fin_app & fin_r, np.abs(app - r), np.nan)
+        diff_app_py = np.where(fin_app & fin_py, np.abs(app - python), np.nan)
+        diff_r_py = np.where(fin_r & fin_py, np.abs(r - python), np.nan)
+        fail = (diff_app_r > tol) | (diff_app_py > tol) | (diff_r_py > tol)
+    fail &= ~(np.isnan(app) & np.isnan(r) & np.isnan(python))
+    return {
+        "diff_app_r": diff_app_r,
+        "diff_app_python": diff_app_py,
+        "diff_r_python": diff_r_py,
+        "status_code": np.where(fail, STATUS_CODE_FAIL, STATUS_CODE_PASS).astype(np.int8),
+    }
+
+
+def canonical_table(meta, app, r, python, tol, notes=""):
+    """Filas canonicas (mismo formato que helpers.canonical_row) en una pasada.
+
+    meta: dict con combo_id, pollutant, level, stage, section, metric y
+    participant_id (listas alineadas o escalares). app/r/python: listas o
+    arreglos alineados; las listas se escriben con sus valores originales.
+    tol: escalar o lista.
+    """
+    n = len(python)
+    comparison = compare_values_table(app, r, python, tol)
+
+    def _column(value):
+        if isinstance(value, np.ndarray):
+            return value.tolist()
+        return list(value) if isinstance(value, (list, tuple)) else [value] * n
+
+    cols = {name: _column(meta[name]) for name in (
+        "combo_id", "pollutant", "level", "stage", "section", "metric", "participant_id",
+    )}
+    app_l, r_l, py_l = _column(app), _column(r), _column(python)
+    tol_l = _column(tol)
+    notes_l = _column(notes)
+    d_rp = comparison["diff_r_python"].tolist()
+    d_ar = comparison["diff_app_r"].tolist()
+    d_ap = comparison["diff_app_python"].tolist()
+    status = status_labels(comparison["status_code"])
+    return [
+        {
+            "combo_id": cols["combo_id"][i],
+            "pollutant": cols["pollutant"][i],
+            "level": cols["level"][i],
+            "stage": cols["stage"][i],
+            "section": cols["section"][i],
+            "metric": cols["metric"][i],
+            "r_value": r_l[i],
+            "python_value": py_l[i],
+            "app_value": app_l[i],
+            "diff_r_python": d_rp[i],
+            "diff_app_r": d_ar[i],
+            "diff_app_python": d_ap[i],
+            "status": status[i],
+            "tolerance": tol_l[i],
+            "notes": notes_l[i],
+            "participant_id": cols["participant_id"][i],
+        }
+        for i in range(n)
+    ]
+
+
 # --- Escribir CSV canónico ---
+def write_canonical_rows(rows, filepath, fieldnames=CANONICAL_COLS, observer=None, encoding=None):
+    """Escribir filas a medida que llegan (p.ej. desde un generador).
+
+    No materializa la lista: cada fila se escribe y se pasa a
+    `observer(row)` (p.ej. CanonicalSummary) para llevar agregados.
+    Las columnas faltantes se escriben vacias. Retorna el numero de filas.
+    """
+    n_rows = 0
+    with open(filepath, "w", newline="", encoding=encoding) as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+        for row in rows:
+            writer.writerow([row.get(col, "") for col in fieldnames])
+            if observer is not None:
+                observer(row)
+            n_rows += 1
+    return n_rows
+
+
 def write_canonical_csv(results, filepath):
-    with open(filepath, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=CANONICAL_COLS, extrasaction="ignore")
-        writer.writeheader()
-        for row in results:
-            # Fill missing columns with empty string
-            full_row = {col: row.get(col, "") for col in CANONICAL_COLS}
-            writer.writerow(full_row)
+    write_canonical_rows(results, filepath)
     print(f"  CSV guardado: {filepath}")
 
+
+class CanonicalSummary:
+    """Agregados corrientes de filas canonicas sin conservar las filas.
+
+    Cuenta estados y secciones, registra el nivel de cada combo (orden de
+    aparicion), guarda las primeras `max_fail_rows` filas FAIL y las filas
+    que cumplen todos los filtros de `keep` ({columna: valor}).
+    """
+
+    def __init__(self, max_fail_rows=20, keep=None):
+        self.status_counts = {}
+        self.section_counts = {}
+        self.levels = {}
+        self.fail_rows = []
+        self.max_fail_rows = max_fail_rows
+        self.keep = keep or {}
+        self.kept = []
+        self.total = 0
+
+    def __call__(self, row):
+        status = row["status"]
+        self.total += 1
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        section = row.get("section", "")
+        self.section_counts[section] = self.section_counts.get(section, 0) + 1
+        self.levels.setdefault(row["combo_id"], row.get("level", ""))
+        if status == STATUS_FAIL and len(self.fail_rows) < self.max_fail_rows:
+            self.fail_rows.append(row)
+        if self.keep and all(row.get(k) == v for k, v in self.keep.items()):
+            self.kept.append(row)
+
+    def count(self, status):
+        return self.status_counts.get(status, 0)
+
 # --- Escribir reporte Markdown ---
 def write_report_md(lines, filepath):
     with open(filepath, "w") as f:
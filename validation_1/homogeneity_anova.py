@@ -0,0 +1,184 @@
+"""
+ANOVA de homogeneidad por lotes (Python).
+
+Trabaja sobre una matriz g x m (muestras x replicas) o sobre un arreglo
+apilado combos x g x m rellenado con NaN. Las replicas faltantes se
+excluyen con una mascara (por defecto, los valores no finitos), por lo que
+se admiten disenos desbalanceados y cualquier numero de replicas.
+
+Las sumas recorren muestras y replicas en el mismo orden que las sumas de
+Python de la version escalar de la Etapa 2, de modo que en disenos
+balanceados los resultados son identicos bit a bit.
+
+Referencia: ISO 13528:2022, Seccion 9.2 y Anexo B.
+"""
+
+import numpy as np
+
+from helpers import median_rows, pad_rows
+
+# --- Tabla F1/F2 para criterio expandido (3 args) ---
+F_TABLE = {
+    7:  (2.10, 1.43), 8:  (2.01, 1.25), 9:  (1.94, 1.11),
+    10: (1.88, 1.01), 11: (1.83, 0.93), 12: (1.79, 0.86),
+    13: (1.75, 0.80), 14: (1.72, 0.75), 15: (1.69, 0.71),
+    16: (1.67, 0.68), 17: (1.64, 0.64), 18: (1.62, 0.62),
+    19: (1.60, 0.59), 20: (1.59, 0.57),
+}
+F_G = np.arange(7, 21)
+F1 = np.array([F_TABLE[g][0] for g in F_G])
+F2 = np.array([F_TABLE[g][1] for g in F_G])
+
+
+def stack_matrices(matrices):
+    """Apilar matrices g_i x m_i en un arreglo combos x G x M rellenado con NaN."""
+    matrices = [np.array(mat, dtype=float, ndmin=2) for mat in matrices]
+    g_max = max((mat.shape[0] for mat in matrices), default=0)
+    m_max = max((mat.shape[1] for mat in matrices), default=0)
+    out = np.full((len(matrices), g_max, m_max), np.nan)
+    for i, mat in enumerate(matrices):
+        out[i, :mat.shape[0], :mat.shape[1]] = mat
+    return out
+
+
+def _seq_sum(values, axis):
+    """Suma secuencial a lo largo de `axis` (mismo orden que sum() de Python).
+
+    np.sum usa suma por pares en ejes largos; aqui se acumula elemento a
+    elemento para conservar el redondeo de la version escalar.
+    """
+    values = np.moveaxis(values, axis, 0)
+    acc = np.zeros(values.shape[1:])
+    for block in values:
+        acc = acc + block
+    return acc
+
+
+def moment_stats(rows):
+    """Estadisticos suficientes (n, media, M2) de cada fila de valores.
+
+    rows: secuencia de arreglos 1-D de largo variable. M2 es la suma de
+    cuadrados de las desviaciones respecto de la media (dos pasadas, en
+    el orden de los valores), de modo que M2 / (n - 1) coincide con var().
+    """
+    n = np.array([np.size(r) for r in rows], dtype=np.int64)
+    values = pad_rows(rows)
+    present = np.arange(values.shape[1]) < n[:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = _seq_sum(np.where(present, values, 0.0), axis=1) / n
+        m2 = _seq_sum(np.where(present, np.square(values - mean[:, None]), 0.0), axis=1)
+    return {"n": n, "mean": mean, "m2": m2}
+
+
+def merge_moments(a, b):
+    """Combinar dos estados (n, media, M2) como si fueran una sola muestra
+    (formula por pares de Chan et al.)."""
+    n = a["n"] + b["n"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = b["mean"] - a["mean"]
+        mean = np.where(b["n"] == 0, a["mean"], a["mean"] + delta * (b["n"] / n))
+        m2 = a["m2"] + b["m2"] + np.square(delta) * (a["n"] * b["n"] / n)
+    mean = np.where(a["n"] == 0, b["mean"], mean)
+    m2 = np.where(a["n"] == 0, b["m2"], np.where(b["n"] == 0, a["m2"], m2))
+    return {"n": n, "mean": mean, "m2": m2}
+
+
+def standard_error(n, m2):
+    """sd / sqrt(n) a partir de (n, M2); NaN si n < 2."""
+    n = np.asarray(n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 1, np.sqrt(m2 / (n - 1)) / np.sqrt(n), np.nan)
+
+
+def criterion_expanded(sigma_pt, sw, g):
+    """c_exp = F1*(0.3*sigma_pt)^2 + F2*sw^2 con clamp g a [7,20]."""
+    idx = np.clip(np.asarray(g), 7, 20) - 7
+    return F1[idx] * np.square(0.3 * sigma_pt) + F2[idx] * np.square(sw)
+
+
+def homogeneity_anova(values, mask=None):
+    """Estadisticos de homogeneidad para una o varias matrices g x m.
+
+    values: arreglo g x m o combos x g x m. mask: booleano de la misma
+    forma (True = replica presente); se combina con np.isfinite(values).
+    Retorna dict de arreglos con una entrada por combo: g (muestras con
+    al menos un valor), m (replicas maximas por muestra), n (valores),
+    general_mean, x_pt (mediana de la replica 1), s_x_bar_sq, sw, ss_sq,
+    ss, sigma_pt (mediana de |replica 2 - x_pt|), MADe, u_sigma_pt,
+    criterio_c y criterio_expandido; ademas sample_means (combos x g).
+    Con m == 2 sw usa el rango entre replicas; con m > 2, la media de las
+    varianzas intra-muestra. En disenos desbalanceados ss_sq usa el numero
+    medio de replicas por muestra.
+    """
+    x = np.array(values, dtype=float, ndmin=3)
+    present = np.isfinite(x)
+    if mask is not None:
+        present &= np.asarray(mask, dtype=bool).reshape(present.shape)
+    xz = np.where(present, x, 0.0)
+
+    n_rep = present.sum(axis=2)                     # combos x g
+    has_sample = n_rep > 0
+    g = has_sample.sum(axis=1)
+    m = n_rep.max(axis=1, initial=0)
+    n = n_rep.sum(axis=1)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        row_sums = _seq_sum(xz, axis=2)
+        sample_means = np.where(has_sample, row_sums / n_rep, np.nan)
+        general_mean = _seq_sum(row_sums, axis=1) / n
+
+        # Varianza (ddof=1) de las medias de muestra
+        mean_of_means = _seq_sum(np.where(has_sample, sample_means, 0.0), axis=1) / g
+        dev = np.where(has_sample, np.square(sample_means - mean_of_means[:, None]), 0.0)
+        s_x_bar_sq = np.where(g >= 2, _seq_sum(dev, axis=1) / (g - 1), np.nan)
+
+        # sw: rango entre replicas (m == 2) o media de varianzas intra-muestra
+        within_dev = np.where(present, np.square(x - sample_means[:, :, None]), 0.0)
+        within_ok = n_rep >= 2
+        within_var = np.where(within_ok, _seq_sum(within_dev, axis=2) / (n_rep - 1), 0.0)
+        sw_general = np.sqrt(_seq_sum(within_var, axis=1) / within_ok.sum(axis=1))
+        if x.shape[2] >= 2:
+            range_sq = np.where(
+                present[:, :, 0] & present[:, :, 1],
+                np.square(np.abs(x[:, :, 0] - x[:, :, 1])), 0.0,
+            )
+            n_pairs = (present[:, :, 0] & present[:, :, 1]).sum(axis=1)
+            sw_range = np.sqrt(_seq_sum(range_sq, axis=1) / (2 * n_pairs))
+        else:
+            sw_range = np.full(x.shape[0], np.nan)
+        sw = np.where(m == 2, sw_range, sw_general)
+
+        ss_sq = np.abs(s_x_bar_sq - np.square(sw) / (n / g))
+        ss = np.sqrt(ss_sq)
+
+    if x.shape[2] >= 1:
+        x_pt = median_rows(np.where(present[:, :, 0], x[:, :, 0], np.nan))
+    else:
+        x_pt = np.full(x.shape[0], np.nan)
+    if x.shape[2] >= 2:
+        second = np.where(present[:, :, 1], x[:, :, 1], np.nan)
+        sigma_pt = median_rows(np.abs(second - x_pt[:, None]))
+    else:
+        sigma_pt = np.full(x.shape[0], np.nan)
+
+    MADe = 1.483 * sigma_pt
+    with np.errstate(invalid="ignore", divide="ignore"):
+        u_sigma_pt = 1.25 * MADe / np.sqrt(g)
+
+    return {
+        "g": g,
+        "m": m,
+        "n": n,
+        "sample_means": sample_means,
+        "general_mean": general_mean,
+        "x_pt": x_pt,
+        "s_x_bar_sq": s_x_bar_sq,
+        "sw": sw,
+        "ss_sq": ss_sq,
+        "ss": ss,
+        "sigma_pt": sigma_pt,
+        "MADe": MADe,
+        "u_sigma_pt": u_sigma_pt,
+        "criterio_c": 0.3 * sigma_pt,
+        "criterio_expandido": criterion_expanded(sigma_pt, sw, g),
+    }
@@ -0,0 +1,253 @@
+"""
+Promedios horarios de ronda por analizador (Python).
+
+Equivalente de compute_hourly_averages_ronda y
+compute_hourly_averages_participant_ronda (R/preprocessing/hourly_averages.R):
+
+    - el nivel de cada minuto es el valor del generador ("6.3-umol/mol");
+      los minutos sin generador (p.ej. filas cortadas por una celda
+      "#VALUE!", ver calaire_raw.py) se descartan antes de armar corridas
+      y horas, como `usable` en R; una corrida (run) es un tramo de
+      minutos consecutivos con el mismo nivel;
+    - cada corrida se parte en horas de 60 filas desde su inicio; una hora
+      cuenta si tiene al menos MIN_ROWS = 45 filas y se conservan las
+      primeras MAX_HOURS = 3 (1 en nivel cero);
+    - por hora: mean, sd (n - 1) y u = sd / sqrt(n) de la columna del
+      analizador sin NA, valid_hour = n >= 45, y media/sd del generador,
+      todo redondeado a 3 decimales como en R.
+
+Todas las horas de una columna salen de una sola reduccion agrupada: la
+clave entera corrida * (filas + 1) + fila_en_corrida // 60 se ordena una
+vez (argsort estable) y sumas, conteos y desviaciones se acumulan con
+np.add.reduceat sobre los limites de grupo, sin recorrer filas en Python.
+"""
+
+import numpy as np
+
+HOUR_ROWS = 60
+MIN_ROWS = 45
+MAX_HOURS = 3
+ZERO_LEVELS = ("0-\u00b5mol/mol", "0-nmol/mol")
+ROUND_DIGITS = 3
+
+REF_COLUMNS = {
+    "co": "co_calaire_ppm", "so2": "so2_calaire_ppb", "no": "no_calaire_ppb",
+    "no2": "no2_calaire_ppb", "nox": "nox_calaire_ppb", "o3": "o3_calaire_ppb",
+}
+HOURLY_FIELDS = [
+    "source", "participant_id", "run", "date", "hour_start", "pollutant", "level",
+    "generated_nominal", "generated_mean", "generated_sd", "instrument", "mean_value",
+    "sd_value", "u_value", "n", "unit", "valid_hour", "validation_flags",
+]
+
+
+def level_labels(generator, unit):
+    """Etiquetas de nivel como paste0(gen, "-", unit) de R (15 cifras)."""
+    return np.char.add(np.char.mod("%.15g", np.asarray(generator, dtype=float) + 0.0), "-" + unit)
+
+
+def grouped_stats(keys, values):
+    """Reduccion agrupada por ordenamiento.
+
+    keys: enteros por fila; values: float (NaN = faltante). Retorna dict
+    de arreglos por grupo (en orden de clave): key, first (indice de la
+    primera fila del grupo en el orden original), size (filas), n (no NA),
+    mean y sd (n - 1; NaN si n < 2).
+
+    Las sumas se acumulan en long double y la media se corrige con la
+    media de los residuos, como mean() y var() de R: con valores
+    redondeados a 3 decimales, una media calculada en double puede caer
+    del otro lado de un empate (6.2805 -> 6.281 en lugar de 6.28).
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(keys, kind="stable")
+    k, x = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+    size = np.diff(np.r_[starts, k.size])
+    ok = ~np.isnan(x)
+    n = np.add.reduceat(ok.astype(np.int64), starts)
+    xl = np.where(ok, x, 0.0).astype(np.longdouble)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_l = np.add.reduceat(xl, starts) / n
+        resid = np.where(ok, xl - np.repeat(mean_l, size), 0.0)
+        mean = (mean_l + np.add.reduceat(resid, starts) / n).astype(float)
+        dev = np.where(ok, x - np.repeat(mean, size), 0.0)
+        m2 = np.add.reduceat(np.square(dev).astype(np.longdouble), starts)
+        sd = np.where(n > 1, np.sqrt((m2 / (n - 1)).astype(float)), np.nan)
+    return {"key": k[starts], "first": order[starts], "size": size, "n": n,
+            "mean": mean, "sd": sd}
+
+
+def mean_rows_r(values):
+    """mean() de R por fila (sin NA): suma en long double mas la
+    correccion por la media de los residuos."""
+    x = np.asarray(values, dtype=float).astype(np.longdouble)
+    n = x.shape[-1]
+    mean = x.sum(axis=-1) / n
+    mean += (x - mean[..., None]).sum(axis=-1) / n
+    return mean.astype(float)
+
+
+def round_r(values):
+    """round(x, 3) de R (>= 4.0, fround.c): entre los candidatos xd =
+    floor(x * 1000) / 1000 y xu = ceil(x * 1000) / 1000 elige el mas
+    cercano a x en double; en empate, el de ultima cifra par. Ni np.round
+    (escala por 1000) ni round() de Python (decimal exacto) coinciden en
+    todos los casos: 80.3855 -> 80.385 y 120.9695 -> 120.97."""
+    x = np.asarray(values, dtype=float)
+    sign = np.where(x < 0, -1.0, 1.0)
+    ax = np.abs(x)
+    p10 = 10.0 ** ROUND_DIGITS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x10 = p10 * ax
+        i10 = np.floor(x10)
+        xd = i10 / p10
+        xu = np.ceil(x10) / p10
+        du = xu - ax
+        dd = ax - xd
+        out = sign * np.where((du < dd) | ((du == dd) & (np.fmod(i10, 2.0) == 1)), xu, xd)
+        keep = ~np.isfinite(x) | (x == 0) | (np.log10(ax) + ROUND_DIGITS > 15)
+    return np.where(keep, x, out)
+
+
+def hourly_averages_ronda(timestamps, values, generator, unit):
+    """Horas de una columna de analizador (arreglos alineados por fila,
+    en el orden del archivo). Retorna dict de arreglos por hora, o None
+    si no hay filas con timestamp y generador."""
+    keep = ~np.isnat(timestamps)
+    keep &= ~np.isnan(np.asarray(generator, dtype=float))
+    ts = np.asarray(timestamps)[keep].astype("datetime64[m]")
+    x = np.asarray(values, dtype=float)[keep]
+    gen = np.asarray(generator, dtype=float)[keep]
+    if ts.size == 0:
+        return None
+
+    labels = level_labels(gen, unit)
+    change = np.r_[True, labels[1:] != labels[:-1]]
+    run_id = np.cumsum(change)
+    pos = np.arange(ts.size) - np.flatnonzero(change)[run_id - 1]
+    key = run_id * (ts.size + 1) + pos // HOUR_ROWS
+
+    hours = grouped_stats(key, x)
+    gens = grouped_stats(key, gen)
+    first = hours["first"]
+    h_run = run_id[first]
+    h_label = labels[first]
+
+    # Horas con >= 45 filas; por corrida se conservan las primeras 3 (1 en nivel cero)
+    counted = hours["size"] >= MIN_ROWS
+    total = np.cumsum(counted)
+    run_first = np.r_[True, h_run[1:] != h_run[:-1]]
+    before = (total - counted)[np.flatnonzero(run_first)]
+    rank = total - before[np.cumsum(run_first) - 1]
+    max_hours = np.where(np.isin(h_label, ZERO_LEVELS), 1, MAX_HOURS)
+    sel = counted & (rank <= max_hours)
+
+    n = hours["n"][sel]
+    valid = n >= MIN_ROWS
+    with np.errstate(invalid="ignore", divide="ignore"):
+        u = hours["sd"][sel] / np.sqrt(n)
+    return {
+        "run": h_run[sel],
+        "hour_start": ts[first[sel]],
+        "level": h_label[sel],
+        "generated_nominal": gen[first[sel]],
+        "generated_mean": round_r(gens["mean"][sel]),
+        "generated_sd": round_r(gens["sd"][sel]),
+        "mean_value": round_r(np.where(valid, hours["mean"][sel], np.nan)),
+        "sd_value": round_r(np.where(valid & (n > 1), hours["sd"][sel], np.nan)),
+        "u_value": round_r(np.where(valid & (n > 1), u, np.nan)),
+        "n": n,
+        "valid_hour": valid,
+    }
+
+
+def analyzer_columns(columns, participant=None):
+    """Columnas de analizador por contaminante: {pollutant: columna}.
+    participant=None -> referencia CALAIRE; si no, <pollutant>_part_<token>."""
+    if participant is None:
+        return {p: col for p, col in REF_COLUMNS.items() if col in columns}
+    return {
+        p: f"{p}_part_{participant}" for p in REF_COLUMNS
+        if f"{p}_part_{participant}" in columns
+    }
+
+
+def participant_tokens(columns):
+    """Tokens de participante presentes (co_part_p1 -> "p1"), en orden."""
+    tokens = []
+    for name in columns:
+        pollutant, sep, token = name.partition("_part_")
+        if sep and pollutant in REF_COLUMNS and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def attach_generator(columns, ref_columns, gen_col):
+    """Columna de generador tomada de otro archivo de la misma ronda,
+    alineada por timestamp (NaN donde no hay minuto coincidente)."""
+    ts = columns["timestamp"]
+    ref_ts = ref_columns["timestamp"]
+    ok = ~np.isnat(ref_ts)
+    ref_ts, ref_gen = ref_ts[ok], ref_columns[gen_col][ok]
+    order = np.argsort(ref_ts, kind="stable")
+    ref_ts, ref_gen = ref_ts[order], ref_gen[order]
+    if ref_ts.size == 0:
+        return np.full(ts.shape, np.nan)
+    idx = np.minimum(np.searchsorted(ref_ts, ts), ref_ts.size - 1)
+    hit = ~np.isnat(ts) & (ref_ts[idx] == ts)
+    return np.where(hit, ref_gen[idx], np.nan)
+
+
+def hourly_rows(columns, levels, participant=None, ref_columns=None):
+    """Filas HOURLY_FIELDS de un marco limpio (mismo orden que R: por
+    contaminante de la tabla de niveles, luego por hora).
+
+    levels: filas de niveles_calaire.csv (pollutant, unit, generator_col).
+    ref_columns: marco de referencia de la ronda para tomar el generador
+    si el archivo de participante no lo trae.
+    """
+    targets = analyzer_columns(columns, participant)
+    rows = []
+    for level_row in levels:
+        pollutant = level_row["pollutant"]
+        gen_col = level_row["generator_col"]
+        col = targets.get(pollutant)
+        if col is None:
+            continue
+        if gen_col in columns:
+            generator = columns[gen_col]
+        elif ref_columns is not None and gen_col in ref_columns:
+            generator = attach_generator(columns, ref_columns, gen_col)
+        else:
+            continue
+        unit = level_row["unit"]
+        h = hourly_averages_ronda(columns["timestamp"], columns[col], generator, unit)
+        if h is None:
+            continue
+        starts = np.datetime_as_string(h["hour_start"].astype("datetime64[s]"), unit="s")
+        starts = np.char.replace(starts, "T", " ").tolist()
+        for i, start in enumerate(starts):
+            n = int(h["n"][i])
+            rows.append({
+                "source": "ronda" if participant is None else "ronda_participante",
+                "participant_id": "" if participant is None else participant,
+                "run": int(h["run"][i]),
+                "date": start[:10],
+                "hour_start": start,
+                "pollutant": pollutant,
+                "level": str(h["level"][i]),
+                "generated_nominal": float(h["generated_nominal"][i]),
+                "generated_mean": float(h["generated_mean"][i]),
+                "generated_sd": float(h["generated_sd"][i]),
+                "instrument": "calaire_ref" if participant is None else participant,
+                "mean_value": float(h["mean_value"][i]),
+                "sd_value": float(h["sd_value"][i]),
+                "u_value": float(h["u_value"][i]),
+                "n": n,
+                "unit": unit,
+                "valid_hour": bool(h["valid_hour"][i]),
+                "validation_flags": f"n={n}" if n < HOUR_ROWS else "",
+            })
+    return rows
@@ -0,0 +1,72 @@
+"""
+Influencia leave-one-out por participante (Python).
+
+Para un combo con P participantes (cada uno con una o varias filas de
+summary) se construyen de una vez las P muestras reducidas, una por
+participante retirado, como una matriz (P + 1) x n a partir del orden de
+la muestra completa (fila 0 = muestra completa):
+
+    - los valores se ordenan una sola vez; quitar las posiciones de un
+      participante conserva el orden del resto, por lo que cada fila ya
+      queda ordenada (OrderStats presorted) y la mediana, el MAD y los
+      cuartiles se leen sin volver a ordenar;
+    - el Algoritmo A se evalua sobre todas las filas con algorithm_a_rows.
+
+Los estimadores son los de la Etapa 4 (mismos que en bootstrap.py):
+
+    Consenso MADe  -> x_pt = mediana, sigma_pt = MADe
+    Consenso nIQR  -> x_pt = mediana, sigma_pt = nIQR
+    Algoritmo A    -> x_pt = mediana inicial, sigma_pt = s* del Algoritmo A
+"""
+
+import numpy as np
+
+from algorithm_a import algorithm_a_rows
+from order_stats import OrderStats
+
+LOO_METHODS = ("Consenso MADe", "Consenso nIQR", "Algoritmo A")
+LOO_FIELDS = [
+    "combo_id", "pollutant", "level", "method", "removed_participant", "n_loo",
+    "x_pt", "x_pt_loo", "delta_x_pt", "sigma_pt", "sigma_pt_loo", "delta_sigma_pt",
+    "max_abs_delta_z", "max_delta_z_participant", "z_eval_changes",
+]
+LOO_Z_FIELDS = [
+    "combo_id", "pollutant", "level", "method", "removed_participant",
+    "participant_id", "z_score", "z_score_loo", "delta_z", "z_score_eval",
+    "z_score_eval_loo",
+]
+
+
+def leave_one_out_sorted(values, groups, labels):
+    """OrderStats (len(labels) + 1) x n: fila 0 con todos los valores y
+    fila k + 1 sin los valores del grupo labels[k].
+
+    Los valores se ordenan una sola vez; cada fila reducida se obtiene
+    moviendo al final (como NaN) las posiciones retiradas, con un
+    argsort estable de la mascara que conserva el orden de las demas.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    groups = np.asarray(groups).ravel()
+    order = np.argsort(values, kind="stable")     # NaN al final
+    sorted_vals = values[order]
+    drop = np.vstack([
+        np.zeros((1, values.size), dtype=bool),
+        groups[order][None, :] == np.asarray(labels).reshape(-1, 1),
+    ])
+    keep_first = np.argsort(drop, axis=1, kind="stable")
+    loo = sorted_vals[keep_first]
+    loo[np.take_along_axis(drop, keep_first, axis=1)] = np.nan
+    return OrderStats(loo, presorted=True)
+
+
+def loo_estimates(stats):
+    """(x_pt, sigma_pt) por metodo para cada fila de un OrderStats."""
+    med = stats.median()
+    mad = stats.abs_dev_median(med)
+    niqr = 0.7413 * (stats.quantile(0.75) - stats.quantile(0.25))
+    algo = algorithm_a_rows(stats.sorted, max_iter=50, tol=0.5)
+    return {
+        "Consenso MADe": (med, 1.483 * mad),
+        "Consenso nIQR": (med, niqr),
+        "Algoritmo A": (algo["assigned_value"], algo["robust_sd"]),
+    }
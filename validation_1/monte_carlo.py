@@ -0,0 +1,134 @@
+"""
+Propagacion Monte Carlo de la cadena Etapa 4 -> Etapa 5 (Python).
+
+Enfoque tipo GUM Suplemento 1: en lugar de combinar u_xpt, u_hom y u_stab
+en cuadratura, se simulan las entradas y cada draw recorre la cadena:
+
+    - resultados de participantes: cada fila de summary del participante p
+      se desplaza por e_p = u_p * (sqrt(rho) * Z_0 + sqrt(1 - rho) * Z_p),
+      comun a todas sus filas; rho es la correlacion entre participantes
+      (Z_0 compartido) y u_p la u_i reportada (sd/sqrt(3) si falta);
+    - homogeneidad y estabilidad: d_hom ~ N(0, u_hom = ss) y d_stab ~
+      N(0, u_stab = u_stab_mean), comunes a todos los participantes del
+      draw; son componentes aleatorias de x_pt_def, por lo que la
+      dispersion de z, z', zeta y En las refleja;
+    - Etapa 4: x_pt y sigma_pt por metodo sobre los valores simulados
+      (bootstrap.method_estimates; Referencia queda fija), x_pt_def =
+      x_pt + d_hom + d_stab, u_xpt = 1.25 * sigma_pt / sqrt(n) y u_xpt_def
+      en cuadratura como en calculate_uncertainty_chain (u_hom y u_stab
+      entran fijos al denominador, no se muestrean una segunda vez);
+    - Etapa 5: z, zeta y En con score_kernel (ver stage_05_scores.py).
+
+Los draws se generan en bloques de CHUNK_SIZE filas, cada uno con su
+flujo SeedSequence (random_streams.py), por lo que la memoria
+no depende del numero total de draws (10^6 draws usan lo mismo que un
+bloque). Por bloque se acumulan media y M2 (merge_moments), las cuentas
+de cada categoria de evaluacion y los percentiles 2.5/97.5; el intervalo
+reportado es el promedio de los intervalos por bloque (GUM S1, 7.9)
+ponderado por los draws finitos de cada bloque, de modo que un ultimo
+bloque corto (M no multiplo de CHUNK_SIZE) pesa segun su tamano.
+"""
+
+import numpy as np
+
+from homogeneity_anova import merge_moments
+from order_stats import OrderStats
+
+CI_LEVEL = 0.95
+N_CATEGORIES = 4  # codigos EVAL_* de la Etapa 5
+
+MC_SCORES = ("z_score", "zeta_score", "En_score")
+MC_CHAIN = ("x_pt", "sigma_pt", "u_xpt_def")
+MC_FIELDS = [
+    "combo_id", "pollutant", "level", "method", "participant_id", "metric",
+    "draws", "mean", "sd", "ci_low", "ci_high",
+    "p_na", "p_satisfactory", "p_questionable", "p_unsatisfactory",
+]
+
+
+def participant_errors(rng, size, u, rho=0.0):
+    """Matriz size x P de errores correlacionados (correlacion rho entre
+    participantes, desviacion u_p en la columna p)."""
+    if not 0.0 <= rho <= 1.0:
+        raise ValueError(f"rho debe estar en [0, 1]: {rho}")
+    u = np.asarray(u, dtype=float)
+    common = rng.standard_normal((size, 1))
+    own = rng.standard_normal((size, u.size))
+    return (np.sqrt(rho) * common + np.sqrt(1.0 - rho) * own) * u[None, :]
+
+
+def uncertainty_chain_rows(sigma_pt, n_part, u_hom, u_stab):
+    """u_xpt_def por draw (misma aritmetica que calculate_uncertainty_chain)."""
+    sigma_pt = np.asarray(sigma_pt, dtype=float)
+    with np.errstate(invalid="ignore"):
+        u_xpt = 1.25 * sigma_pt / np.sqrt(n_part) if n_part > 0 else np.full(sigma_pt.shape, np.nan)
+        return np.sqrt(np.square(u_xpt) + np.square(u_hom) + np.square(u_stab))
+
+
+class MonteCarloSummary:
+    """Acumulador por bloques de las distribuciones de un combo.
+
+    Cada serie (clave) recibe bloques draws x K; se guardan solo los
+    estados (n, media, M2), las cuentas por categoria y la suma de los
+    percentiles por bloque ponderados por sus draws finitos, de modo que
+    la memoria es O(K).
+    """
+
+    def __init__(self, level=CI_LEVEL):
+        self.alpha = (1.0 - level) / 2.0
+        self.series = {}
+
+    def add(self, key, samples, codes=None):
+        samples = np.asarray(samples, dtype=float)
+        ok = np.isfinite(samples)
+        n = ok.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(ok, samples, 0.0).sum(axis=0) / n
+            m2 = np.where(ok, np.square(samples - mean[None, :]), 0.0).sum(axis=0)
+        stats = OrderStats(samples.T)
+        lo, hi = stats.quantile(self.alpha), stats.quantile(1.0 - self.alpha)
+
+        state = self.series.get(key)
+        if state is None:
+            k = samples.shape[1]
+            state = {
+                "moments": {"n": np.zeros(k, dtype=np.int64), "mean": np.zeros(k), "m2": np.zeros(k)},
+                "draws": 0,
+                "ci_sum": np.zeros((2, k)),
+                "ci_weight": np.zeros(k, dtype=np.int64),
+                "counts": None if codes is None else np.zeros((N_CATEGORIES, k), dtype=np.int64),
+            }
+            self.series[key] = state
+        state["moments"] = merge_moments(state["moments"], {"n": n, "mean": mean, "m2": m2})
+        state["draws"] += samples.shape[0]
+        weight = np.where(np.isfinite(lo) & np.isfinite(hi), n, 0)
+        state["ci_sum"] += np.where(weight > 0, np.vstack([lo, hi]) * weight, 0.0)
+        state["ci_weight"] += weight
+        if codes is not None:
+            codes = np.asarray(codes)
+            for code in range(N_CATEGORIES):
+                state["counts"][code] += (codes == code).sum(axis=0)
+
+    def result(self, key):
+        """dict de arreglos (largo K): draws, mean, sd, ci_low, ci_high y,
+        si hubo codigos, p_na, p_satisfactory, p_questionable, p_unsatisfactory."""
+        state = self.series[key]
+        n, m2 = state["moments"]["n"], state["moments"]["m2"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sd = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+            ci = np.where(state["ci_weight"] > 0, state["ci_sum"] / state["ci_weight"], np.nan)
+        out = {
+            "draws": state["draws"],
+            "mean": np.where(n > 0, state["moments"]["mean"], np.nan),
+            "sd": sd,
+            "ci_low": ci[0],
+            "ci_high": ci[1],
+        }
+        counts = state["counts"]
+        names = ("p_na", "p_satisfactory", "p_questionable", "p_unsatisfactory")
+        for code, name in enumerate(names):
+            out[name] = (
+                counts[code] / state["draws"] if counts is not None and state["draws"]
+                else np.full(out["mean"].shape, np.nan)
+            )
+        return out
@@ -0,0 +1,150 @@
+"""
+Medias moviles horarias por bloque de estabilidad/homogeneidad (Python).
+
+Equivalente de R/preprocessing/moving_hourly_means.R: cada fila del diseno
+(metadata/diseno_estabilidad_homogeneidad.csv) define un bloque
+[start_timestamp, end_timestamp] sobre una columna fuente; un bloque con al
+menos N_NEEDED = 119 puntos validos produce WINDOW = 60 medias moviles de
+ventana 60 sobre sus primeros 119 puntos:
+
+    mm_k = mean(x[k:(k + 59)]),  k = 1..60
+
+y un bloque con menos puntos produce una sola fila valid_mm = FALSE con
+validation_flags = "insufficient(n<119)".
+
+En lugar de filtrar todo el marco limpio por cada fila del diseno (bloques
+x filas), cada columna fuente se ordena una sola vez por timestamp sin NA
+y los bloques se ubican con searchsorted (n_valid = hi - lo). Las ventanas
+de todos los bloques validos se calculan juntas: una matriz bloques x 119
+y sliding_window_view de ancho 60 sobre ella.
+"""
+
+import re
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+WINDOW = 60
+N_NEEDED = 2 * WINDOW - 1
+
+DESIGN_FIELDS = [
+    "source", "pollutant", "instrument", "level", "replicate", "sample_id", "study_type",
+]
+MM_FIELDS = DESIGN_FIELDS + [
+    "run", "window_index", "window_start", "window_end", "n_points", "value", "unit",
+    "valid_mm", "validation_flags",
+]
+DESIGN_TIME_PATTERN = re.compile(r"^\s*(\d{4})-(\d{1,2})-(\d{1,2}) (\d{1,2}):(\d{1,2})")
+
+
+def parse_design_timestamp(text):
+    """datetime64[s] de "%Y-%m-%d %H:%M" (hora local, sin zona); NaT si no coincide."""
+    match = DESIGN_TIME_PATTERN.match(text or "")
+    if not match:
+        return np.datetime64("NaT", "s")
+    year, month, day, hour, minute = (int(g) for g in match.groups())
+    if hour > 23 or minute > 59:
+        return np.datetime64("NaT", "s")
+    try:
+        day_value = np.datetime64(f"{year:04d}-{month:02d}-{day:02d}", "D")
+    except ValueError:
+        return np.datetime64("NaT", "s")
+    return day_value.astype("datetime64[s]") + np.timedelta64(hour * 3600 + minute * 60, "s")
+
+
+def valid_series(timestamps, values):
+    """Timestamps y valores de una columna sin NA, ordenados por timestamp
+    (orden estable: los duplicados conservan el orden del archivo)."""
+    values = np.asarray(values, dtype=float)
+    ok = ~np.isnat(timestamps) & ~np.isnan(values)
+    ts, x = timestamps[ok], values[ok]
+    order = np.argsort(ts, kind="stable")
+    return ts[order], x[order]
+
+
+def block_bounds(ts_sorted, starts, ends):
+    """Posiciones [lo, hi) de cada bloque en timestamps ordenados (extremos
+    inclusivos); un extremo NaT deja el bloque vacio."""
+    lo = np.searchsorted(ts_sorted, starts, side="left")
+    hi = np.searchsorted(ts_sorted, ends, side="right")
+    bad = np.isnat(starts) | np.isnat(ends)
+    hi = np.where(bad, lo, np.maximum(hi, lo))
+    return lo, hi
+
+
+def window_means(x, lo):
+    """Medias moviles (bloques x WINDOW) de los primeros N_NEEDED puntos de
+    cada bloque que empieza en lo."""
+    idx = np.asarray(lo)[:, None] + np.arange(N_NEEDED)[None, :]
+    return sliding_window_view(x[idx], WINDOW, axis=1).mean(axis=-1)
+
+
+def _format_ts(values):
+    """Texto "%Y-%m-%d %H:%M:%S" (listas anidadas con la forma de values)."""
+    return np.char.replace(np.datetime_as_string(values, unit="s"), "T", " ").tolist()
+
+
+def compute_moving_hourly_means(columns, design):
+    """Filas MM_FIELDS (mismo orden que R) para un marco limpio y el diseno.
+
+    columns: dict de columnas con "timestamp" (datetime64) y las columnas
+    fuente float (clean_calaire_raw). design: filas dict del CSV de diseno.
+    Retorna (filas, advertencias).
+    """
+    timestamps = np.asarray(columns["timestamp"], dtype="datetime64[s]")
+    warnings = []
+    series = {}
+    plan = []          # (run, fila de diseno, columna, inicio, fin)
+    for run, row in enumerate(design, start=1):
+        src = row["source_column"]
+        if src not in columns:
+            warnings.append(f"Column '{src}' not found; skipping design row {run}")
+            continue
+        if src not in series:
+            series[src] = valid_series(timestamps, columns[src])
+        plan.append((run, row, src, parse_design_timestamp(row["start_timestamp"]),
+                     parse_design_timestamp(row["end_timestamp"])))
+
+    # Ubicacion y medias por columna fuente: una busqueda y un kernel por columna
+    located = {}
+    for src, (ts, x) in series.items():
+        items = [i for i, p in enumerate(plan) if p[2] == src]
+        lo, hi = block_bounds(
+            ts,
+            np.array([plan[i][3] for i in items], dtype="datetime64[s]"),
+            np.array([plan[i][4] for i in items], dtype="datetime64[s]"),
+        )
+        n_valid = hi - lo
+        for i, n in zip(items, n_valid.tolist()):
+            located[i] = (n, None)
+        full = n_valid >= N_NEEDED
+        if not full.any():
+            continue
+        first = lo[full][:, None] + np.arange(WINDOW)[None, :]
+        means = window_means(x, lo[full]).tolist()
+        w_start = _format_ts(ts[first])
+        w_end = _format_ts(ts[first + WINDOW - 1])
+        for b, i in enumerate(np.asarray(items)[full].tolist()):
+            located[i] = (located[i][0], (means[b], w_start[b], w_end[b]))
+
+    rows = []
+    for i, (run, row, src, _, _) in enumerate(plan):
+        base = {name: row.get(name, "") for name in DESIGN_FIELDS}
+        n_valid, windows = located[i]
+        if windows is None:
+            rows.append({
+                **base, "run": run, "window_index": None, "window_start": None,
+                "window_end": None, "n_points": n_valid, "value": float("nan"),
+                "unit": row.get("unit", ""), "valid_mm": False,
+                "validation_flags": f"insufficient({n_valid}<{N_NEEDED})",
+            })
+            continue
+        means, starts, ends = windows
+        for k in range(WINDOW):
+            rows.append({
+                **base, "run": run, "window_index": k + 1,
+                "window_start": starts[k], "window_end": ends[k],
+                "n_points": WINDOW, "value": means[k],
+                "unit": row.get("unit", ""), "valid_mm": True, "validation_flags": "",
+            })
+    return rows, warnings
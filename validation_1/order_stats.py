@@ -0,0 +1,74 @@
+"""
+Estructura de estadisticos de orden por filas (Python).
+
+Las filas (combos, o combos x iteraciones) se ordenan una sola vez
+(NaN al final) y luego se consultan sin volver a ordenar:
+
+    - median() / quantile(p): O(1) por fila sobre el arreglo ordenado
+      (misma aritmetica que R median() y quantile type=7).
+    - abs_dev_median(centro): mediana de |x - centro| por seleccion
+      (np.partition, O(n)) en lugar de ordenar las desviaciones.
+    - clamp(inf, sup) / replace(valores): winsorizar conserva el orden, por
+      lo que el arreglo nuevo no se reordena; solo se reordenan las filas
+      en que el redondeo rompa el orden (se verifica en O(n)).
+"""
+
+import numpy as np
+
+from helpers import median_sorted_rows, quantile_sorted_rows, select_median_rows, sort_rows
+
+
+def _finite_count(sorted_arr):
+    return np.isfinite(sorted_arr).sum(axis=1)
+
+
+class OrderStats:
+    """Filas ordenadas (no finitos al final) con consultas de orden.
+
+    `sorted` es la matriz ordenada por fila y `n` el numero de valores
+    finitos de cada fila.
+    """
+
+    def __init__(self, matrix, presorted=False):
+        if presorted:
+            self.sorted = np.array(matrix, dtype=float, ndmin=2)
+            self.n = _finite_count(self.sorted)
+        else:
+            self.sorted, self.n = sort_rows(matrix)
+
+    def __len__(self):
+        return self.sorted.shape[0]
+
+    def rows(self, index):
+        """Subconjunto de filas (sin reordenar)."""
+        return OrderStats(self.sorted[index], presorted=True)
+
+    def median(self):
+        return median_sorted_rows(self.sorted, self.n)
+
+    def quantile(self, prob):
+        """Cuantil tipo 7 por fila."""
+        return quantile_sorted_rows(self.sorted, self.n, prob)
+
+    def abs_dev_median(self, center):
+        """Mediana por fila de |x - center| (MAD sin escalar) por seleccion."""
+        dev = np.abs(self.sorted - np.asarray(center, dtype=float).reshape(-1, 1))
+        return select_median_rows(dev, self.n)
+
+    def replace(self, values):
+        """OrderStats de `values`, una transformacion que conserva el orden
+        de self.sorted (p.ej. winsorizacion). Solo reordena las filas que no
+        quedaron ordenadas."""
+        values = np.array(values, dtype=float, ndmin=2)
+        values[~np.isfinite(values)] = np.nan
+        with np.errstate(invalid="ignore"):
+            broken = (np.diff(values, axis=1) < 0).any(axis=1)
+        if broken.any():
+            values[broken] = np.sort(values[broken], axis=1)
+        return OrderStats(values, presorted=True)
+
+    def clamp(self, lower, upper):
+        """Winsorizar cada fila a [lower, upper] sin reordenar."""
+        lower = np.asarray(lower, dtype=float).reshape(-1, 1)
+        upper = np.asarray(upper, dtype=float).reshape(-1, 1)
+        return OrderStats(np.clip(self.sorted, lower, upper), presorted=True)
@@ -0,0 +1,123 @@
+"""
+Cache por contenido de resultados de etapa (Python).
+
+Cada etapa del orquestador se identifica con una clave SHA-256 calculada
+sobre el contenido de sus archivos de entrada, los CSV R que compara, los
+combos seleccionados, las claves de las etapas de las que depende y el
+codigo fuente de validation_1. Si la clave ya existe en el cache, se
+restauran los archivos de salida y el resultado en memoria sin recalcular.
+
+Estructura:
+    <cache_dir>/<etapa>/<clave>/result.pkl
+    <cache_dir>/<etapa>/<clave>/files/<salidas de la etapa>
+    <cache_dir>/<etapa>/combos/<clave de combo>.pkl
+
+Si cambia una entrada (p.ej. se agregan participantes a summary), la
+etapa se vuelve a ejecutar, pero ComboMemo entrega el resultado ya
+calculado de cada combo cuyas filas no cambiaron: solo se recalculan los
+combos afectados.
+"""
+
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+
+CACHE_DIRNAME = ".cache"
+MISSING = "ausente"
+
+
+def hash_file(path):
+    """SHA-256 del contenido de un archivo ("ausente" si no existe)."""
+    if path is None or not os.path.exists(path):
+        return MISSING
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def hash_sources(directory):
+    """SHA-256 de los *.py de `directory` (cambia si cambia el codigo)."""
+    h = hashlib.sha256()
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        h.update(os.path.basename(path).encode("utf-8"))
+        h.update(hash_file(path).encode("utf-8"))
+    return h.hexdigest()
+
+
+def stage_key(parts):
+    """Clave de etapa a partir de una estructura serializable con repr()."""
+    return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+
+class StageCache:
+    """Cache en disco de resultados de etapa indexado por (etapa, clave)."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def _entry(self, name, key):
+        return os.path.join(self.cache_dir, name, key)
+
+    def load(self, name, key, output_paths):
+        """Restaurar salidas y resultado; None si la clave no esta en cache."""
+        entry = self._entry(name, key)
+        result_pkl = os.path.join(entry, "result.pkl")
+        if not os.path.exists(result_pkl):
+            return None
+        for path in output_paths:
+            cached = os.path.join(entry, "files", os.path.basename(path))
+            if os.path.exists(cached):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.copyfile(cached, path)
+        with open(result_pkl, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, name, key, result, output_paths):
+        """Guardar resultado y copia de las salidas bajo (etapa, clave)."""
+        entry = self._entry(name, key)
+        tmp = entry + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(os.path.join(tmp, "files"))
+        for path in output_paths:
+            if os.path.exists(path):
+                shutil.copyfile(path, os.path.join(tmp, "files", os.path.basename(path)))
+        with open(os.path.join(tmp, "result.pkl"), "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+
+
+class ComboMemo:
+    """Resultados por combo de una etapa, indexados por el contenido del combo.
+
+    context: clave de todo lo que no depende del combo (codigo, CSV R...).
+    fingerprint(item): huella de los datos de entrada del combo `item`.
+    """
+
+    def __init__(self, cache_dir, name, context, fingerprint):
+        self.directory = os.path.join(cache_dir, name, "combos")
+        self.context = context
+        self.fingerprint = fingerprint
+
+    def _path(self, item):
+        key = stage_key((self.context, self.fingerprint(item)))
+        return os.path.join(self.directory, key + ".pkl")
+
+    def load(self, item):
+        """Resultado guardado del combo; None si sus entradas cambiaron."""
+        path = self._path(item)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, item, result):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(item)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
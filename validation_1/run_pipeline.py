@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Orquestador en proceso de la validacion Python (Etapas 1-5).
+
+Lee las entradas indicadas una sola vez (almacen columnar) y encadena las
+etapas en memoria: los resultados de la Etapa 2 pasan a la 3, los de las
+Etapas 2-3 (u_hom, u_stab) a la 4 y las filas canonicas de la Etapa 4
+pasan a la 5 sin releer `outputs/*_py.csv`.
+Nunca escribe sobre `data/for_validation`, por lo que varias corridas con
+distintos `--output-dir` pueden ejecutarse en paralelo.
+
+Los combos (contaminante, nivel) se descubren en las entradas y se
+restringen con `--include` / `--exclude` (patrones separados por comas
+sobre el label o el contaminante, p.ej. `--include so2,O3_80` o
+`--exclude "NO*"`). Con `--workers N` las etapas 2-5 reparten los combos
+en N procesos; la salida es identica a la corrida serial.
+
+Las etapas se declaran como grafo (STAGES) con sus tablas de entrada, CSV
+R y dependencias. Cada resultado se guarda en `<output-dir>/.cache` bajo
+un hash de esas entradas: si solo cambia summary, homogeneidad y
+estabilidad se restauran del cache sin recalcular (`--no-cache` lo omite).
+
+Las etapas sobre summary (1, 4, 4b y 5) son incrementales: si se agregan
+o cambian filas de participantes, solo se recalculan los combos cuyas
+filas cambiaron; el resto se toma del cache por combo (ComboMemo).
+
+Con `--binary` cada etapa escribe ademas sus tablas como .npz tipado
+(ver columnar_io.py); el CSV queda como exportacion.
+
+Uso:
+    python3 validation_1/run_pipeline.py HOMOGENEITY STABILITY SUMMARY \\
+        [--pt-data PT_DATA] [--output-dir DIR] [--r-dir DIR] \\
+        [--include PATRONES] [--exclude PATRONES] [--workers N] \\
+        [--cache-dir DIR | --no-cache] [--binary] [--bootstrap B] [--seed N] \\
+        [--loo] [--monte-carlo M] [--mc-rho RHO]
+"""
+
+import argparse
+import os
+import sys
+
+VALIDATION_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, VALIDATION_DIR)
+
+import stage_01_robust_stats as stage_01
+import stage_02_homogeneity as stage_02
+import stage_03_stability as stage_03
+import stage_04_uncertainty_chain as stage_04
+import stage_04b_algorithm_a_iterations as stage_04b
+import stage_05_scores as stage_05
+from data_store import load_data_store
+from columnar_io import npz_path
+from helpers import discover_combos, make_combo_id, parse_combo_patterns, resolve_path
+from pipeline_cache import (
+    CACHE_DIRNAME, ComboMemo, StageCache, hash_file, hash_sources, stage_key,
+)
+from random_streams import DEFAULT_SEED
+
+DEFAULT_OUTPUT_DIR = os.path.join(VALIDATION_DIR, "outputs")
+DEFAULT_R_DIR = os.path.join(VALIDATION_DIR, "outputs")
+
+
+def _outputs(module):
+    return (module.OUTPUT_PY_CSV, module.OUTPUT_CSV, module.OUTPUT_REPORT)
+
+
+# Grafo de etapas en orden topologico. "tables": tablas del almacen que
+# lee la etapa; "r_files": CSV R comparados; "deps": etapas previas cuyo
+# resultado consume; "incremental": resultados reutilizables por combo;
+# "options": opciones de corrida que recibe la etapa (parte de su clave);
+# "option_outputs": salidas que solo existen con la opcion activada;
+# "run": llamada con (store, results, kwargs).
+STAGES = [
+    {
+        "name": "stage_01",
+        "tables": ("summary",),
+        "r_files": (stage_01.R_CSV,),
+        "deps": (),
+        "outputs": _outputs(stage_01),
+        "parallel": False,
+        "incremental": True,
+        "run": lambda store, results, kw: stage_01.run_stage_01_robust_stats(store, **kw),
+    },
+    {
+        "name": "stage_02",
+        "tables": ("homogeneity",),
+        "r_files": (stage_02.R_CSV,),
+        "deps": (),
+        "outputs": _outputs(stage_02),
+        "parallel": True,
+        "incremental": False,
+        "run": lambda store, results, kw: stage_02.run_stage_02(store, **kw),
+    },
+    {
+        "name": "stage_03",
+        "tables": ("stability",),
+        "r_files": (stage_03.R_CSV,),
+        "deps": ("stage_02",),
+        "outputs": _outputs(stage_03),
+        "parallel": True,
+        "incremental": False,
+        "run": lambda store, results, kw: stage_03.run_stage_03(
+            store, hom_results=results["stage_02"]["py_results"], **kw
+        ),
+    },
+    {
+        "name": "stage_04",
+        "tables": ("summary",),
+        "r_files": (stage_04.R_CSV,),
+        "deps": ("stage_02", "stage_03"),
+        "outputs": _outputs(stage_04),
+        "parallel": True,
+        "incremental": True,
+        "options": ("n_boot", "seed"),
+        "option_outputs": {"n_boot": (stage_04.OUTPUT_BOOT_CSV,)},
+        "run": lambda store, results, kw: stage_04.run_stage_04(
+            store,
+            hom_results=results["stage_02"]["py_results"],
+            stab_results=results["stage_03"]["py_results"],
+            **kw
+        ),
+    },
+    {
+        "name": "stage_04b",
+        "tables": ("summary",),
+        "r_files": (stage_04b.R_CSV,),
+        "deps": (),
+        "outputs": _outputs(stage_04b),
+        "parallel": True,
+        "incremental": True,
+        "run": lambda store, results, kw: stage_04b.main(store, **kw),
+    },
+    {
+        "name": "stage_05",
+        "tables": ("summary", "pt_data"),
+        "r_files": (stage_05.R_CSV,),
+        "deps": ("stage_04",),
+        "outputs": _outputs(stage_05),
+        "parallel": True,
+        "incremental": True,
+        "options": ("loo", "n_mc", "mc_rho", "seed"),
+        "option_outputs": {
+            "loo": (stage_05.OUTPUT_LOO_CSV, stage_05.OUTPUT_LOO_Z_CSV),
+            "n_mc": (stage_05.OUTPUT_MC_CSV,),
+        },
+        "run": lambda store, results, kw: stage_05.run_stage_05(
+            store, stage04_rows=results["stage_04"]["rows"], **kw
+        ),
+    },
+]
+
+
+def _memo_tables(name):
+    """Tablas que determinan el resultado por combo de una etapa.
+
+    Incluye las tablas de sus dependencias (transitivas): p.ej. la Etapa 4
+    cambia por combo si cambian sus filas de homogeneidad o estabilidad.
+    """
+    stage = next(s for s in STAGES if s["name"] == name)
+    tables = list(stage["tables"])
+    for dep in stage["deps"]:
+        tables += [t for t in _memo_tables(dep) if t not in tables]
+    return tuple(tables)
+
+
+def _combo_fingerprint(store, tables, combos_by_id):
+    """Huella de las filas de un combo (dict de combo o combo_id) en `tables`."""
+    def fingerprint(item):
+        combo = combos_by_id[item] if isinstance(item, str) else item
+        return store.combo_digest(combo["pollutant"], combo["level"], tables)
+    return fingerprint
+
+
+def run_pipeline(
+    homogeneity_path,
+    stability_path,
+    summary_path,
+    pt_data_path=None,
+    output_dir=DEFAULT_OUTPUT_DIR,
+    r_dir=DEFAULT_R_DIR,
+    include=None,
+    exclude=None,
+    workers=1,
+    cache_dir=None,
+    use_cache=True,
+    binary=False,
+    bootstrap=0,
+    seed=DEFAULT_SEED,
+    loo=False,
+    monte_carlo=0,
+    mc_rho=0.0,
+):
+    """Ejecutar las etapas 1-5 en proceso con rutas de entrada explicitas.
+
+    `include` / `exclude` son listas de patrones para filtrar los combos
+    descubiertos; `workers` > 1 paraleliza las etapas 2-5 por combos.
+    Con `use_cache` las etapas cuya clave ya existe en `cache_dir`
+    (por defecto `<output_dir>/.cache`) no se recalculan. Con `binary`
+    las etapas escriben tambien sus tablas en .npz. `bootstrap` > 0 activa
+    el bootstrap de u_xpt de la Etapa 4 con B remuestras y semilla `seed`;
+    `loo` agrega a la Etapa 5 la influencia leave-one-out por participante
+    y `monte_carlo` > 0 la propagacion Monte Carlo de las Etapas 4-5 con
+    M draws (correlacion `mc_rho` entre participantes).
+    Retorna dict etapa -> {"py_results": [...], "rows": [...]} (la Etapa 5
+    entrega "summary", agregados CanonicalSummary, en lugar de "rows").
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    input_paths = {
+        "homogeneity": homogeneity_path,
+        "stability": stability_path,
+        "summary": summary_path,
+        "pt_data": pt_data_path,
+    }
+    store = load_data_store(
+        homogeneity_path=homogeneity_path,
+        stability_path=stability_path,
+        summary_path=summary_path,
+        pt_data_path=pt_data_path,
+    )
+
+    combos = discover_combos(store, include=include, exclude=exclude)
+    print(f"Combos seleccionados ({len(combos)}): {', '.join(c['label'] for c in combos)}")
+
+    cache = StageCache(cache_dir or os.path.join(output_dir, CACHE_DIRNAME)) if use_cache else None
+    source_hash = hash_sources(VALIDATION_DIR)
+    input_hashes = {
+        name: hash_file(path) if store.has_table(name) else None
+        for name, path in input_paths.items()
+    }
+    combo_keys = [(c["pollutant"], c["level"]) for c in combos]
+    combos_by_id = {make_combo_id(c["pollutant"], c["level"]): c for c in combos}
+    options = {
+        "n_boot": bootstrap, "seed": seed, "loo": loo,
+        "n_mc": monte_carlo, "mc_rho": mc_rho,
+    }
+
+    results = {}
+    keys = {}
+    r_hashes = {}
+    for stage in STAGES:
+        name = stage["name"]
+        r_hashes[name] = [hash_file(resolve_path(p, r_dir)) for p in stage["r_files"]]
+        r_hashes[name] += [h for dep in stage["deps"] for h in r_hashes[dep]]
+        stage_options = {opt: options[opt] for opt in stage.get("options", ())}
+        keys[name] = stage_key((
+            name,
+            source_hash,
+            [(t, input_hashes[t]) for t in stage["tables"]],
+            r_hashes[name],
+            combo_keys,
+            [keys[dep] for dep in stage["deps"]],
+            binary,
+            sorted(stage_options.items()),
+        ))
+        outputs, disabled = list(stage["outputs"]), []
+        for opt, paths in stage.get("option_outputs", {}).items():
+            (outputs if options[opt] else disabled).extend(paths)
+        output_paths = [resolve_path(p, output_dir) for p in outputs]
+        if binary:
+            output_paths += [npz_path(p) for p in output_paths if p.endswith(".csv")]
+        # Salidas de opciones desactivadas: no deben sobrevivir de otra corrida
+        for path in (resolve_path(p, output_dir) for p in disabled):
+            for stale in (path, npz_path(path)):
+                if os.path.exists(stale):
+                    os.remove(stale)
+
+        cached = cache.load(name, keys[name], output_paths) if cache else None
+        if cached is not None:
+            print(f"{name}: sin cambios en sus entradas, restaurado del cache")
+            results[name] = cached
+            continue
+
+        kwargs = {"output_dir": output_dir, "r_dir": r_dir, "combos": combos, "binary": binary}
+        kwargs.update(stage_options)
+        if stage["parallel"]:
+            kwargs["workers"] = workers
+        if cache and stage["incremental"]:
+            kwargs["memo"] = ComboMemo(
+                cache.cache_dir, name,
+                context=stage_key((name, source_hash, r_hashes[name], sorted(stage_options.items()))),
+                fingerprint=_combo_fingerprint(store, _memo_tables(name), combos_by_id),
+            )
+        results[name] = stage["run"](store, results, kwargs)
+        if cache:
+            cache.save(name, keys[name], results[name], output_paths)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Validacion Python en proceso (Etapas 1-5) con entradas explicitas."
+    )
+    parser.add_argument("homogeneity", help="CSV de homogeneidad")
+    parser.add_argument("stability", help="CSV de estabilidad")
+    parser.add_argument("summary", help="CSV summary de participantes")
+    parser.add_argument("--pt-data", default=None, help="CSV con u_i por participante (opcional)")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directorio de salidas")
+    parser.add_argument("--r-dir", default=DEFAULT_R_DIR, help="Directorio con los CSV *_r.csv")
+    parser.add_argument("--include", default=None, help="Patrones de combos a incluir (separados por comas)")
+    parser.add_argument("--exclude", default=None, help="Patrones de combos a excluir (separados por comas)")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para repartir combos (1 = serial)")
+    parser.add_argument("--cache-dir", default=None, help="Directorio del cache (defecto: <output-dir>/.cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Recalcular todas las etapas")
+    parser.add_argument("--binary", action="store_true", help="Escribir tambien salidas .npz tipadas")
+    parser.add_argument("--bootstrap", type=int, default=0, metavar="B",
+                        help="Remuestras bootstrap de u_xpt en la Etapa 4 (0 = desactivado)")
+    parser.add_argument("--loo", action="store_true",
+                        help="Influencia leave-one-out por participante en la Etapa 5")
+    parser.add_argument("--monte-carlo", type=int, default=0, metavar="M",
+                        help="Draws Monte Carlo de la cadena Etapas 4-5 (0 = desactivado)")
+    parser.add_argument("--mc-rho", type=float, default=0.0,
+                        help="Correlacion entre resultados de participantes en el Monte Carlo")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Semilla de corrida de los modos aleatorios (ver random_streams.py)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for path in (args.homogeneity, args.stability, args.summary):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No existe el archivo de entrada: {path}")
+    run_pipeline(
+        os.path.abspath(args.homogeneity),
+        os.path.abspath(args.stability),
+        os.path.abspath(args.summary),
+        pt_data_path=os.path.abspath(args.pt_data) if args.pt_data else None,
+        output_dir=os.path.abspath(args.output_dir),
+        r_dir=os.path.abspath(args.r_dir),
+        include=parse_combo_patterns(args.include),
+        exclude=parse_combo_patterns(args.exclude),
+        workers=args.workers,
+        cache_dir=os.path.abspath(args.cache_dir) if args.cache_dir else None,
+        use_cache=not args.no_cache,
+        binary=args.binary,
+        bootstrap=args.bootstrap,
+        seed=args.seed,
+        loo=args.loo,
+        monte_carlo=args.monte_carlo,
+        mc_rho=args.mc_rho,
+    )
+    print("\nValidación en proceso completada.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
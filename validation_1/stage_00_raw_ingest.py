@@ -0,0 +1,333 @@
+"""
+Etapa 0: Lectura de archivos crudos CALAIRE (Python)
+Validacion independiente de la lectura y limpieza previas a summary_n4.csv.
+
+Referencia: R/preprocessing/read_calaire_raw.R, clean_calaire_raw.R
+Fuente: data_use_cases/data/raw/datos_ronda_*_{p,r}.csv
+
+Uso:
+    python3 validation_1/stage_00_raw_ingest.py [ARCHIVOS_CRUDOS ...]
+
+Outputs:
+    outputs/stage_00_raw_ingest_py.csv (metricas por archivo)
+    outputs/stage_00_raw_ingest_log.csv (log de limpieza, mismo formato que R)
+    outputs/stage_00_raw/<archivo>.npz (marco tipado: timestamp datetime64 + floats)
+    outputs/stage_00_raw_ingest.csv (comparacion contra el log de R)
+    outputs/stage_00_raw_ingest_report.md
+
+Metricas por archivo:
+    n_raw_rows, n_clean_rows, n_timestamps_failed, n_duplicates, n_gaps,
+    na:<columna> (NA por columna numerica normalizada)
+
+El log de R (data/metadata/preprocesamiento_log_ronda.csv) corresponde a
+la ultima ronda procesada; sus conteos se comparan contra el archivo que
+indica su fila file_exists:ronda. Los demas archivos quedan como EDGE_CASE.
+Sin archivos crudos la etapa se reporta como SKIPPED (salida 2).
+"""
+
+import csv as csv_mod
+import glob
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from calaire_raw import clean_calaire_raw, read_calaire_raw
+from columnar_io import load_rows, npz_path, table_exists, write_columns_npz, write_npz
+from helpers import (
+    CANONICAL_COLS, STATUS_EDGE, STATUS_FAIL, STATUS_PASS, STATUS_SKIPPED, canonical_table,
+    resolve_path, write_canonical_csv,
+)
+
+RAW_GLOB = "../data_use_cases/data/raw/datos_ronda_*_[pr].csv"
+R_LOG_CSV = "../data_use_cases/data/metadata/preprocesamiento_log_ronda.csv"
+OUTPUT_PY_CSV = "outputs/stage_00_raw_ingest_py.csv"
+OUTPUT_LOG_CSV = "outputs/stage_00_raw_ingest_log.csv"
+OUTPUT_FRAMES_DIR = "outputs/stage_00_raw"
+OUTPUT_CSV = "outputs/stage_00_raw_ingest.csv"
+OUTPUT_REPORT = "outputs/stage_00_raw_ingest_report.md"
+
+COUNT_METRICS = [
+    "n_raw_rows", "n_clean_rows", "n_timestamps_failed", "n_duplicates", "n_gaps",
+]
+PY_FIELDS = [
+    "file", "delimiter", "has_units_row", "columns", "first_timestamp",
+    "last_timestamp",
+] + COUNT_METRICS + ["na_counts"]
+
+
+def file_id(path):
+    """Identificador de archivo crudo (nombre sin extension)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def ingest_file(path):
+    """Leer y limpiar un archivo crudo. Retorna (fila PY_FIELDS, metricas,
+    log, columnas tipadas)."""
+    raw = read_calaire_raw(path)
+    cleaned = clean_calaire_raw(raw)
+    table = cleaned["table"]
+    ts = table.columns["timestamp"]
+    valid = ts[~np.isnat(ts)]
+    log = cleaned["log"]
+
+    def _count(check, pattern):
+        for entry in log:
+            if entry["check"] == check:
+                match = re.match(pattern, entry["message"])
+                return int(match.group(1)) if match else 0
+        return 0
+
+    metrics = {
+        "n_raw_rows": raw["n_rows"],
+        "n_clean_rows": table.n_rows,
+        "n_timestamps_failed": int(np.isnat(ts).sum()),
+        "n_duplicates": _count("duplicate_timestamps", r"^(\d+) duplicate"),
+        "n_gaps": _count("minute_gaps", r"^(\d+) gaps"),
+    }
+    na_counts = {}
+    for name, col in table.columns.items():
+        if col.dtype.kind == "f":
+            na_counts[name] = int(np.isnan(col).sum())
+            metrics[f"na:{name}"] = na_counts[name]
+
+    row = {
+        "file": file_id(path),
+        "delimiter": raw["delimiter"],
+        "has_units_row": raw["has_units_row"],
+        "columns": ";".join(table.columns.keys()),
+        "first_timestamp": str(valid.min()) if valid.size else "",
+        "last_timestamp": str(valid.max()) if valid.size else "",
+        "na_counts": "; ".join(f"{k}:{v}" for k, v in na_counts.items()),
+    }
+    row.update({name: metrics[name] for name in COUNT_METRICS})
+    return row, metrics, log, table.columns
+
+
+def r_log_metrics(rows):
+    """Archivo y conteos del log de preprocesamiento de R.
+
+    Retorna (file_id o None, dict metrica -> valor) a partir de los textos
+    de row_counts, timestamp_parse, duplicate_timestamps, minute_gaps y
+    na_counts.
+    """
+    detail = {row["check"]: row["detail"] for row in rows}
+    source = detail.get("file_exists:ronda")
+    metrics = {}
+    match = re.search(r"raw=(\d+) clean=(\d+)", detail.get("row_counts", ""))
+    if match:
+        metrics["n_raw_rows"] = int(match.group(1))
+        metrics["n_clean_rows"] = int(match.group(2))
+    text = detail.get("timestamp_parse", "")
+    match = re.match(r"^(\d+) timestamps failed", text)
+    if match:
+        metrics["n_timestamps_failed"] = int(match.group(1))
+    elif text.startswith("All "):
+        metrics["n_timestamps_failed"] = 0
+    for check, name, pattern in (
+        ("duplicate_timestamps", "n_duplicates", r"^(\d+) duplicate"),
+        ("minute_gaps", "n_gaps", r"^(\d+) gaps"),
+    ):
+        if check in detail:
+            match = re.match(pattern, detail[check])
+            metrics[name] = int(match.group(1)) if match else 0
+    for item in detail.get("na_counts", "").split(";"):
+        name, _, count = item.strip().rpartition(":")
+        if name and count.strip().isdigit():
+            metrics[f"na:{name}"] = int(count)
+    return (file_id(source) if source else None), metrics
+
+
+def skip_stage(missing, out_csv, out_report):
+    """Etapa sin archivos crudos: filas SKIPPED en la comparacion canonica y
+    en el reporte, en lugar de una corrida vacia que pareceria PASS."""
+    for path in missing:
+        print(f"    ADVERTENCIA: {path} no encontrado; etapa OMITIDA (SKIPPED).")
+    rows = canonical_table(
+        {
+            "combo_id": "raw_ingest",
+            "pollutant": "",
+            "level": "",
+            "stage": "stage_00_raw_ingest",
+            "section": "input",
+            "metric": [os.path.basename(path) for path in missing],
+            "participant_id": "",
+        },
+        app=np.full(len(missing), np.nan), r=np.full(len(missing), np.nan),
+        python=np.full(len(missing), np.nan), tol=0.5,
+        notes=[f"no encontrado: {path}" for path in missing],
+    )
+    for row in rows:
+        row["status"] = STATUS_SKIPPED
+    os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
+    write_canonical_csv(rows, out_csv)
+
+    report_lines = [
+        "# Reporte: Etapa 0 — Lectura de archivos crudos",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        "",
+        "## Estado: SKIPPED",
+        "",
+        "No se valido la lectura de archivos crudos: faltan entradas.",
+    ]
+    report_lines.extend(f"- {path}" for path in missing)
+    report_lines.extend([
+        "",
+        "## Conclusion",
+        "Etapa OMITIDA (sin comparacion)",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+    print("Etapa 0: Lectura de archivos crudos — FIN (SKIPPED)")
+    return {"py_results": [], "rows": rows, "log": [], "skipped": True}
+
+
+def run_stage_00(raw_paths=None, output_dir=None, r_log=None, binary=False):
+    print("Etapa 0: Lectura de archivos crudos — INICIO")
+
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_log_csv = resolve_path(OUTPUT_LOG_CSV, output_dir)
+    out_frames = resolve_path(OUTPUT_FRAMES_DIR, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    r_log = r_log or R_LOG_CSV
+
+    if raw_paths is None:
+        raw_paths = sorted(glob.glob(RAW_GLOB))
+    missing = [path for path in raw_paths if not os.path.exists(path)] if raw_paths else [RAW_GLOB]
+    if missing:
+        return skip_stage(missing, out_csv, out_report)
+
+    py_results, log_rows, metrics_by_file = [], [], {}
+    for path in raw_paths:
+        fid = file_id(path)
+        print(f"  Procesando: {fid}")
+        row, metrics, log, columns = ingest_file(path)
+        py_results.append(row)
+        metrics_by_file[fid] = metrics
+        log_rows.extend({"file": fid, **entry} for entry in log)
+        write_columns_npz(os.path.join(out_frames, fid + ".npz"), columns)
+        print(
+            f"    filas={row['n_clean_rows']} {row['first_timestamp']} -> "
+            f"{row['last_timestamp']} huecos={row['n_gaps']}"
+        )
+
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
+    for path, rows, fields in (
+        (out_py_csv, py_results, PY_FIELDS),
+        (out_log_csv, log_rows, ["file", "check", "status", "message"]),
+    ):
+        with open(path, "w", newline="") as f:
+            writer = csv_mod.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        if binary:
+            write_npz(npz_path(path), rows, fields)
+    print(f"  Resultados Python guardados: {out_py_csv}")
+
+    # --- Comparacion contra el log de R ---
+    r_file, r_metrics = (None, {})
+    if table_exists(r_log):
+        r_file, r_metrics = r_log_metrics(load_rows(r_log))
+    else:
+        print(f"    ADVERTENCIA: {r_log} no encontrado.")
+
+    all_rows = []
+    edge_cases = []
+    for fid, metrics in metrics_by_file.items():
+        names = list(metrics)
+        has_r = fid == r_file
+        if has_r:
+            names += [m for m in r_metrics if m not in metrics]
+        else:
+            edge_cases.append(f"{fid}: sin log de R")
+        python = [float(metrics.get(m, float("nan"))) for m in names]
+        r_vals = [float(r_metrics.get(m, float("nan"))) if has_r else float("nan") for m in names]
+        rows = canonical_table(
+            {
+                "combo_id": fid,
+                "pollutant": "",
+                "level": "",
+                "stage": "stage_00_raw_ingest",
+                "section": "preprocessing",
+                "metric": names,
+                "participant_id": "",
+            },
+            app=np.full(len(names), np.nan), r=r_vals, python=python, tol=0.5,
+        )
+        for row, r_val, py_val in zip(rows, r_vals, python):
+            if not has_r:
+                row["status"] = STATUS_EDGE
+            elif np.isnan(r_val) != np.isnan(py_val):
+                row["status"] = STATUS_FAIL
+        all_rows.extend(rows)
+
+    write_canonical_csv(all_rows, out_csv)
+    if binary:
+        write_npz(npz_path(out_csv), all_rows, CANONICAL_COLS)
+
+    # --- Reporte ---
+    pass_count = sum(1 for r in all_rows if r["status"] == STATUS_PASS)
+    fail_count = sum(1 for r in all_rows if r["status"] == STATUS_FAIL)
+    edge_count = sum(1 for r in all_rows if r["status"] == STATUS_EDGE)
+
+    report_lines = [
+        "# Reporte: Etapa 0 — Lectura de archivos crudos",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        "",
+        "## Archivos procesados",
+        "",
+        "| Archivo | Delimitador | Filas | Inicio | Fin | Timestamps fallidos | Duplicados | Huecos |",
+        "|---|---|---:|---|---|---:|---:|---:|",
+    ]
+    for row in py_results:
+        report_lines.append(
+            f"| {row['file']} | {row['delimiter']} | {row['n_clean_rows']} | "
+            f"{row['first_timestamp']} | {row['last_timestamp']} | "
+            f"{row['n_timestamps_failed']} | {row['n_duplicates']} | {row['n_gaps']} |"
+        )
+    report_lines.extend([
+        "",
+        "## Resumen PASS/FAIL (contra log de R)",
+        f"- Log de R: {r_log} (archivo: {r_file or 'no identificado'})",
+        f"- PASS: {pass_count}",
+        f"- FAIL: {fail_count}",
+        f"- EDGE_CASE: {edge_count}",
+        "",
+    ])
+    fail_rows = [r for r in all_rows if r["status"] == STATUS_FAIL]
+    if fail_rows:
+        report_lines.append("## Detalle de FAIL")
+        for r in fail_rows:
+            report_lines.append(
+                f"- {r['combo_id']} {r['metric']}: R={r['r_value']} Py={r['python_value']}"
+            )
+        report_lines.append("")
+    if edge_cases:
+        report_lines.append("## Casos borde")
+        report_lines.extend(f"- {e}" for e in edge_cases)
+        report_lines.append("")
+    report_lines.extend([
+        "## Conclusion",
+        "Etapa PASS" if fail_count == 0 else "Etapa con FAIL pendientes de revision",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+
+    print("Etapa 0: Lectura de archivos crudos — FIN")
+    return {"py_results": py_results, "rows": all_rows, "log": log_rows, "skipped": False}
+
+
+if __name__ == "__main__":
+    result = run_stage_00(sys.argv[1:] or None)
+    if result["skipped"]:
+        sys.exit(2)
@@ -0,0 +1,324 @@
+"""
+Etapa 0b: Medias moviles horarias de estabilidad/homogeneidad (Python)
+Validacion independiente de las 60 medias moviles por bloque del diseno.
+
+Referencia: R/preprocessing/moving_hourly_means.R (paso 4 de pipeline_calaire.R)
+Fuente: data_use_cases/data/raw/datos_estabilidad_homogeneidad.csv
+Diseno: data_use_cases/data/metadata/diseno_estabilidad_homogeneidad.csv
+
+Uso:
+    python3 validation_1/stage_00b_moving_means.py [ARCHIVO_CRUDO [DISENO]]
+
+Outputs:
+    outputs/stage_00b_moving_means_py.csv (mismas columnas que
+        mm_estabilidad_homogeneidad.csv de R, incluidas valid_mm y
+        validation_flags)
+    outputs/stage_00b_moving_means.csv (comparacion canonica)
+    outputs/stage_00b_moving_means_report.md
+
+Si falta el archivo crudo o el diseno, la etapa no valida nada: escribe
+una fila por entrada faltante con estado SKIPPED en la comparacion
+canonica y en el reporte, y al ejecutarse como script termina con codigo
+de salida 2.
+
+Comparacion:
+    - contra data/processed/mm_estabilidad_homogeneidad.csv de R, si existe:
+      value, n_points y valid_mm por (run, window_index);
+    - contra data/metadata/preprocesamiento_log.csv: filas MM (row_counts
+      mm=), ventanas validas (mm_n60) y bloques con 60 MMs (mm_block_count).
+"""
+
+import csv as csv_mod
+import os
+import re
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from calaire_raw import clean_calaire_raw, read_calaire_raw
+from columnar_io import load_rows, npz_path, table_exists, write_npz
+from helpers import (
+    CANONICAL_COLS, STATUS_FAIL, STATUS_PASS, STATUS_SKIPPED, TOL_DEFAULT,
+    canonical_table, make_combo_id, resolve_path, write_canonical_csv,
+)
+from moving_means import MM_FIELDS, WINDOW, compute_moving_hourly_means
+
+RAW_CSV = "../data_use_cases/data/raw/datos_estabilidad_homogeneidad.csv"
+DESIGN_CSV = "../data_use_cases/data/metadata/diseno_estabilidad_homogeneidad.csv"
+R_MM_CSV = "../data_use_cases/data/processed/mm_estabilidad_homogeneidad.csv"
+R_LOG_CSV = "../data_use_cases/data/metadata/preprocesamiento_log.csv"
+OUTPUT_PY_CSV = "outputs/stage_00b_moving_means_py.csv"
+OUTPUT_CSV = "outputs/stage_00b_moving_means.csv"
+OUTPUT_REPORT = "outputs/stage_00b_moving_means_report.md"
+
+STAGE = "stage_00b_moving_means"
+COUNT_METRICS = ["mm_rows", "mm_valid_windows", "mm_valid_blocks"]
+
+
+def block_id(row):
+    """Identificador de bloque: combo + replica ("CO_0_rep2")."""
+    return f"{make_combo_id(row['pollutant'], row['level'])}_rep{row['replicate']}"
+
+
+def r_csv_value(value):
+    """Valor como lo escribe write.csv de R (TRUE/FALSE, NA)."""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "NA"
+    return value
+
+
+def mm_counts(rows):
+    """Conteos de los chequeos mm_n60 / mm_block_count / row_counts de R."""
+    valid = [r for r in rows if r["valid_mm"] in (True, "TRUE")]
+    per_block = {}
+    for r in valid:
+        per_block[r["sample_id"]] = per_block.get(r["sample_id"], 0) + 1
+    return {
+        "mm_rows": len(rows),
+        "mm_valid_windows": len(valid),
+        "mm_valid_blocks": sum(1 for n in per_block.values() if n == WINDOW),
+    }
+
+
+def r_log_counts(rows):
+    """Conteos MM del log de preprocesamiento de R (textos de los chequeos)."""
+    detail = {row["check"]: row["detail"] for row in rows}
+    metrics = {}
+    for check, name, pattern in (
+        ("row_counts", "mm_rows", r"mm=(\d+)"),
+        ("mm_n60", "mm_valid_windows", r"^(\d+) valid windows"),
+        ("mm_block_count", "mm_valid_blocks", r"^(\d+) blocks with exactly"),
+    ):
+        match = re.search(pattern, detail.get(check, ""))
+        if match:
+            metrics[name] = int(match.group(1))
+    return metrics
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def compare_mm_rows(py_rows, r_rows):
+    """Filas canonicas value / n_points / valid_mm por (run, window_index)."""
+    def _key(row):
+        return (str(row["run"]), str(r_csv_value(row["window_index"])))
+
+    r_by_key = {_key(row): row for row in r_rows}
+    meta = {name: [] for name in ("combo_id", "pollutant", "level", "metric")}
+    r_vals, py_vals, tols = [], [], []
+    for row in py_rows:
+        r_row = r_by_key.get(_key(row), {})
+        k = r_csv_value(row["window_index"])
+        r_valid = r_row.get("valid_mm")
+        for metric, py_val, r_val, tol in (
+            (f"value[{k}]", row["value"], _float(r_row.get("value")), TOL_DEFAULT),
+            (f"n_points[{k}]", row["n_points"], _float(r_row.get("n_points")), 0.5),
+            (f"valid_mm[{k}]", float(row["valid_mm"]),
+             float(r_valid in (True, "TRUE")) if r_row else float("nan"), 0.5),
+        ):
+            meta["combo_id"].append(block_id(row))
+            meta["pollutant"].append(row["pollutant"])
+            meta["level"].append(row["level"])
+            meta["metric"].append(metric)
+            py_vals.append(float(py_val))
+            r_vals.append(r_val)
+            tols.append(tol)
+    rows = canonical_table(
+        {**meta, "stage": STAGE, "section": "moving_means", "participant_id": ""},
+        app=np.full(len(py_vals), np.nan), r=r_vals, python=py_vals, tol=tols,
+    )
+    for row, r_val, py_val in zip(rows, r_vals, py_vals):
+        if np.isnan(r_val) != np.isnan(py_val):
+            row["status"] = STATUS_FAIL
+    return rows
+
+
+def skip_stage(missing, out_csv, out_report):
+    """Etapa sin entradas: filas SKIPPED en la comparacion canonica y en el
+    reporte, en lugar de una corrida vacia que pareceria PASS."""
+    warnings = [f"Not found: {path}" for path in missing]
+    for path in missing:
+        print(f"    ADVERTENCIA: {path} no encontrado; etapa OMITIDA (SKIPPED).")
+    rows = canonical_table(
+        {
+            "combo_id": "mm_estabilidad_homogeneidad",
+            "pollutant": "",
+            "level": "",
+            "stage": STAGE,
+            "section": "input",
+            "metric": [os.path.basename(path) for path in missing],
+            "participant_id": "",
+        },
+        app=np.full(len(missing), np.nan), r=np.full(len(missing), np.nan),
+        python=np.full(len(missing), np.nan), tol=TOL_DEFAULT,
+        notes=[f"no encontrado: {path}" for path in missing],
+    )
+    for row in rows:
+        row["status"] = STATUS_SKIPPED
+    write_canonical_csv(rows, out_csv)
+
+    report_lines = [
+        "# Reporte: Etapa 0b — Medias moviles horarias",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        "",
+        "## Estado: SKIPPED",
+        "",
+        "No se valido moving_hourly_means.R: faltan entradas.",
+    ]
+    report_lines.extend(f"- {path}" for path in missing)
+    report_lines.extend([
+        "",
+        "## Conclusion",
+        "Etapa OMITIDA (sin comparacion)",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+    print("Etapa 0b: Medias moviles horarias — FIN (SKIPPED)")
+    return {"py_results": [], "rows": rows, "warnings": warnings, "skipped": True}
+
+
+def run_stage_00b(raw_path=None, design_path=None, output_dir=None, r_mm=None,
+                  r_log=None, binary=False):
+    print("Etapa 0b: Medias moviles horarias — INICIO")
+
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    raw_path = raw_path or RAW_CSV
+    design_path = design_path or DESIGN_CSV
+    r_mm = r_mm or R_MM_CSV
+    r_log = r_log or R_LOG_CSV
+
+    missing = [path for path in (raw_path, design_path) if not os.path.exists(path)]
+    if missing:
+        return skip_stage(missing, out_csv, out_report)
+
+    cleaned = clean_calaire_raw(read_calaire_raw(raw_path))
+    with open(design_path, "r", newline="", encoding="utf-8") as f:
+        design = list(csv_mod.DictReader(f))
+    py_rows, warnings = compute_moving_hourly_means(cleaned["table"].columns, design)
+    for w in warnings:
+        print(f"    ADVERTENCIA: {w}")
+    counts = mm_counts(py_rows)
+    print(
+        f"  Bloques: {len(design)} | Ventanas validas: {counts['mm_valid_windows']} "
+        f"| Filas MM: {counts['mm_rows']}"
+    )
+
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
+    with open(out_py_csv, "w", newline="") as f:
+        writer = csv_mod.DictWriter(f, fieldnames=MM_FIELDS)
+        writer.writeheader()
+        writer.writerows({k: r_csv_value(v) for k, v in row.items()} for row in py_rows)
+    if binary:
+        write_npz(npz_path(out_py_csv), py_rows, MM_FIELDS)
+    print(f"  Resultados Python guardados: {out_py_csv}")
+
+    # --- Comparacion contra R ---
+    all_rows = []
+    if table_exists(r_mm):
+        all_rows.extend(compare_mm_rows(py_rows, load_rows(r_mm)))
+    else:
+        print(f"    ADVERTENCIA: {r_mm} no encontrado; solo se comparan conteos.")
+
+    r_counts = r_log_counts(load_rows(r_log)) if table_exists(r_log) else {}
+    if not r_counts:
+        print(f"    ADVERTENCIA: sin conteos MM en {r_log}.")
+    count_rows = canonical_table(
+        {
+            "combo_id": "mm_estabilidad_homogeneidad",
+            "pollutant": "",
+            "level": "",
+            "stage": STAGE,
+            "section": "preprocessing",
+            "metric": COUNT_METRICS,
+            "participant_id": "",
+        },
+        app=np.full(len(COUNT_METRICS), np.nan),
+        r=[float(r_counts.get(m, float("nan"))) for m in COUNT_METRICS],
+        python=[float(counts[m]) for m in COUNT_METRICS],
+        tol=0.5,
+    )
+    for row in count_rows:
+        if np.isnan(row["r_value"]):
+            row["status"] = STATUS_FAIL
+    all_rows.extend(count_rows)
+
+    write_canonical_csv(all_rows, out_csv)
+    if binary:
+        write_npz(npz_path(out_csv), all_rows, CANONICAL_COLS)
+
+    # --- Reporte ---
+    pass_count = sum(1 for r in all_rows if r["status"] == STATUS_PASS)
+    fail_count = sum(1 for r in all_rows if r["status"] == STATUS_FAIL)
+
+    report_lines = [
+        "# Reporte: Etapa 0b — Medias moviles horarias",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        f"**Archivo crudo**: {raw_path}",
+        f"**Diseno**: {design_path}",
+        "",
+        "## Bloques",
+        "",
+        "| Run | Bloque | Columna | Inicio | Fin | MMs validas | Flags |",
+        "|---:|---|---|---|---|---:|---|",
+    ]
+    by_run = {}
+    for row in py_rows:
+        by_run.setdefault(row["run"], []).append(row)
+    for run, rows in by_run.items():
+        d = design[run - 1]
+        report_lines.append(
+            f"| {run} | {block_id(d)} | {d['source_column']} | {d['start_timestamp']} | "
+            f"{d['end_timestamp']} | {sum(1 for r in rows if r['valid_mm'])} | "
+            f"{rows[0]['validation_flags']} |"
+        )
+    report_lines.extend([
+        "",
+        "## Resumen PASS/FAIL",
+        f"- MM de R: {r_mm if table_exists(r_mm) else 'no disponible (solo conteos del log)'}",
+        f"- PASS: {pass_count}",
+        f"- FAIL: {fail_count}",
+        "",
+    ])
+    fail_rows = [r for r in all_rows if r["status"] == STATUS_FAIL]
+    if fail_rows:
+        report_lines.append("## Detalle de FAIL")
+        for r in fail_rows[:50]:
+            report_lines.append(
+                f"- {r['combo_id']} {r['metric']}: R={r['r_value']} Py={r['python_value']}"
+            )
+        report_lines.append("")
+    if warnings:
+        report_lines.append("## Advertencias")
+        report_lines.extend(f"- {w}" for w in warnings)
+        report_lines.append("")
+    report_lines.extend([
+        "## Conclusion",
+        "Etapa PASS" if fail_count == 0 else "Etapa con FAIL pendientes de revision",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+
+    print("Etapa 0b: Medias moviles horarias — FIN")
+    return {"py_results": py_rows, "rows": all_rows, "warnings": warnings, "skipped": False}
+
+
+if __name__ == "__main__":
+    result = run_stage_00b(*sys.argv[1:3])
+    if result["skipped"]:
+        sys.exit(2)
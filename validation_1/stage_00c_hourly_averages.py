@@ -0,0 +1,276 @@
+"""
+Etapa 0c: Promedios horarios de ronda (Python)
+Validacion independiente de h_ronda_*_r.csv y h_ronda_*_p_ronda.csv.
+
+Referencia: R/preprocessing/hourly_averages.R
+    (compute_hourly_averages_ronda, compute_hourly_averages_participant_ronda)
+Fuente: data_use_cases/data/raw/datos_ronda_*_{p,r}.csv
+Niveles: data_use_cases/data/metadata/niveles_calaire.csv
+
+Uso:
+    python3 validation_1/stage_00c_hourly_averages.py [ARCHIVOS_CRUDOS ...]
+
+Outputs:
+    outputs/stage_00c_hourly_averages_py.csv (horas de todos los archivos,
+        columnas de R + file)
+    outputs/stage_00c_hourly_averages.csv (comparacion canonica)
+    outputs/stage_00c_hourly_averages_report.md
+
+Las horas se emparejan con las de R por (contaminante, instrumento,
+hour_start); se comparan generated_nominal, generated_mean, generated_sd,
+mean_value, sd_value, u_value, n y valid_hour. Ambos lados estan
+redondeados a 3 decimales, por lo que la tolerancia es TOL_DEFAULT.
+
+Si un archivo de participante no trae la columna del generador, el nivel
+se toma del archivo de referencia de la misma ronda (datos_ronda_X_r.csv),
+alineado por timestamp.
+
+Sin archivos crudos o sin el archivo de niveles la etapa se reporta como
+SKIPPED (salida 2).
+"""
+
+import csv as csv_mod
+import glob
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from calaire_raw import clean_calaire_raw, read_calaire_raw
+from columnar_io import load_rows, npz_path, table_exists, write_npz
+from helpers import (
+    CANONICAL_COLS, STATUS_FAIL, STATUS_PASS, STATUS_SKIPPED, TOL_DEFAULT, canonical_table,
+    make_combo_id, resolve_path, write_canonical_csv,
+)
+from hourly_averages import HOURLY_FIELDS, hourly_rows, participant_tokens
+
+RAW_GLOB = "../data_use_cases/data/raw/datos_ronda_*_[pr].csv"
+LEVELS_CSV = "../data_use_cases/data/metadata/niveles_calaire.csv"
+R_PROCESSED_DIR = "../data_use_cases/data/processed"
+OUTPUT_PY_CSV = "outputs/stage_00c_hourly_averages_py.csv"
+OUTPUT_CSV = "outputs/stage_00c_hourly_averages.csv"
+OUTPUT_REPORT = "outputs/stage_00c_hourly_averages_report.md"
+
+STAGE = "stage_00c_hourly_averages"
+COMPARE_FIELDS = [
+    "generated_nominal", "generated_mean", "generated_sd", "mean_value",
+    "sd_value", "u_value", "n", "valid_hour",
+]
+
+
+def file_id(path):
+    """Identificador de archivo crudo (nombre sin extension)."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def r_hourly_path(fid, processed_dir=None):
+    """Salida horaria de R de un archivo crudo: datos_ronda_1_r ->
+    h_ronda_1_r.csv, datos_ronda_1_p -> h_ronda_1_p_ronda.csv."""
+    name = "h_" + fid[len("datos_"):] if fid.startswith("datos_") else "h_" + fid
+    if name.endswith("_p"):
+        name += "_ronda"
+    return os.path.join(processed_dir or R_PROCESSED_DIR, name + ".csv")
+
+
+def _hour_key(row):
+    return (row["pollutant"], row["instrument"], row["hour_start"])
+
+
+def _float(value):
+    if value in (True, "TRUE"):
+        return 1.0
+    if value in (False, "FALSE"):
+        return 0.0
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def compare_hours(fid, py_rows, r_rows):
+    """Filas canonicas por hora y campo (union de horas de R y Python)."""
+    py_by_key = {_hour_key(r): r for r in py_rows}
+    r_by_key = {_hour_key(r): r for r in r_rows}
+    keys = list(r_by_key) + [k for k in py_by_key if k not in r_by_key]
+
+    meta = {name: [] for name in ("combo_id", "pollutant", "level", "metric", "participant_id")}
+    r_vals, py_vals = [], []
+    for key in keys:
+        py_row, r_row = py_by_key.get(key, {}), r_by_key.get(key, {})
+        ref = py_row or r_row
+        for field in COMPARE_FIELDS:
+            meta["combo_id"].append(make_combo_id(ref["pollutant"], ref["level"]))
+            meta["pollutant"].append(ref["pollutant"])
+            meta["level"].append(ref["level"])
+            meta["metric"].append(f"{field}@{ref['hour_start']}")
+            meta["participant_id"].append(ref["instrument"])
+            py_vals.append(_float(py_row.get(field)))
+            r_vals.append(_float(r_row.get(field)))
+    rows = canonical_table(
+        {**meta, "stage": STAGE, "section": fid},
+        app=np.full(len(py_vals), np.nan), r=r_vals, python=py_vals, tol=TOL_DEFAULT,
+    )
+    for row, r_val, py_val in zip(rows, r_vals, py_vals):
+        if np.isnan(r_val) != np.isnan(py_val):
+            row["status"] = STATUS_FAIL
+    return rows
+
+
+def skip_stage(missing, out_csv, out_report):
+    """Etapa sin archivos crudos o sin niveles: filas SKIPPED en la
+    comparacion canonica y en el reporte, en lugar de fallar al abrir."""
+    for path in missing:
+        print(f"    ADVERTENCIA: {path} no encontrado; etapa OMITIDA (SKIPPED).")
+    rows = canonical_table(
+        {
+            "combo_id": "hourly_averages",
+            "pollutant": "",
+            "level": "",
+            "stage": STAGE,
+            "section": "input",
+            "metric": [os.path.basename(path) for path in missing],
+            "participant_id": "",
+        },
+        app=np.full(len(missing), np.nan), r=np.full(len(missing), np.nan),
+        python=np.full(len(missing), np.nan), tol=TOL_DEFAULT,
+        notes=[f"no encontrado: {path}" for path in missing],
+    )
+    for row in rows:
+        row["status"] = STATUS_SKIPPED
+    os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
+    write_canonical_csv(rows, out_csv)
+
+    report_lines = [
+        "# Reporte: Etapa 0c — Promedios horarios de ronda",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        "",
+        "## Estado: SKIPPED",
+        "",
+        "No se calcularon promedios horarios: faltan archivos de entrada.",
+    ]
+    report_lines.extend(f"- {path}" for path in missing)
+    report_lines.extend([
+        "",
+        "## Conclusion",
+        "Etapa OMITIDA (sin comparacion)",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+    print("Etapa 0c: Promedios horarios de ronda — FIN (SKIPPED)")
+    return {"py_results": [], "rows": rows, "skipped": True}
+
+
+def run_stage_00c(raw_paths=None, output_dir=None, levels_path=None,
+                  processed_dir=None, binary=False):
+    print("Etapa 0c: Promedios horarios de ronda — INICIO")
+
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    levels_path = levels_path or LEVELS_CSV
+
+    if raw_paths is None:
+        raw_paths = sorted(glob.glob(RAW_GLOB))
+    missing = [path for path in raw_paths if not os.path.exists(path)] if raw_paths else [RAW_GLOB]
+    if not os.path.exists(levels_path):
+        missing.append(levels_path)
+    if missing:
+        return skip_stage(missing, out_csv, out_report)
+    with open(levels_path, "r", newline="", encoding="utf-8") as f:
+        levels = list(csv_mod.DictReader(f))
+
+    frames = {
+        file_id(path): clean_calaire_raw(read_calaire_raw(path))["table"].columns
+        for path in raw_paths
+    }
+
+    py_results, all_rows, summary = [], [], []
+    for fid, columns in frames.items():
+        if fid.endswith("_p"):
+            ref_columns = frames.get(fid[:-2] + "_r")
+            rows = []
+            for token in participant_tokens(columns):
+                rows.extend(hourly_rows(columns, levels, token, ref_columns))
+        else:
+            rows = hourly_rows(columns, levels)
+        py_results.extend({"file": fid, **row} for row in rows)
+
+        r_path = r_hourly_path(fid, processed_dir)
+        if table_exists(r_path):
+            compared = compare_hours(fid, rows, load_rows(r_path))
+        else:
+            print(f"    ADVERTENCIA: {r_path} no encontrado.")
+            compared = []
+        all_rows.extend(compared)
+        n_fail = sum(1 for r in compared if r["status"] == STATUS_FAIL)
+        summary.append((fid, len(rows), sum(1 for r in rows if r["valid_hour"]),
+                        os.path.basename(r_path) if compared else "-", n_fail))
+        print(f"  {fid}: horas={len(rows)} FAIL={n_fail}")
+
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
+    fields = ["file"] + HOURLY_FIELDS
+    with open(out_py_csv, "w", newline="") as f:
+        writer = csv_mod.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(py_results)
+    if binary:
+        write_npz(npz_path(out_py_csv), py_results, fields)
+    print(f"  Resultados Python guardados: {out_py_csv}")
+
+    write_canonical_csv(all_rows, out_csv)
+    if binary:
+        write_npz(npz_path(out_csv), all_rows, CANONICAL_COLS)
+
+    # --- Reporte ---
+    pass_count = sum(1 for r in all_rows if r["status"] == STATUS_PASS)
+    fail_count = sum(1 for r in all_rows if r["status"] == STATUS_FAIL)
+
+    report_lines = [
+        "# Reporte: Etapa 0c — Promedios horarios de ronda",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        "",
+        "## Archivos",
+        "",
+        "| Archivo | Horas | Validas | Salida R | FAIL |",
+        "|---|---:|---:|---|---:|",
+    ]
+    for fid, n_hours, n_valid, r_name, n_fail in summary:
+        report_lines.append(f"| {fid} | {n_hours} | {n_valid} | {r_name} | {n_fail} |")
+    report_lines.extend([
+        "",
+        "## Resumen PASS/FAIL",
+        f"- PASS: {pass_count}",
+        f"- FAIL: {fail_count}",
+        "",
+    ])
+    fail_rows = [r for r in all_rows if r["status"] == STATUS_FAIL]
+    if fail_rows:
+        report_lines.append("## Detalle de FAIL")
+        for r in fail_rows[:50]:
+            report_lines.append(
+                f"- {r['section']} {r['combo_id']} {r['participant_id']} {r['metric']}: "
+                f"R={r['r_value']} Py={r['python_value']}"
+            )
+        report_lines.append("")
+    report_lines.extend([
+        "## Conclusion",
+        "Etapa PASS" if fail_count == 0 else "Etapa con FAIL pendientes de revision",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+
+    print("Etapa 0c: Promedios horarios de ronda — FIN")
+    return {"py_results": py_results, "rows": all_rows, "skipped": False}
+
+
+if __name__ == "__main__":
+    if run_stage_00c(sys.argv[1:] or None)["skipped"]:
+        sys.exit(2)
@@ -0,0 +1,334 @@
+"""
+Etapa 0d: Generador bootstrap de homogeneidad/estabilidad (Python)
+Regenera los datasets bootstrap y sus registros a partir de los minutos de
+referencia de cada ronda, y valida los registros de R.
+
+Referencia: session_outputs/adicionales/build_bootstrap_homogeneity_stability.R
+Fuente: data_use_cases/data/raw/datos_ronda_*_r.csv
+
+Uso:
+    python3 validation_1/stage_00d_bootstrap_register.py [ARCHIVOS ...]
+        [--seed 13528] [--datasets 20] [--workers N]
+
+Outputs (por archivo, prefijo ronda_X como en R):
+    outputs/stage_00d_bootstrap/<prefijo>_homogeneidad.csv
+    outputs/stage_00d_bootstrap/<prefijo>_estabilidad.csv
+    outputs/stage_00d_bootstrap/<prefijo>_bootstrap_register.csv
+    outputs/stage_00d_bootstrap/<prefijo>_bootstrap_hourly_datasets.csv
+    outputs/stage_00d_bootstrap/<prefijo>_bootstrap_minute_simulations.csv
+    outputs/stage_00d_bootstrap_register.csv (comparacion canonica)
+    outputs/stage_00d_bootstrap_register_report.md
+
+Comparacion contra R (el RNG de R no se reproduce, ver bootstrap_register.py):
+    - minute_pool_n por pool contra el registro de R cuyo input_path
+      coincide con el archivo;
+    - si existe <prefijo>_bootstrap_minute_simulations.csv de R, cada
+      dataset de R se reconstruye con los minutos del pool Python (por
+      source_timestamp) y su round(mean, 3) se compara con el valor
+      registrado por R (replay).
+Sin archivos crudos la etapa se reporta como SKIPPED (salida 2).
+"""
+
+import argparse
+import csv as csv_mod
+import glob
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bootstrap_register import (
+    HOURLY_FIELDS, MINUTE_FIELDS, N_DATASETS, REGISTER_FIELDS, STUDY_FIELDS,
+    bootstrap_pools, hourly_rows, make_assignment, minute_pools, minute_rows,
+    reference_specs, register_rows,
+)
+from calaire_raw import clean_calaire_raw, read_calaire_raw
+from columnar_io import load_rows, npz_path, write_npz
+from helpers import (
+    CANONICAL_COLS, STATUS_FAIL, STATUS_PASS, STATUS_SKIPPED, TOL_DEFAULT, canonical_table,
+    make_combo_id, map_combos, resolve_path, write_canonical_csv,
+)
+from hourly_averages import mean_rows_r, round_r
+from random_streams import DEFAULT_SEED
+
+RAW_GLOB = "../data_use_cases/data/raw/datos_ronda_*_r.csv"
+R_METADATA_DIR = "../data_use_cases/data/metadata"
+R_PROCESSED_DIR = "../data_use_cases/data/processed"
+OUTPUT_DIR = "outputs/stage_00d_bootstrap"
+OUTPUT_CSV = "outputs/stage_00d_bootstrap_register.csv"
+OUTPUT_REPORT = "outputs/stage_00d_bootstrap_register_report.md"
+
+STAGE = "stage_00d_bootstrap_register"
+
+
+def output_prefix(path):
+    """Prefijo de salida como derive_output_prefix de R (datos_ronda_2a_r -> ronda_2a)."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if stem.startswith("datos_"):
+        stem = stem[len("datos_"):]
+    if stem.endswith(("_r", "_p")):
+        stem = stem[:-2]
+    return stem
+
+
+def find_r_register(input_path, metadata_dir=None):
+    """Registro bootstrap de R cuyo input_path apunta al mismo archivo."""
+    name = os.path.basename(input_path)
+    for path in sorted(glob.glob(os.path.join(metadata_dir or R_METADATA_DIR, "bootstrap_*register*.csv"))):
+        rows = load_rows(path)
+        if rows and os.path.basename(rows[0].get("input_path", "")) == name:
+            return path, rows
+    return None, []
+
+
+def _write_csv(path, rows, fields):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv_mod.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _pool_id(row):
+    return (row["pollutant"], row["run"], row["level"])
+
+
+def replay_r_datasets(pools, r_minutes):
+    """Valor horario de cada dataset de R reconstruido con los pools Python.
+
+    Retorna {(pollutant, run, level, dataset_id): (valor, minutos sin
+    coincidencia en el pool)}.
+    """
+    lookup = {}
+    for pool in pools:
+        stamps = np.char.replace(
+            np.datetime_as_string(pool["timestamps"].astype("datetime64[s]"), unit="s"), "T", " "
+        ).tolist()
+        lookup[_pool_id(pool)] = dict(zip(stamps, pool["values"].tolist()))
+    grouped = {}
+    for row in r_minutes:
+        key = _pool_id(row) + (int(float(row["dataset_id"])),)
+        grouped.setdefault(key, []).append(row["source_timestamp"])
+    replay = {}
+    for key, stamps in grouped.items():
+        minutes = lookup.get(key[:3], {})
+        values = np.array([minutes.get(s, np.nan) for s in stamps])
+        missing = int(np.isnan(values).sum())
+        value = float(round_r(mean_rows_r(values))) if missing == 0 else float("nan")
+        replay[key] = (value, missing)
+    return replay
+
+
+def compare_with_r(fid, pools, results, r_register, r_minutes):
+    """Filas canonicas: minute_pool_n por pool y replay de los datasets de R."""
+    py_pool_n = {_pool_id(res["pool"]): res["minute_pool_n"] for res in results}
+    r_pool_n, r_values = {}, {}
+    for row in r_register:
+        r_pool_n[_pool_id(row)] = float(row["minute_pool_n"])
+        r_values[_pool_id(row) + (int(float(row["dataset_id"])),)] = float(row["value"])
+
+    meta = {name: [] for name in ("combo_id", "pollutant", "level", "metric")}
+    r_vals, py_vals, tols = [], [], []
+
+    def _add(pool_id, metric, r_val, py_val, tol):
+        meta["combo_id"].append(make_combo_id(pool_id[0], pool_id[2]))
+        meta["pollutant"].append(pool_id[0])
+        meta["level"].append(pool_id[2])
+        meta["metric"].append(metric)
+        r_vals.append(r_val)
+        py_vals.append(py_val)
+        tols.append(tol)
+
+    for pool_id in list(r_pool_n) + [p for p in py_pool_n if p not in r_pool_n]:
+        _add(pool_id, f"minute_pool_n@{pool_id[1]}", r_pool_n.get(pool_id, float("nan")),
+             float(py_pool_n.get(pool_id, float("nan"))), 0.5)
+    if r_minutes:
+        replay = replay_r_datasets(pools, r_minutes)
+        for key, (value, missing) in replay.items():
+            if key not in r_values:
+                continue
+            _add(key[:3], f"replay_value@{key[1]}#{key[3]}", r_values[key], value, TOL_DEFAULT)
+            _add(key[:3], f"replay_missing_minutes@{key[1]}#{key[3]}", 0.0, float(missing), 0.5)
+
+    rows = canonical_table(
+        {**meta, "stage": STAGE, "section": fid, "participant_id": ""},
+        app=np.full(len(py_vals), np.nan), r=r_vals, python=py_vals, tol=tols,
+    )
+    for row, r_val, py_val in zip(rows, r_vals, py_vals):
+        if np.isnan(r_val) != np.isnan(py_val):
+            row["status"] = STATUS_FAIL
+    return rows
+
+
+def skip_stage(missing, out_csv, out_report):
+    """Etapa sin archivos crudos: filas SKIPPED en la comparacion canonica y
+    en el reporte, en lugar de una corrida vacia que pareceria PASS."""
+    for path in missing:
+        print(f"    ADVERTENCIA: {path} no encontrado; etapa OMITIDA (SKIPPED).")
+    rows = canonical_table(
+        {
+            "combo_id": "bootstrap_register",
+            "pollutant": "",
+            "level": "",
+            "stage": STAGE,
+            "section": "input",
+            "metric": [os.path.basename(path) for path in missing],
+            "participant_id": "",
+        },
+        app=np.full(len(missing), np.nan), r=np.full(len(missing), np.nan),
+        python=np.full(len(missing), np.nan), tol=TOL_DEFAULT,
+        notes=[f"no encontrado: {path}" for path in missing],
+    )
+    for row in rows:
+        row["status"] = STATUS_SKIPPED
+    os.makedirs(os.path.dirname(out_csv) or ".", exist_ok=True)
+    write_canonical_csv(rows, out_csv)
+
+    report_lines = [
+        "# Reporte: Etapa 0d — Generador bootstrap homogeneidad/estabilidad",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        "",
+        "## Estado: SKIPPED",
+        "",
+        "No se generaron datasets bootstrap: faltan archivos crudos.",
+    ]
+    report_lines.extend(f"- {path}" for path in missing)
+    report_lines.extend([
+        "",
+        "## Conclusion",
+        "Etapa OMITIDA (sin comparacion)",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+    print("Etapa 0d: Generador bootstrap homogeneidad/estabilidad — FIN (SKIPPED)")
+    return {"rows": rows, "skipped": True}
+
+
+def run_stage_00d(raw_paths=None, output_dir=None, seed=DEFAULT_SEED,
+                  n_datasets=N_DATASETS, workers=1, metadata_dir=None,
+                  processed_dir=None, binary=False):
+    print("Etapa 0d: Generador bootstrap homogeneidad/estabilidad — INICIO")
+
+    out_dir = resolve_path(OUTPUT_DIR, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+
+    if raw_paths is None:
+        raw_paths = sorted(glob.glob(RAW_GLOB))
+    missing = [path for path in raw_paths if not os.path.exists(path)] if raw_paths else [RAW_GLOB]
+    if missing:
+        return skip_stage(missing, out_csv, out_report)
+    assignment = make_assignment(n_datasets)
+
+    all_rows, summary = [], []
+    for path in raw_paths:
+        prefix = output_prefix(path)
+        fid = os.path.splitext(os.path.basename(path))[0]
+        columns = clean_calaire_raw(read_calaire_raw(path))["table"].columns
+        pools = minute_pools(columns, reference_specs(columns))
+        results = map_combos(bootstrap_pools, pools, workers=workers, args=(n_datasets, seed))
+
+        hourly = hourly_rows(results)
+        register, studies = register_rows(hourly, assignment, path, seed)
+        outputs = (
+            (f"{prefix}_homogeneidad.csv", studies["homogeneity"], STUDY_FIELDS),
+            (f"{prefix}_estabilidad.csv", studies["stability"], STUDY_FIELDS),
+            (f"{prefix}_bootstrap_register.csv", register, REGISTER_FIELDS),
+            (f"{prefix}_bootstrap_hourly_datasets.csv", hourly, HOURLY_FIELDS),
+            (f"{prefix}_bootstrap_minute_simulations.csv", minute_rows(results), MINUTE_FIELDS),
+        )
+        for name, rows, fields in outputs:
+            _write_csv(os.path.join(out_dir, name), rows, fields)
+            if binary:
+                write_npz(npz_path(os.path.join(out_dir, name)), rows, fields)
+
+        r_path, r_register = find_r_register(path, metadata_dir)
+        r_minutes_path = os.path.join(
+            processed_dir or R_PROCESSED_DIR, f"{prefix}_bootstrap_minute_simulations.csv"
+        )
+        r_minutes = load_rows(r_minutes_path) if os.path.exists(r_minutes_path) else []
+        compared = compare_with_r(fid, pools, results, r_register, r_minutes) if r_register else []
+        if not r_register:
+            print(f"    ADVERTENCIA: sin registro de R para {os.path.basename(path)}")
+        all_rows.extend(compared)
+        n_fail = sum(1 for r in compared if r["status"] == STATUS_FAIL)
+        summary.append((
+            fid, len(pools), len(hourly), os.path.basename(r_path) if r_path else "-",
+            "si" if r_minutes else "no", n_fail,
+        ))
+        print(f"  {fid}: pools={len(pools)} datasets={len(hourly)} FAIL={n_fail}")
+
+    write_canonical_csv(all_rows, out_csv)
+    if binary:
+        write_npz(npz_path(out_csv), all_rows, CANONICAL_COLS)
+
+    # --- Reporte ---
+    pass_count = sum(1 for r in all_rows if r["status"] == STATUS_PASS)
+    fail_count = sum(1 for r in all_rows if r["status"] == STATUS_FAIL)
+
+    report_lines = [
+        "# Reporte: Etapa 0d — Generador bootstrap homogeneidad/estabilidad",
+        "",
+        f"**Fecha**: {__import__('datetime').date.today()}",
+        f"**Semilla**: {seed} (un flujo SeedSequence por pool; independiente de --workers)",
+        f"**Datasets por pool**: {n_datasets}",
+        "",
+        "## Archivos",
+        "",
+        "| Archivo | Pools | Datasets | Registro R | Replay minutos R | FAIL |",
+        "|---|---:|---:|---|---|---:|",
+    ]
+    for fid, n_pools, n_hourly, r_name, replay, n_fail in summary:
+        report_lines.append(f"| {fid} | {n_pools} | {n_hourly} | {r_name} | {replay} | {n_fail} |")
+    report_lines.extend([
+        "",
+        "## Resumen PASS/FAIL",
+        f"- PASS: {pass_count}",
+        f"- FAIL: {fail_count}",
+        "",
+        "Los valores bootstrap de Python no se comparan uno a uno con los de R: el",
+        "generador de R (Mersenne-Twister + sample) no se reproduce. Se validan los",
+        "pools y, donde R guardo sus minutos simulados, el valor de cada dataset de R.",
+        "",
+    ])
+    fail_rows = [r for r in all_rows if r["status"] == STATUS_FAIL]
+    if fail_rows:
+        report_lines.append("## Detalle de FAIL")
+        for r in fail_rows[:50]:
+            report_lines.append(
+                f"- {r['section']} {r['combo_id']} {r['metric']}: R={r['r_value']} Py={r['python_value']}"
+            )
+        report_lines.append("")
+    report_lines.extend([
+        "## Conclusion",
+        "Etapa PASS" if fail_count == 0 else "Etapa con FAIL pendientes de revision",
+        "",
+    ])
+    with open(out_report, "w") as f:
+        f.write("\n".join(report_lines))
+    print(f"  Reporte escrito: {out_report}")
+
+    print("Etapa 0d: Generador bootstrap homogeneidad/estabilidad — FIN")
+    return {"rows": all_rows, "skipped": False}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador bootstrap de homogeneidad/estabilidad")
+    parser.add_argument("raw_paths", nargs="*", help=f"Archivos crudos de referencia (defecto: {RAW_GLOB})")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Semilla de corrida")
+    parser.add_argument("--datasets", type=int, default=N_DATASETS, help="Datasets por pool")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para repartir los pools")
+    args = parser.parse_args()
+    result = run_stage_00d(args.raw_paths or None, seed=args.seed, n_datasets=args.datasets,
+                           workers=args.workers)
+    if result["skipped"]:
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
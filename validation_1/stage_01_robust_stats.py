@@ -4,12 +4,20 @@ Validacion de mediana, MAD, MADe y nIQR.
 
 Referencia: ISO 13528:2022, Seccion 9.4
 Fuente: data/for_validation/summary_n4.csv
-Alcance: O3 en 3 niveles (0, 80, 180 nmol/mol)
+Alcance: todos los combos (contaminante, nivel) presentes en summary
+(filtrables con include/exclude); la referencia R cubre O3 en 3 niveles
 """
 
 import csv
 import math
 import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from columnar_io import load_rows, npz_path, table_exists, write_npz
+from data_store import load_data_store
+from helpers import discover_combos, map_combos, pad_rows, resolve_path, robust_stats_rows
 
 DATA_SUMMARY = "../data/for_validation/summary_n4.csv"
 R_CSV = "validation_1/outputs/stage_01_robust_stats_r.csv"
@@ -17,76 +25,30 @@ OUTPUT_PY_CSV = "validation_1/outputs/stage_01_robust_stats_py.csv"
 OUTPUT_CSV = "validation_1/outputs/stage_01_robust_stats.csv"
 OUTPUT_REPORT = "validation_1/outputs/stage_01_robust_stats_report.md"
 
-TARGET_COMBOS = [
-    {"pollutant": "o3", "level": "0-nmol/mol"},
-    {"pollutant": "o3", "level": "80-nmol/mol"},
-    {"pollutant": "o3", "level": "180-nmol/mol"},
-]
-
 TOL_DEFAULT = 1e-9
 STATUS_PASS = "PASS"
 STATUS_FAIL = "FAIL"
+STATUS_EDGE = "EDGE_CASE"
+STATUS_KNOWN_DISC = "KNOWN_DISCREPANCY"
 
 
 def make_combo_id(pollutant, level):
     return f"{pollutant.upper()}_{level.split('-')[0]}"
 
 
-def median(values):
-    vals = sorted(v for v in values if math.isfinite(v))
-    n = len(vals)
-    if n == 0:
-        return float("nan")
-    mid = n // 2
-    if n % 2:
-        return vals[mid]
-    return (vals[mid - 1] + vals[mid]) / 2.0
-
-
-def quantile_type7(values, prob):
-    vals = sorted(v for v in values if math.isfinite(v))
-    n = len(vals)
-    if n == 0:
-        return float("nan")
-    if n == 1:
-        return vals[0]
-    h = (n - 1) * prob + 1
-    lo = int(math.floor(h))
-    hi = int(math.ceil(h))
-    if lo == hi:
-        return vals[lo - 1]
-    frac = h - lo
-    return vals[lo - 1] * (1 - frac) + vals[hi - 1] * frac
-
-
-def calculate_niqr(values):
-    q1 = quantile_type7(values, 0.25)
-    q3 = quantile_type7(values, 0.75)
-    return 0.7413 * (q3 - q1)
-
-
-def run_stage_01_robust_stats():
-    print("Etapa 1: Estadisticos robustos de dispersion — INICIO")
-
-    rows = []
-    with open(DATA_SUMMARY, "r", newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            if row["participant_id"] == "ref":
-                continue
-            rows.append(row)
+def compute_robust_stats(store, combos):
+    """Estadisticos robustos por combo (una fila por combo, en orden)."""
+    # Una fila por combo (relleno NaN) y estadisticos robustos en una llamada
+    combo_values = []
+    for combo in combos:
+        part = store.participant_values(combo["pollutant"], combo["level"])
+        combo_values.append(part["mean_value"])
+    stats = robust_stats_rows(pad_rows(combo_values))
 
     py_rows = []
-    for combo in TARGET_COMBOS:
+    for i, combo in enumerate(combos):
         combo_id = make_combo_id(combo["pollutant"], combo["level"])
-        values = [
-            float(row["mean_value"])
-            for row in rows
-            if row["pollutant"] == combo["pollutant"]
-            and row["level"] == combo["level"]
-            and row["mean_value"] not in ("", "NA", "NaN", "nan")
-        ]
-        values = [v for v in values if math.isfinite(v)]
-        n_values = len(values)
+        n_values = int(stats["n"][i])
 
         if n_values < 2:
             py_rows.append({
@@ -102,10 +64,10 @@ def run_stage_01_robust_stats():
             })
             continue
 
-        x_pt = median(values)
-        mad_val = median([abs(v - x_pt) for v in values])
-        made_val = 1.483 * mad_val
-        niqr_val = calculate_niqr(values)
+        x_pt = float(stats["median"][i])
+        mad_val = float(stats["mad"][i])
+        made_val = float(stats["MADe"][i])
+        niqr_val = float(stats["nIQR"][i])
 
         py_rows.append({
             "combo_id": combo_id,
@@ -124,26 +86,45 @@ def run_stage_01_robust_stats():
             f"mad={mad_val:.8f} MADe={made_val:.8f} nIQR={niqr_val:.8f}"
         )
 
-    os.makedirs(os.path.dirname(OUTPUT_PY_CSV), exist_ok=True)
-    with open(OUTPUT_PY_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "combo_id", "pollutant", "level", "n_values",
-                "x_pt", "mad", "MADe", "nIQR", "edge_case",
-            ],
-        )
+    return py_rows
+
+
+def run_stage_01_robust_stats(
+    store=None, output_dir=None, r_dir=None, combos=None, binary=False, memo=None
+):
+    print("Etapa 1: Estadisticos robustos de dispersion — INICIO")
+
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    r_csv = resolve_path(R_CSV, r_dir)
+
+    if store is None:
+        store = load_data_store(summary_path=DATA_SUMMARY)
+    if combos is None:
+        combos = discover_combos(store, tables=("summary",))
+
+    py_rows = map_combos(compute_robust_stats, combos, args=(store,), memo=memo)
+
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
+    py_fields = [
+        "combo_id", "pollutant", "level", "n_values",
+        "x_pt", "mad", "MADe", "nIQR", "edge_case",
+    ]
+    with open(out_py_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=py_fields)
         writer.writeheader()
         writer.writerows(py_rows)
-    print(f"  Resultados Python guardados: {OUTPUT_PY_CSV}")
+    print(f"  Resultados Python guardados: {out_py_csv}")
+    if binary:
+        write_npz(npz_path(out_py_csv), py_rows, py_fields)
 
     r_data = {}
-    if os.path.exists(R_CSV):
-        with open(R_CSV, "r", newline="", encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                r_data[row["combo_id"]] = row
+    if table_exists(r_csv):
+        for row in load_rows(r_csv):
+            r_data[row["combo_id"]] = row
     else:
-        print(f"  ADVERTENCIA: {R_CSV} no encontrado. Ejecute R primero.")
+        print(f"  ADVERTENCIA: {r_csv} no encontrado. Ejecute R primero.")
 
     canonical_rows = []
     for py_row in py_rows:
@@ -151,7 +132,13 @@ def run_stage_01_robust_stats():
         for metric in ["n_values", "x_pt", "mad", "MADe", "nIQR"]:
             py_val = py_row[metric]
             r_val = float(r_row.get(metric, "nan")) if r_row else float("nan")
-            if math.isfinite(py_val) and math.isfinite(r_val):
+            notes = ""
+            if not r_row:
+                # Combo fuera de la referencia R: no hay comparacion posible
+                diff = float("nan")
+                status = STATUS_EDGE
+                notes = "sin referencia R"
+            elif math.isfinite(py_val) and math.isfinite(r_val):
                 diff = r_val - py_val
                 status = STATUS_PASS if abs(diff) <= TOL_DEFAULT else STATUS_FAIL
             elif not math.isfinite(py_val) and not math.isfinite(r_val):
@@ -177,25 +164,27 @@ def run_stage_01_robust_stats():
                 "diff_r_python": diff,
                 "status": status,
                 "tolerance": TOL_DEFAULT,
-                "notes": "",
+                "notes": notes,
             })
 
-    with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "combo_id", "pollutant", "level", "stage", "section",
-                "participant_id", "metric", "app_value", "r_value",
-                "python_value", "diff_app_r", "diff_app_python",
-                "diff_r_python", "status", "tolerance", "notes",
-            ],
-        )
+    canonical_fields = [
+        "combo_id", "pollutant", "level", "stage", "section",
+        "participant_id", "metric", "app_value", "r_value",
+        "python_value", "diff_app_r", "diff_app_python",
+        "diff_r_python", "status", "tolerance", "notes",
+    ]
+    with open(out_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=canonical_fields)
         writer.writeheader()
         writer.writerows(canonical_rows)
-    print(f"  CSV canónico escrito: {OUTPUT_CSV}")
+    print(f"  CSV canónico escrito: {out_csv}")
+    if binary:
+        write_npz(npz_path(out_csv), canonical_rows, canonical_fields)
 
     pass_count = sum(1 for row in canonical_rows if row["status"] == STATUS_PASS)
     fail_count = sum(1 for row in canonical_rows if row["status"] == STATUS_FAIL)
+    edge_count = sum(1 for row in canonical_rows if row["status"] == STATUS_EDGE)
+    known_count = sum(1 for row in canonical_rows if row["status"] == STATUS_KNOWN_DISC)
     report_lines = [
         "# Reporte: Etapa 1 - Estadisticos robustos de dispersion",
         "",
@@ -209,11 +198,11 @@ def run_stage_01_robust_stats():
         "## Resumen PASS/FAIL",
         f"- PASS: {pass_count}",
         f"- FAIL: {fail_count}",
-        "- EDGE_CASE: 0",
-        "- KNOWN_DISCREPANCY: 0",
+        f"- EDGE_CASE: {edge_count}",
+        f"- KNOWN_DISCREPANCY: {known_count}",
         "",
         "## Validaciones requeridas",
-        "- Mediana calculada sobre mean_value filtrado por O3 y nivel",
+        "- Mediana calculada sobre mean_value filtrado por contaminante y nivel",
         "- Factor MADe = 1.483",
         "- Factor nIQR = 0.7413",
         "- Cuartiles con type = 7",
@@ -222,10 +211,11 @@ def run_stage_01_robust_stats():
         "Etapa PASS" if fail_count == 0 else "Etapa con FAIL pendientes de revisión",
         "",
     ])
-    with open(OUTPUT_REPORT, "w", encoding="utf-8") as f:
+    with open(out_report, "w", encoding="utf-8") as f:
         f.write("\n".join(report_lines))
-    print(f"  Reporte escrito: {OUTPUT_REPORT}")
+    print(f"  Reporte escrito: {out_report}")
     print("Etapa 1: Estadisticos robustos de dispersion — FIN")
+    return {"py_results": py_rows, "rows": canonical_rows}
 
 
 if __name__ == "__main__":
@@ -9,7 +9,8 @@ Uso:
     python3 validation/stage_02_homogeneity.py
 
 Outputs:
-    outputs/stage_02_homogeneity_py.csv (intermedio)
+    outputs/stage_02_homogeneity_py.csv (intermedio; incluye n_hom, mean_hom
+        y m2_hom, estadisticos suficientes que usa la Etapa 3)
     outputs/stage_02_homogeneity.csv (comparacion final)
     outputs/stage_02_homogeneity_report.md
 
@@ -21,236 +22,147 @@ Metricas validadas (12 por combo):
 import sys
 import os
 import csv as csv_mod
-import math
 
 sys.path.insert(0, os.path.dirname(__file__))
 
+from columnar_io import load_rows, npz_path, table_exists, write_npz
+from comparison import compare_wide
+from data_store import load_data_store
+from homogeneity_anova import homogeneity_anova, moment_stats, stack_matrices
 from helpers import (
-    COMBOS, make_combo_id, load_wide_data, median, quantile_type7,
-    TOL_DEFAULT, canonical_row, write_canonical_csv, CANONICAL_COLS,
-    STATUS_PASS, STATUS_FAIL, STATUS_EDGE,
+    discover_combos, make_combo_id, quantile_type7,
+    TOL_DEFAULT, write_canonical_csv, CANONICAL_COLS,
+    STATUS_PASS, STATUS_FAIL, STATUS_EDGE, resolve_path, map_combos,
 )
 
 DATA_HOMOGENEITY = "../data/for_validation/homogeneity_n4.csv"
+R_CSV = "outputs/stage_02_homogeneity_r.csv"
 OUTPUT_PY_CSV = "outputs/stage_02_homogeneity_py.csv"
 OUTPUT_CSV = "outputs/stage_02_homogeneity.csv"
 OUTPUT_REPORT = "outputs/stage_02_homogeneity_report.md"
 
-# --- Tabla F1/F2 para criterio expandido (3 args) ---
-F_TABLE = {
-    7:  (2.10, 1.43), 8:  (2.01, 1.25), 9:  (1.94, 1.11),
-    10: (1.88, 1.01), 11: (1.83, 0.93), 12: (1.79, 0.86),
-    13: (1.75, 0.80), 14: (1.72, 0.75), 15: (1.69, 0.71),
-    16: (1.67, 0.68), 17: (1.64, 0.64), 18: (1.62, 0.62),
-    19: (1.60, 0.59), 20: (1.59, 0.57),
-}
+# Metricas por combo (orden del CSV) y su nombre en homogeneity_anova
+HOM_METRICS = [
+    "general_mean_homog", "x_pt", "s_x_bar_sq", "sw", "ss_sq", "ss",
+    "sigma_pt", "MADe", "u_sigma_pt", "criterio_c", "criterio_expandido",
+]
+HOM_STATS = {"general_mean_homog": "general_mean"}
 
 
-def calc_criterion_expanded(sigma_pt, sw, g):
-    """c_exp = F1*(0.3*sigma_pt)^2 + F2*sw^2 con clamp g a [7,20]."""
-    g_clamped = max(7, min(20, g))
-    f1, f2 = F_TABLE[g_clamped]
-    return f1 * (0.3 * sigma_pt) ** 2 + f2 * sw ** 2
-
+def _moment_fields(moments, i):
+    """Columnas n_hom, mean_hom, m2_hom de la fila i de moment_stats."""
+    return {
+        "n_hom": int(moments["n"][i]),
+        "mean_hom": float(moments["mean"][i]),
+        "m2_hom": float(moments["m2"][i]),
+    }
 
-def variance(values):
-    """Calcular varianza muestral (ddof=1, como R var())."""
-    n = len(values)
-    if n < 2:
-        return float("nan")
-    m = sum(values) / n
-    return sum((x - m) ** 2 for x in values) / (n - 1)
 
+def compute_homogeneity(store, combos):
+    """Metricas de homogeneidad por combo (una fila por combo, en orden).
 
-def load_wide_as_matrix(data_path, pollutant, level):
-    """Cargar datos y pivotear a matriz g x m (lista de listas).
-    Retorna (sample_ids_sorted, matrix) donde matrix[i] es la fila i.
+    Las matrices g x m de todos los combos se apilan y se evaluan con una
+    sola llamada a homogeneity_anova.
     """
-    wide = load_wide_data(data_path, pollutant, level)
-    if wide is None or len(wide) < 1:
-        return [], []
-
-    sample_cols = [
-        c for c in wide.columns
-        if c.startswith("sample_") and c.split("_")[1].isdigit()
+    matrices = [
+        store.wide_matrix("homogeneity", combo["pollutant"], combo["level"])[1]
+        for combo in combos
     ]
-    sample_cols = sorted(sample_cols, key=lambda c: int(c.split("_")[1]))
-    sample_ids = wide["sample_id"].astype(str).tolist()
-    matrix = wide[sample_cols].to_numpy().tolist()
-    return sample_ids, matrix
-
-
-def row_means(matrix):
-    """Calcular media de cada fila."""
-    return [sum(row) / len(row) for row in matrix]
-
-
-def col_values(matrix, col_idx):
-    """Extraer columna col_idx de la matriz."""
-    return [row[col_idx] for row in matrix]
-
-
-def run_stage_02():
-    print("Etapa 2: Homogeneidad — INICIO")
+    stats = homogeneity_anova(stack_matrices(matrices)) if combos else {}
+    # Estadisticos suficientes de todos los valores (para u_hom_mean en la Etapa 3)
+    moments = moment_stats([
+        store.all_values("homogeneity", combo["pollutant"], combo["level"])
+        for combo in combos
+    ])
 
     py_results = []
-
-    for combo in COMBOS:
+    for i, combo in enumerate(combos):
         combo_id = make_combo_id(combo["pollutant"], combo["level"])
         print(f"  Procesando: {combo['label']}")
 
-        sids, matrix = load_wide_as_matrix(
-            DATA_HOMOGENEITY, combo["pollutant"], combo["level"]
-        )
-
-        g = len(matrix)
-        if g < 2:
-            print(f"    ADVERTENCIA: menos de 2 muestras ({g}), saltando")
-            py_results.append({
-                "combo_id": combo_id,
-                "pollutant": combo["pollutant"],
-                "level": combo["level"],
-                "g": g,
-                "m": 0,
-                "general_mean_homog": float("nan"),
-                "x_pt": float("nan"),
-                "s_x_bar_sq": float("nan"),
-                "sw": float("nan"),
-                "ss_sq": float("nan"),
-                "ss": float("nan"),
-                "sigma_pt": float("nan"),
-                "MADe": float("nan"),
-                "u_sigma_pt": float("nan"),
-                "criterio_c": float("nan"),
-                "criterio_expandido": float("nan"),
-                "edge_case": True,
-            })
-            continue
-
-        m = len(matrix[0])
-        if m < 2:
-            print(f"    ADVERTENCIA: menos de 2 replicas ({m}), saltando")
-            py_results.append({
+        g = matrices[i].shape[0]
+        m = matrices[i].shape[1] if g >= 2 else 0
+        if g < 2 or m < 2:
+            if g < 2:
+                print(f"    ADVERTENCIA: menos de 2 muestras ({g}), saltando")
+            else:
+                print(f"    ADVERTENCIA: menos de 2 replicas ({m}), saltando")
+            row = {name: float("nan") for name in HOM_METRICS}
+            row.update({
                 "combo_id": combo_id,
                 "pollutant": combo["pollutant"],
                 "level": combo["level"],
                 "g": g,
                 "m": m,
-                "general_mean_homog": float("nan"),
-                "x_pt": float("nan"),
-                "s_x_bar_sq": float("nan"),
-                "sw": float("nan"),
-                "ss_sq": float("nan"),
-                "ss": float("nan"),
-                "sigma_pt": float("nan"),
-                "MADe": float("nan"),
-                "u_sigma_pt": float("nan"),
-                "criterio_c": float("nan"),
-                "criterio_expandido": float("nan"),
                 "edge_case": True,
             })
+            row.update(_moment_fields(moments, i))
+            py_results.append(row)
             continue
 
-        # --- Calcular 12 metricas ---
-        means = row_means(matrix)
-        general_mean_homog = sum(sum(row) for row in matrix) / (g * m)
-
-        # x_pt: mediana de primera columna
-        first_col = col_values(matrix, 0)
-        x_pt = median(first_col)
-
-        # s_x_bar_sq: varianza de medias (ddof=1)
-        s_x_bar_sq = variance(means)
-
-        # sw: DE intra-muestra
-        if m == 2:
-            col1 = col_values(matrix, 0)
-            col2 = col_values(matrix, 1)
-            range_sq_sum = sum((abs(a - b)) ** 2 for a, b in zip(col1, col2))
-            sw = math.sqrt(range_sq_sum / (2 * g))
-        else:
-            within_vars = []
-            for row in matrix:
-                within_vars.append(variance(row))
-            mean_within_var = sum(within_vars) / len(within_vars)
-            sw = math.sqrt(mean_within_var)
-
-        sw_sq = sw ** 2
-
-        # ss_sq = abs(s_x_bar_sq - sw_sq/m) — usar abs() como ptcalc
-        ss_sq = abs(s_x_bar_sq - sw_sq / m)
-        ss = math.sqrt(ss_sq)
+        row = {
+            "combo_id": combo_id,
+            "pollutant": combo["pollutant"],
+            "level": combo["level"],
+            "g": g,
+            "m": m,
+        }
+        for name in HOM_METRICS:
+            row[name] = float(stats[HOM_STATS.get(name, name)][i])
+        row["edge_case"] = False
+        row.update(_moment_fields(moments, i))
+        py_results.append(row)
+
+        print(
+            f"    g={g} m={m} x_pt={row['x_pt']:.8f} sw={row['sw']:.8f} "
+            f"ss={row['ss']:.8f} sigma_pt={row['sigma_pt']:.8f}"
+        )
 
-        # sigma_pt = median(|sample_2 - x_pt|)
-        second_col = col_values(matrix, 1)
-        abs_diffs = [abs(v - x_pt) for v in second_col]
-        sigma_pt = median(abs_diffs)
+    return py_results
 
-        # MADe = 1.483 * sigma_pt
-        MADe = 1.483 * sigma_pt
 
-        # u_sigma_pt = 1.25 * MADe / sqrt(g)
-        u_sigma_pt = 1.25 * MADe / math.sqrt(g)
+def run_stage_02(
+    store=None, output_dir=None, r_dir=None, combos=None, workers=1, binary=False
+):
+    print("Etapa 2: Homogeneidad — INICIO")
 
-        # criterio_c = 0.3 * sigma_pt
-        criterio_c = 0.3 * sigma_pt
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    r_csv_path = resolve_path(R_CSV, r_dir)
 
-        # criterio_expandido (3 args, tabla F1/F2)
-        criterio_exp = calc_criterion_expanded(sigma_pt, sw, g)
+    if store is None:
+        store = load_data_store(homogeneity_path=DATA_HOMOGENEITY)
+    if combos is None:
+        combos = discover_combos(store, tables=("homogeneity",))
 
-        py_results.append({
-            "combo_id": combo_id,
-            "pollutant": combo["pollutant"],
-            "level": combo["level"],
-            "g": g,
-            "m": m,
-            "general_mean_homog": general_mean_homog,
-            "x_pt": x_pt,
-            "s_x_bar_sq": s_x_bar_sq,
-            "sw": sw,
-            "ss_sq": ss_sq,
-            "ss": ss,
-            "sigma_pt": sigma_pt,
-            "MADe": MADe,
-            "u_sigma_pt": u_sigma_pt,
-            "criterio_c": criterio_c,
-            "criterio_expandido": criterio_exp,
-            "edge_case": False,
-        })
-
-        print(f"    g={g} m={m} x_pt={x_pt:.8f} sw={sw:.8f} ss={ss:.8f} sigma_pt={sigma_pt:.8f}")
+    py_results = map_combos(compute_homogeneity, combos, workers, args=(store,))
 
     # Guardar resultados Python como CSV intermedio
-    os.makedirs(os.path.dirname(OUTPUT_PY_CSV), exist_ok=True)
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
     fieldnames = ["combo_id", "pollutant", "level", "g", "m",
                   "general_mean_homog", "x_pt", "s_x_bar_sq", "sw",
                   "ss_sq", "ss", "sigma_pt", "MADe", "u_sigma_pt",
-                  "criterio_c", "criterio_expandido", "edge_case"]
-    with open(OUTPUT_PY_CSV, "w", newline="") as f:
+                  "criterio_c", "criterio_expandido", "edge_case",
+                  "n_hom", "mean_hom", "m2_hom"]
+    with open(out_py_csv, "w", newline="") as f:
         writer = csv_mod.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(py_results)
-    print(f"  Resultados Python guardados: {OUTPUT_PY_CSV}")
+    print(f"  Resultados Python guardados: {out_py_csv}")
+    if binary:
+        write_npz(npz_path(out_py_csv), py_results, fieldnames)
 
     # --- Comparacion tripartita ---
     print("  Generando comparacion tripartita...")
 
     # Leer resultados R
-    r_data = {}
-    r_csv_path = "outputs/stage_02_homogeneity_r.csv"
-    if os.path.exists(r_csv_path):
-        with open(r_csv_path, "r") as f:
-            reader = csv_mod.DictReader(f)
-            for row in reader:
-                r_data[row["combo_id"]] = row
+    r_rows = []
+    if table_exists(r_csv_path):
+        r_rows = load_rows(r_csv_path)
     else:
         print(f"    ADVERTENCIA: {r_csv_path} no encontrado. Ejecutar R primero.")
 
-    all_rows = []
-    discrepancies = []
-    edge_cases = []
-    combos_processed = []
-
     metrics = [
         "g", "m", "general_mean_homog", "x_pt", "s_x_bar_sq",
         "sw", "ss_sq", "ss", "sigma_pt", "MADe", "u_sigma_pt",
@@ -272,64 +184,16 @@ def run_stage_02():
         "criterio_expandido": "Criterio expandido",
     }
 
-    for combo in COMBOS:
-        combo_id = make_combo_id(combo["pollutant"], combo["level"])
-        py_row = next((r for r in py_results if r["combo_id"] == combo_id), None)
-        r_row = r_data.get(combo_id)
-
-        if py_row is None or r_row is None:
-            discrepancies.append(f"{combo_id}: datos faltantes en una fuente")
-            continue
-
-        if py_row.get("edge_case", False):
-            edge_cases.append(f"{combo_id}: edge case (g o m insuficiente)")
-            continue
+    # g y m se comparan como enteros exactos (tolerancia 0.5)
+    all_rows, combos_processed, discrepancies, edge_cases = compare_wide(
+        py_results, r_rows, combos, metrics, metric_labels,
+        stage="stage_02_homogeneity", section="homogeneity", tolerance=TOL_DEFAULT,
+    )
 
-        for metric in metrics:
-            r_val = float(r_row[metric]) if r_row[metric] != "NA" else float("nan")
-            py_val = py_row[metric]
-            if isinstance(py_val, bool):
-                py_val = float(py_val)
-
-            # Para g y m, comparar como enteros exactos
-            if metric in ("g", "m"):
-                r_val_int = int(r_val) if _isfinite(r_val) else None
-                py_val_int = int(py_val) if _isfinite(py_val) else None
-                row = canonical_row(
-                    combo_id=combo_id,
-                    pollutant=combo["pollutant"],
-                    level=combo["level"],
-                    stage="stage_02_homogeneity",
-                    section="homogeneity",
-                    participant_id="ALL",
-                    metric=metric_labels.get(metric, metric),
-                    app_value=float(r_val_int) if r_val_int is not None else float("nan"),
-                    r_value=float(r_val_int) if r_val_int is not None else float("nan"),
-                    python_value=float(py_val_int) if py_val_int is not None else float("nan"),
-                    tolerance=0.5,  # Para enteros
-                    notes="",
-                )
-            else:
-                row = canonical_row(
-                    combo_id=combo_id,
-                    pollutant=combo["pollutant"],
-                    level=combo["level"],
-                    stage="stage_02_homogeneity",
-                    section="homogeneity",
-                    participant_id="ALL",
-                    metric=metric_labels.get(metric, metric),
-                    app_value=r_val,
-                    r_value=r_val,
-                    python_value=py_val,
-                    tolerance=TOL_DEFAULT,
-                    notes="",
-                )
-            all_rows.append(row)
-
-        combos_processed.append(combo_id)
-
-    write_canonical_csv(all_rows, OUTPUT_CSV)
-    print(f"  CSV comparacion escrito: {OUTPUT_CSV}")
+    write_canonical_csv(all_rows, out_csv)
+    if binary:
+        write_npz(npz_path(out_csv), all_rows, CANONICAL_COLS)
+    print(f"  CSV comparacion escrito: {out_csv}")
 
     # --- Reporte ---
     pass_count = sum(1 for r in all_rows if r["status"] == STATUS_PASS)
@@ -414,21 +278,12 @@ def run_stage_02():
         "",
     ])
 
-    with open(OUTPUT_REPORT, "w") as f:
+    with open(out_report, "w") as f:
         f.write("\n".join(report_lines))
-    print(f"  Reporte escrito: {OUTPUT_REPORT}")
+    print(f"  Reporte escrito: {out_report}")
 
     print("Etapa 2: Homogeneidad — FIN")
-
-
-def _isfinite(x):
-    """Verificar si un valor es finito."""
-    if x is None:
-        return False
-    try:
-        return math.isfinite(float(x))
-    except (TypeError, ValueError):
-        return False
+    return {"py_results": py_results, "rows": all_rows}
 
 
 if __name__ == "__main__":
@@ -4,7 +4,11 @@ Validacion de evaluacion de estabilidad.
 
 Referencia: ISO 13528:2022, Seccion 9.3
 Fuente: data/for_validation/stability_n4.csv
-Dependencias: resultados de homogeneidad (Etapa 2)
+Dependencias: resultados de homogeneidad (Etapa 2), incluidos sus estadisticos
+    suficientes (n_hom, mean_hom, m2_hom); no relee homogeneity_n4.csv salvo
+    que el CSV de la Etapa 2 no traiga esas columnas (salidas anteriores a
+    ellas o rutas del usuario), en cuyo caso se recalculan desde los datos
+    de homogeneidad
 
 Uso:
     python3 validation/stage_03_stability.py
@@ -25,153 +29,118 @@ import os
 import csv as csv_mod
 import math
 
+import numpy as np
+
 sys.path.insert(0, os.path.dirname(__file__))
 
+from columnar_io import load_rows, npz_path, table_exists, write_npz
+from comparison import compare_wide
+from data_store import DATA_HOMOGENEITY, load_data_store
+from homogeneity_anova import homogeneity_anova, moment_stats, stack_matrices, standard_error
 from helpers import (
-    COMBOS, make_combo_id, load_wide_data, median, load_summary_combo,
-    TOL_DEFAULT, canonical_row, write_canonical_csv, CANONICAL_COLS,
-    STATUS_PASS, STATUS_FAIL, STATUS_EDGE,
+    discover_combos, make_combo_id,
+    TOL_DEFAULT, write_canonical_csv, CANONICAL_COLS,
+    STATUS_PASS, STATUS_FAIL, STATUS_EDGE, resolve_path, map_combos,
 )
 
 DATA_STABILITY = "../data/for_validation/stability_n4.csv"
-DATA_HOMOGENEITY = "../data/for_validation/homogeneity_n4.csv"
 HOM_PY_CSV = "outputs/stage_02_homogeneity_py.csv"
+R_CSV = "outputs/stage_03_stability_r.csv"
 OUTPUT_PY_CSV = "outputs/stage_03_stability_py.csv"
 OUTPUT_CSV = "outputs/stage_03_stability.csv"
 OUTPUT_REPORT = "outputs/stage_03_stability_report.md"
 
 
-def variance(values):
-    """Calcular varianza muestral (ddof=1, como R var())."""
-    n = len(values)
-    if n < 2:
-        return float("nan")
-    m = sum(values) / n
-    return sum((x - m) ** 2 for x in values) / (n - 1)
-
-
-def std(values):
-    """Calcular desviacion estandar muestral (ddof=1, como R sd())."""
-    return math.sqrt(variance(values))
-
-
-def load_wide_as_matrix(data_path, pollutant, level):
-    """Cargar datos y pivotear a matriz g x m (lista de listas)."""
-    wide = load_wide_data(data_path, pollutant, level)
-    if wide is None or len(wide) < 1:
-        return [], []
-
-    sample_cols = [
-        c for c in wide.columns
-        if c.startswith("sample_") and c.split("_")[1].isdigit()
-    ]
-    sample_cols = sorted(sample_cols, key=lambda c: int(c.split("_")[1]))
-    sample_ids = wide["sample_id"].astype(str).tolist()
-    matrix = wide[sample_cols].to_numpy().tolist()
-    return sample_ids, matrix
+STAB_METRICS = [
+    "general_mean_stab", "x_pt_stab", "s_x_bar_sq_stab", "sw_stab",
+    "ss_sq_stab", "ss_stab", "diff_hom_stab", "u_hom_mean",
+    "u_stab_mean", "criterio_simple", "criterio_expandido",
+]
 
 
-def row_means(matrix):
-    """Calcular media de cada fila."""
-    return [sum(row) / len(row) for row in matrix]
+HOM_MOMENT_FIELDS = ("n_hom", "mean_hom", "m2_hom")
 
 
-def col_values(matrix, col_idx):
-    """Extraer columna col_idx de la matriz."""
-    return [row[col_idx] for row in matrix]
-
-
-def load_hom_all_values(data_path, pollutant, level):
-    """Cargar todos los valores de homogeneidad para un combo."""
-    vals = []
-    with open(data_path, "r") as f:
-        reader = csv_mod.DictReader(f)
-        for row in reader:
-            if row["pollutant"] != pollutant:
-                continue
-            if row["level"] != level:
-                continue
-            vals.append(float(row["value"]))
-    return vals
-
+def hom_moments(hom_rows):
+    """Estado (n, media, M2) de homogeneidad publicado por la Etapa 2."""
+    return {
+        "n": np.array([int(float(row["n_hom"])) for row in hom_rows], dtype=np.int64),
+        "mean": np.array([float(row["mean_hom"]) for row in hom_rows]),
+        "m2": np.array([float(row["m2_hom"]) for row in hom_rows]),
+    }
 
-def run_stage_03():
-    print("Etapa 3: Estabilidad — INICIO")
 
-    # Leer resultados de homogeneidad (Python)
-    hom_data = {}
-    if os.path.exists(HOM_PY_CSV):
-        with open(HOM_PY_CSV, "r") as f:
-            reader = csv_mod.DictReader(f)
-            for row in reader:
-                hom_data[row["combo_id"]] = row
-    else:
-        print(f"  ADVERTENCIA: {HOM_PY_CSV} no encontrado. Ejecutar Fase 2 primero.")
+def fill_hom_moments(hom_data, store, combos, homogeneity_path=None):
+    """Completar n_hom, mean_hom y m2_hom en las filas de la Etapa 2 que no
+    los traen, recalculandolos desde los datos de homogeneidad (mismo
+    calculo que la Etapa 2). Usa la tabla del almacen si esta cargada; si
+    no, lee homogeneity_path (DATA_HOMOGENEITY por defecto)."""
+    missing = []
+    for combo in combos:
+        row = hom_data.get(make_combo_id(combo["pollutant"], combo["level"]))
+        if row is not None and any(row.get(name) in (None, "") for name in HOM_MOMENT_FIELDS):
+            missing.append(combo)
+    if not missing:
+        return hom_data
+    if not store.has_table("homogeneity"):
+        path = homogeneity_path or DATA_HOMOGENEITY
+        if not os.path.exists(path):
+            raise ValueError(
+                f"Los resultados de la Etapa 2 no traen {', '.join(HOM_MOMENT_FIELDS)} y no se "
+                f"encontro {path} para recalcularlos; ejecutar de nuevo la Etapa 2."
+            )
+        store = load_data_store(homogeneity_path=path)
+    print(f"  Recalculando {', '.join(HOM_MOMENT_FIELDS)} para {len(missing)} combos (Etapa 2 sin ellos)")
+    moments = moment_stats([
+        store.all_values("homogeneity", combo["pollutant"], combo["level"])
+        for combo in missing
+    ])
+    for i, combo in enumerate(missing):
+        combo_id = make_combo_id(combo["pollutant"], combo["level"])
+        hom_data[combo_id] = {
+            **hom_data[combo_id],
+            "n_hom": int(moments["n"][i]),
+            "mean_hom": float(moments["mean"][i]),
+            "m2_hom": float(moments["m2"][i]),
+        }
+    return hom_data
+
+
+def compute_stability(store, hom_data, combos):
+    """Metricas de estabilidad por combo (hom_data: combo_id -> fila de Etapa 2).
+
+    La ANOVA de estabilidad se evalua con homogeneity_anova sobre las
+    matrices apiladas del bloque. u_hom_mean y la media de homogeneidad
+    salen de los estadisticos suficientes de la Etapa 2, sin releer los
+    datos de homogeneidad.
+    """
+    matrices = [
+        store.wide_matrix("stability", combo["pollutant"], combo["level"])[1]
+        for combo in combos
+    ]
+    stats = homogeneity_anova(stack_matrices(matrices)) if combos else {}
+    stab_moments = moment_stats([mat.ravel() for mat in matrices])
+    u_stab_all = standard_error(stab_moments["n"], stab_moments["m2"])
 
     py_results = []
-
-    for combo in COMBOS:
+    for i, combo in enumerate(combos):
         combo_id = make_combo_id(combo["pollutant"], combo["level"])
         print(f"  Procesando: {combo['label']}")
 
-        sids, matrix = load_wide_as_matrix(
-            DATA_STABILITY, combo["pollutant"], combo["level"]
-        )
-
-        g = len(matrix)
-        if g < 2:
-            print(f"    ADVERTENCIA: menos de 2 muestras ({g}), saltando")
-            py_results.append({
-                "combo_id": combo_id, "pollutant": combo["pollutant"],
-                "level": combo["level"], "g": g, "m": 0,
-                "general_mean_stab": float("nan"), "x_pt_stab": float("nan"),
-                "s_x_bar_sq_stab": float("nan"), "sw_stab": float("nan"),
-                "ss_sq_stab": float("nan"), "ss_stab": float("nan"),
-                "diff_hom_stab": float("nan"), "u_hom_mean": float("nan"),
-                "u_stab_mean": float("nan"), "criterio_simple": float("nan"),
-                "criterio_expandido": float("nan"), "edge_case": True,
-            })
-            continue
-
-        m = len(matrix[0])
-        if m < 2:
-            print(f"    ADVERTENCIA: menos de 2 replicas ({m}), saltando")
-            py_results.append({
-                "combo_id": combo_id, "pollutant": combo["pollutant"],
-                "level": combo["level"], "g": g, "m": m,
-                "general_mean_stab": float("nan"), "x_pt_stab": float("nan"),
-                "s_x_bar_sq_stab": float("nan"), "sw_stab": float("nan"),
-                "ss_sq_stab": float("nan"), "ss_stab": float("nan"),
-                "diff_hom_stab": float("nan"), "u_hom_mean": float("nan"),
-                "u_stab_mean": float("nan"), "criterio_simple": float("nan"),
-                "criterio_expandido": float("nan"), "edge_case": True,
-            })
+        g = matrices[i].shape[0]
+        m = matrices[i].shape[1] if g >= 2 else 0
+        if g < 2 or m < 2:
+            if g < 2:
+                print(f"    ADVERTENCIA: menos de 2 muestras ({g}), saltando")
+            else:
+                print(f"    ADVERTENCIA: menos de 2 replicas ({m}), saltando")
+            row = {"combo_id": combo_id, "pollutant": combo["pollutant"],
+                   "level": combo["level"], "g": g, "m": m}
+            row.update({name: float("nan") for name in STAB_METRICS})
+            row["edge_case"] = True
+            py_results.append(row)
             continue
 
-        # --- Calcular metricas de estabilidad ---
-        means = row_means(matrix)
-        general_mean_stab = sum(sum(row) for row in matrix) / (g * m)
-
-        first_col = col_values(matrix, 0)
-        x_pt_stab = median(first_col)
-
-        s_x_bar_sq_stab = variance(means)
-
-        if m == 2:
-            col1 = col_values(matrix, 0)
-            col2 = col_values(matrix, 1)
-            range_sq_sum = sum((abs(a - b)) ** 2 for a, b in zip(col1, col2))
-            sw_stab = math.sqrt(range_sq_sum / (2 * g))
-        else:
-            within_vars = [variance(row) for row in matrix]
-            sw_stab = math.sqrt(sum(within_vars) / len(within_vars))
-
-        sw_sq_stab = sw_stab ** 2
-
-        # ss_sq = abs(s_x_bar_sq - sw_sq/m)
-        ss_sq_stab = abs(s_x_bar_sq_stab - sw_sq_stab / m)
-        ss_stab = math.sqrt(ss_sq_stab)
-
         # --- Datos de homogeneidad ---
         hom_row = hom_data.get(combo_id)
         if hom_row is None:
@@ -181,24 +150,23 @@ def run_stage_03():
         general_mean_homog = float(hom_row["general_mean_homog"])
         sigma_pt_hom = float(hom_row["sigma_pt"])
 
+        general_mean_stab = float(stats["general_mean"][i])
+
         # diff_hom_stab
         diff_hom_stab = abs(general_mean_stab - general_mean_homog)
 
-        # u_hom_mean = sd(all_hom_values) / sqrt(n_hom)
-        hom_all_vals = load_hom_all_values(DATA_HOMOGENEITY, combo["pollutant"], combo["level"])
-        n_hom = len(hom_all_vals)
-        u_hom_mean = std(hom_all_vals) / math.sqrt(n_hom) if n_hom > 1 else float("nan")
+        # u_hom_mean = sd(all_hom_values) / sqrt(n_hom), desde (n, M2) de la Etapa 2
+        hom_state = hom_moments([hom_row])
+        u_hom_mean = float(standard_error(hom_state["n"], hom_state["m2"])[0])
 
         # u_stab_mean = sd(all_stab_values) / sqrt(n_stab)
-        stab_all_vals = [v for row in matrix for v in row]
-        n_stab = len(stab_all_vals)
-        u_stab_mean = std(stab_all_vals) / math.sqrt(n_stab) if n_stab > 1 else float("nan")
+        u_stab_mean = float(u_stab_all[i])
 
         # criterio_simple = 0.3 * sigma_pt_hom
         criterio_simple = 0.3 * sigma_pt_hom
 
         # criterio_expandido = c + 2*sqrt(u_hom_mean^2 + u_stab_mean^2)
-        if _isfinite(u_hom_mean) and _isfinite(u_stab_mean):
+        if math.isfinite(u_hom_mean) and math.isfinite(u_stab_mean):
             criterio_exp = criterio_simple + 2 * math.sqrt(u_hom_mean ** 2 + u_stab_mean ** 2)
         else:
             criterio_exp = float("nan")
@@ -210,11 +178,11 @@ def run_stage_03():
             "g": g,
             "m": m,
             "general_mean_stab": general_mean_stab,
-            "x_pt_stab": x_pt_stab,
-            "s_x_bar_sq_stab": s_x_bar_sq_stab,
-            "sw_stab": sw_stab,
-            "ss_sq_stab": ss_sq_stab,
-            "ss_stab": ss_stab,
+            "x_pt_stab": float(stats["x_pt"][i]),
+            "s_x_bar_sq_stab": float(stats["s_x_bar_sq"][i]),
+            "sw_stab": float(stats["sw"][i]),
+            "ss_sq_stab": float(stats["ss_sq"][i]),
+            "ss_stab": float(stats["ss"][i]),
             "diff_hom_stab": diff_hom_stab,
             "u_hom_mean": u_hom_mean,
             "u_stab_mean": u_stab_mean,
@@ -225,37 +193,64 @@ def run_stage_03():
 
         print(f"    g={g} m={m} mean_stab={general_mean_stab:.8f} diff={diff_hom_stab:.8f} c={criterio_simple:.8f}")
 
+    return py_results
+
+
+def run_stage_03(
+    store=None, output_dir=None, r_dir=None, hom_results=None, combos=None, workers=1,
+    binary=False,
+):
+    print("Etapa 3: Estabilidad — INICIO")
+
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    r_csv_path = resolve_path(R_CSV, r_dir)
+
+    if store is None:
+        store = load_data_store(stability_path=DATA_STABILITY)
+    if combos is None:
+        combos = discover_combos(store, tables=("stability",))
+
+    # Resultados de homogeneidad (Python): en memoria si vienen de la Etapa 2
+    hom_data = {}
+    if hom_results is not None:
+        hom_data = {row["combo_id"]: row for row in hom_results}
+    else:
+        hom_py_csv = resolve_path(HOM_PY_CSV, output_dir)
+        if table_exists(hom_py_csv):
+            for row in load_rows(hom_py_csv):
+                hom_data[row["combo_id"]] = row
+        else:
+            print(f"  ADVERTENCIA: {hom_py_csv} no encontrado. Ejecutar Fase 2 primero.")
+    hom_data = fill_hom_moments(hom_data, store, combos)
+
+    py_results = map_combos(compute_stability, combos, workers, args=(store, hom_data))
+
     # Guardar resultados Python como CSV intermedio
-    os.makedirs(os.path.dirname(OUTPUT_PY_CSV), exist_ok=True)
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
     fieldnames = ["combo_id", "pollutant", "level", "g", "m",
                   "general_mean_stab", "x_pt_stab", "s_x_bar_sq_stab", "sw_stab",
                   "ss_sq_stab", "ss_stab", "diff_hom_stab", "u_hom_mean",
                   "u_stab_mean", "criterio_simple", "criterio_expandido", "edge_case"]
-    with open(OUTPUT_PY_CSV, "w", newline="") as f:
+    with open(out_py_csv, "w", newline="") as f:
         writer = csv_mod.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         writer.writerows(py_results)
-    print(f"  Resultados Python guardados: {OUTPUT_PY_CSV}")
+    print(f"  Resultados Python guardados: {out_py_csv}")
+    if binary:
+        write_npz(npz_path(out_py_csv), py_results, fieldnames)
 
     # --- Comparacion tripartita ---
     print("  Generando comparacion tripartita...")
 
     # Leer resultados R
-    r_data = {}
-    r_csv_path = "outputs/stage_03_stability_r.csv"
-    if os.path.exists(r_csv_path):
-        with open(r_csv_path, "r") as f:
-            reader = csv_mod.DictReader(f)
-            for row in reader:
-                r_data[row["combo_id"]] = row
+    r_rows = []
+    if table_exists(r_csv_path):
+        r_rows = load_rows(r_csv_path)
     else:
         print(f"    ADVERTENCIA: {r_csv_path} no encontrado. Ejecutar R primero.")
 
-    all_rows = []
-    discrepancies = []
-    edge_cases = []
-    combos_processed = []
-
     metrics = [
         "g", "m", "general_mean_stab", "x_pt_stab", "s_x_bar_sq_stab",
         "sw_stab", "ss_sq_stab", "ss_stab", "diff_hom_stab",
@@ -277,63 +272,16 @@ def run_stage_03():
         "criterio_expandido": "Criterio expandido",
     }
 
-    for combo in COMBOS:
-        combo_id = make_combo_id(combo["pollutant"], combo["level"])
-        py_row = next((r for r in py_results if r["combo_id"] == combo_id), None)
-        r_row = r_data.get(combo_id)
+    # g y m se comparan como enteros exactos (tolerancia 0.5)
+    all_rows, combos_processed, discrepancies, edge_cases = compare_wide(
+        py_results, r_rows, combos, metrics, metric_labels,
+        stage="stage_03_stability", section="stability", tolerance=TOL_DEFAULT,
+    )
 
-        if py_row is None or r_row is None:
-            discrepancies.append(f"{combo_id}: datos faltantes en una fuente")
-            continue
-
-        if py_row.get("edge_case", False):
-            edge_cases.append(f"{combo_id}: edge case (g o m insuficiente)")
-            continue
-
-        for metric in metrics:
-            r_val = float(r_row[metric]) if r_row[metric] != "NA" else float("nan")
-            py_val = py_row[metric]
-            if isinstance(py_val, bool):
-                py_val = float(py_val)
-
-            if metric in ("g", "m"):
-                r_val_int = int(r_val) if _isfinite(r_val) else None
-                py_val_int = int(py_val) if _isfinite(py_val) else None
-                row = canonical_row(
-                    combo_id=combo_id,
-                    pollutant=combo["pollutant"],
-                    level=combo["level"],
-                    stage="stage_03_stability",
-                    section="stability",
-                    participant_id="ALL",
-                    metric=metric_labels.get(metric, metric),
-                    app_value=float(r_val_int) if r_val_int is not None else float("nan"),
-                    r_value=float(r_val_int) if r_val_int is not None else float("nan"),
-                    python_value=float(py_val_int) if py_val_int is not None else float("nan"),
-                    tolerance=0.5,
-                    notes="",
-                )
-            else:
-                row = canonical_row(
-                    combo_id=combo_id,
-                    pollutant=combo["pollutant"],
-                    level=combo["level"],
-                    stage="stage_03_stability",
-                    section="stability",
-                    participant_id="ALL",
-                    metric=metric_labels.get(metric, metric),
-                    app_value=r_val,
-                    r_value=r_val,
-                    python_value=py_val,
-                    tolerance=TOL_DEFAULT,
-                    notes="",
-                )
-            all_rows.append(row)
-
-        combos_processed.append(combo_id)
-
-    write_canonical_csv(all_rows, OUTPUT_CSV)
-    print(f"  CSV comparacion escrito: {OUTPUT_CSV}")
+    write_canonical_csv(all_rows, out_csv)
+    if binary:
+        write_npz(npz_path(out_csv), all_rows, CANONICAL_COLS)
+    print(f"  CSV comparacion escrito: {out_csv}")
 
     # --- Reporte ---
     pass_count = sum(1 for r in all_rows if r["status"] == STATUS_PASS)
@@ -417,20 +365,12 @@ def run_stage_03():
         "",
     ])
 
-    with open(OUTPUT_REPORT, "w") as f:
+    with open(out_report, "w") as f:
         f.write("\n".join(report_lines))
-    print(f"  Reporte escrito: {OUTPUT_REPORT}")
+    print(f"  Reporte escrito: {out_report}")
 
     print("Etapa 3: Estabilidad — FIN")
-
-
-def _isfinite(x):
-    if x is None:
-        return False
-    try:
-        return math.isfinite(float(x))
-    except (TypeError, ValueError):
-        return False
+    return {"py_results": py_results, "rows": all_rows}
 
 
 if __name__ == "__main__":
@@ -27,113 +27,48 @@ Metricas por metodo:
     - u_stab (incertidumbre por estabilidad)
     - u_xpt_def (incertidumbre combinada: sqrt(u_xpt^2 + u_hom^2 + u_stab^2))
     - U_xpt (incertidumbre expandida: k * u_xpt_def)
+
+Modo bootstrap (opcional, n_boot > 0 / `run_pipeline.py --bootstrap B`):
+remuestrea los resultados de participantes B veces por combo (ver
+bootstrap.py) y escribe outputs/stage_04_uncertainty_bootstrap.csv con el
+SE bootstrap y el intervalo percentil de x_pt y sigma_pt de los metodos
+de consenso y Algoritmo A, junto al u_xpt analitico (1.25*sigma/sqrt(n)).
+Con n_boot = 0 se elimina esa tabla si quedo de una corrida anterior.
 """
 
 import sys
 import os
 import csv as csv_mod
 import math
+from functools import partial
+
+import numpy as np
 
 sys.path.insert(0, os.path.dirname(__file__))
 
+from algorithm_a import algorithm_a_rows
+from bootstrap import BOOT_FIELDS, bootstrap_rows
+from columnar_io import load_rows, npz_path, table_exists, write_npz
+from comparison import KeyedIndex
+from data_store import load_data_store
 from helpers import (
-    COMBOS, make_combo_id, load_summary_combo, load_wide_data,
-    median, mad_e, niqr, TOL_DEFAULT, canonical_row, write_canonical_csv,
-    CANONICAL_COLS, STATUS_PASS, STATUS_FAIL, STATUS_EDGE,
+    discover_combos, make_combo_id,
+    pad_rows, robust_stats_rows, TOL_DEFAULT, canonical_table, write_canonical_csv,
+    CANONICAL_COLS, STATUS_PASS, STATUS_FAIL, STATUS_EDGE, resolve_path,
+    map_combos, status_labels, STATUS_CODE_PASS, STATUS_CODE_FAIL, STATUS_CODE_EDGE,
 )
+from random_streams import DEFAULT_SEED, seed_note
 
 DATA_SUMMARY = "../data/for_validation/summary_n4.csv"
 DATA_HOMOGENEITY = "../data/for_validation/homogeneity_n4.csv"
 DATA_STABILITY = "../data/for_validation/stability_n4.csv"
 HOM_PY_CSV = "outputs/stage_02_homogeneity_py.csv"
 STAB_PY_CSV = "outputs/stage_03_stability_py.csv"
-HOM_R_CSV = "outputs/stage_02_homogeneity_r.csv"
-STAB_R_CSV = "outputs/stage_03_stability_r.csv"
+R_CSV = "outputs/stage_04_uncertainty_chain_r.csv"
 OUTPUT_PY_CSV = "outputs/stage_04_uncertainty_chain_py.csv"
 OUTPUT_CSV = "outputs/stage_04_uncertainty_chain.csv"
 OUTPUT_REPORT = "outputs/stage_04_uncertainty_chain_report.md"
-
-
-def std(values):
-    """Calcular desviacion estandar muestral (ddof=1, como R sd())."""
-    n = len(values)
-    if n < 2:
-        return float("nan")
-    m = sum(values) / n
-    var = sum((x - m) ** 2 for x in values) / (n - 1)
-    return math.sqrt(var)
-
-
-def quantile_type7(values, prob):
-    """Calcular cuantil con metodo type-7 (interpolacion lineal, como R)."""
-    s = sorted(values)
-    n = len(s)
-    if n == 0:
-        return float("nan")
-    if n == 1:
-        return s[0]
-    h = (n - 1) * prob + 1
-    lo = int(math.floor(h))
-    hi = int(math.ceil(h))
-    if lo == hi or lo < 1:
-        return s[max(0, lo - 1)]
-    frac = h - lo
-    return s[lo - 1] * (1 - frac) + s[hi - 1] * frac
-
-
-def calculate_niqr(values):
-    """Calcular nIQR = 0.7413 * IQR."""
-    q1 = quantile_type7(values, 0.25)
-    q3 = quantile_type7(values, 0.75)
-    return 0.7413 * (q3 - q1)
-
-
-def run_algorithm_a(values, max_iter=50, tol=0.5):
-    """Algoritmo A de winsorizacion iterativa (ISO 13528:2022 Anexo C)."""
-    n = len(values)
-    if n < 4:
-        return {"error": "Algoritmo A requiere al menos 4 valores"}
-
-    x = sorted(values)
-    x_median = median(x)
-    x_mad = median([abs(xi - x_median) for xi in x])
-    sigma = 1.483 * x_mad
-
-    if sigma < 1e-15:
-        return {
-            "assigned_value": x_median,
-            "robust_sd": sigma,
-            "iterations": 0,
-            "converged": True,
-        }
-
-    for iter_num in range(1, max_iter + 1):
-        z = [(xi - x_median) / (1.5 * sigma) for xi in x]
-        x_w = [
-            x_median - 1.5 * sigma if zi < -1
-            else x_median + 1.5 * sigma if zi > 1
-            else xi
-            for xi, zi in zip(x, z)
-        ]
-        x_w_median = median(x_w)
-        x_w_mad = median([abs(xi - x_w_median) for xi in x_w])
-        sigma_w = 1.06 * x_w_mad
-
-        if abs(sigma_w - sigma) <= tol * sigma:
-            return {
-                "assigned_value": x_median,
-                "robust_sd": sigma_w,
-                "iterations": iter_num,
-                "converged": True,
-            }
-        sigma = sigma_w
-
-    return {
-        "assigned_value": x_median,
-        "robust_sd": sigma,
-        "iterations": max_iter,
-        "converged": False,
-    }
+OUTPUT_BOOT_CSV = "outputs/stage_04_uncertainty_bootstrap.csv"
 
 
 def calculate_uncertainty_chain(x_pt, sigma_pt, n_part, u_hom, u_stab, k=2):
@@ -164,105 +99,112 @@ def calculate_uncertainty_chain(x_pt, sigma_pt, n_part, u_hom, u_stab, k=2):
     }
 
 
-def load_homogeneity_results(csv_path):
-    """Cargar resultados de homogeneidad desde CSV."""
+def homogeneity_inputs(rows):
+    """u_hom y valor de referencia por combo desde filas de la Etapa 2."""
     results = {}
-    with open(csv_path, "r") as f:
-        reader = csv_mod.DictReader(f)
-        for row in reader:
-            combo_id = row["combo_id"]
-            results[combo_id] = {
-                "x_pt": float(row["x_pt"]),
-                "sigma_pt": float(row["sigma_pt"]),
-                "u_sigma_pt": float(row["u_sigma_pt"]),
-                "ss": float(row["ss"]),
-            }
+    for row in rows:
+        combo_id = row["combo_id"]
+        results[combo_id] = {
+            "x_pt": float(row["x_pt"]),
+            "sigma_pt": float(row["sigma_pt"]),
+            "u_sigma_pt": float(row["u_sigma_pt"]),
+            "ss": float(row["ss"]),
+        }
     return results
 
 
-def load_stability_results(csv_path):
-    """Cargar resultados de estabilidad desde CSV."""
+def stability_inputs(rows):
+    """u_stab por combo desde filas de la Etapa 3."""
     results = {}
-    with open(csv_path, "r") as f:
-        reader = csv_mod.DictReader(f)
-        for row in reader:
-            combo_id = row["combo_id"]
-            results[combo_id] = {
-                "u_stab_mean": float(row["u_stab_mean"]),
-            }
+    for row in rows:
+        combo_id = row["combo_id"]
+        results[combo_id] = {
+            "u_stab_mean": float(row["u_stab_mean"]),
+        }
     return results
 
 
-def run_stage_04():
-    print("Etapa 4: Cadena de incertidumbre — INICIO")
+def load_stage_inputs(results, csv_path, parse, phase):
+    """Resultados Python de una etapa previa: en memoria o desde su CSV _py."""
+    if results is not None:
+        return parse(results)
+    if table_exists(csv_path):
+        return parse(load_rows(csv_path))
+    print(f"  ADVERTENCIA: {csv_path} no encontrado. Ejecutar {phase} primero.")
+    return {}
 
-    # Leer resultados de etapas anteriores
-    hom_r = load_homogeneity_results(HOM_R_CSV)
-    stab_r = load_stability_results(STAB_R_CSV)
 
-    all_rows = []
-    discrepancies = []
-    edge_cases = []
-    combos_processed = []
+def compute_uncertainty_chain(store, hom_data, stab_data, combos, n_boot=0, seed=DEFAULT_SEED):
+    """Cadena de incertidumbre por combo (motor por lotes sobre `combos`).
+
+    Retorna una lista con un registro por combo: {"combo_id", "rows"
+    (filas canonicas sin comparar), "edge_case" (mensaje o None)}. Con
+    n_boot > 0 el registro incluye "bootstrap" (filas BOOT_FIELDS).
+    """
+    records = []
 
-    for combo in COMBOS:
+    # Estadisticos robustos de todos los combos del bloque en una sola llamada
+    combo_values = [
+        store.participant_values(combo["pollutant"], combo["level"])["mean_value"]
+        for combo in combos
+    ]
+    value_matrix = pad_rows(combo_values)
+    robust = robust_stats_rows(value_matrix)
+    algo = algorithm_a_rows(value_matrix, max_iter=50, tol=0.5)
+
+    for i, combo in enumerate(combos):
         combo_id = make_combo_id(combo["pollutant"], combo["level"])
         print(f"  Procesando: {combo['label']}")
 
         # Fase 4.1: Cargar datos
-        if combo_id not in hom_r:
+        if combo_id not in hom_data:
             print(f"    ADVERTENCIA: no hay datos de homogeneidad, saltando")
-            edge_cases.append(f"{combo_id}: sin datos de homogeneidad")
+            records.append({"combo_id": combo_id, "rows": [], "edge_case": f"{combo_id}: sin datos de homogeneidad"})
             continue
 
-        if combo_id not in stab_r:
+        if combo_id not in stab_data:
             print(f"    ADVERTENCIA: no hay datos de estabilidad, saltando")
-            edge_cases.append(f"{combo_id}: sin datos de estabilidad")
+            records.append({"combo_id": combo_id, "rows": [], "edge_case": f"{combo_id}: sin datos de estabilidad"})
             continue
 
         # Datos de participantes
-        agg = load_summary_combo(DATA_SUMMARY, combo["pollutant"], combo["level"])
-        n_part = len(agg)
+        n_part = len(combo_values[i])
 
         if n_part < 2:
             print(f"    ADVERTENCIA: menos de 2 participantes, saltando")
-            edge_cases.append(f"{combo_id}: menos de 2 participantes")
+            records.append({"combo_id": combo_id, "rows": [], "edge_case": f"{combo_id}: menos de 2 participantes"})
             continue
 
         # Fase 4.2: Calcular cadena de incertidumbre por metodo
-        values = agg["mean_value"].tolist()
-
         # Obtener u_hom y u_stab de etapas anteriores
-        u_hom_val = hom_r[combo_id]["ss"]
-        u_stab_val = stab_r[combo_id]["u_stab_mean"]
+        u_hom_val = hom_data[combo_id]["ss"]
+        u_stab_val = stab_data[combo_id]["u_stab_mean"]
 
         # Metodo 1: Referencia
-        x_pt_ref = hom_r[combo_id]["x_pt"]
-        sigma_pt_ref = hom_r[combo_id]["sigma_pt"]
+        x_pt_ref = hom_data[combo_id]["x_pt"]
+        sigma_pt_ref = hom_data[combo_id]["sigma_pt"]
         chain_ref = calculate_uncertainty_chain(
             x_pt_ref, sigma_pt_ref, n_part, u_hom_val, u_stab_val
         )
 
         # Metodo 2: Consenso MADe
-        median_val = median(values)
-        mad_val = mad_e(values) / 1.483  # Recuperar MAD original
-        sigma_pt_2a = 1.483 * mad_val
+        median_val = float(robust["median"][i])
+        sigma_pt_2a = float(robust["MADe"][i])
         chain_2a = calculate_uncertainty_chain(
             median_val, sigma_pt_2a, n_part, u_hom_val, u_stab_val
         )
 
         # Metodo 3: Consenso nIQR
-        sigma_pt_2b = calculate_niqr(values)
+        sigma_pt_2b = float(robust["nIQR"][i])
         chain_2b = calculate_uncertainty_chain(
             median_val, sigma_pt_2b, n_part, u_hom_val, u_stab_val
         )
 
         # Metodo 4: Algoritmo A
-        algo_res = run_algorithm_a(values, max_iter=50, tol=0.5)
-        if "error" not in algo_res:
+        if algo["valid"][i]:
             chain_algo = calculate_uncertainty_chain(
-                algo_res["assigned_value"],
-                algo_res["robust_sd"],
+                float(algo["assigned_value"][i]),
+                float(algo["robust_sd"][i]),
                 n_part,
                 u_hom_val,
                 u_stab_val,
@@ -286,24 +228,69 @@ def run_stage_04():
             ("Algoritmo A", chain_algo),
         ]
 
-        for method_name, chain in methods:
-            for metric in ["x_pt", "sigma_pt", "u_xpt", "u_hom", "u_stab", "u_xpt_def", "U_xpt"]:
-                row = canonical_row(
-                    combo_id=combo_id,
-                    pollutant=combo["pollutant"],
-                    level=combo["level"],
-                    stage="stage_04_uncertainty_chain",
-                    section=method_name,
-                    participant_id="",
-                    metric=metric,
-                    app_value=float("nan"),  # Se comparara despues
-                    r_value=float("nan"),
-                    python_value=chain[metric],
-                    tolerance=TOL_DEFAULT,
-                )
-                all_rows.append(row)
-
-        combos_processed.append(combo_id)
+        chain_metrics = ["x_pt", "sigma_pt", "u_xpt", "u_hom", "u_stab", "u_xpt_def", "U_xpt"]
+        sections = [name for name, _ in methods for _ in chain_metrics]
+        py_vals = [chain[metric] for _, chain in methods for metric in chain_metrics]
+        no_value = np.full(len(py_vals), np.nan)  # R/app se comparan despues
+        combo_rows = canonical_table(
+            {
+                "combo_id": combo_id,
+                "pollutant": combo["pollutant"],
+                "level": combo["level"],
+                "stage": "stage_04_uncertainty_chain",
+                "section": sections,
+                "metric": chain_metrics * len(methods),
+                "participant_id": "",
+            },
+            app=no_value, r=no_value, python=py_vals, tol=TOL_DEFAULT,
+        )
+
+        record = {"combo_id": combo_id, "rows": combo_rows, "edge_case": None}
+        if n_boot > 0:
+            record["bootstrap"] = bootstrap_rows(
+                combo_id, combo["pollutant"], combo["level"], combo_values[i],
+                n_boot, seed,
+            )
+        records.append(record)
+
+    return records
+
+
+def run_stage_04(
+    store=None, output_dir=None, r_dir=None, combos=None, workers=1, binary=False,
+    memo=None, n_boot=0, seed=DEFAULT_SEED, hom_results=None, stab_results=None,
+):
+    print("Etapa 4: Cadena de incertidumbre — INICIO")
+
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    r_csv_path = resolve_path(R_CSV, r_dir)
+
+    if store is None:
+        store = load_data_store(summary_path=DATA_SUMMARY)
+    if combos is None:
+        combos = discover_combos(store, tables=("summary",))
+
+    # u_hom / u_stab de las Etapas 2-3 (Python): en memoria si vienen del
+    # orquestador, si no desde sus CSV _py. R solo entra en la comparacion.
+    hom_data = load_stage_inputs(
+        hom_results, resolve_path(HOM_PY_CSV, output_dir), homogeneity_inputs, "Fase 2"
+    )
+    stab_data = load_stage_inputs(
+        stab_results, resolve_path(STAB_PY_CSV, output_dir), stability_inputs, "Fase 3"
+    )
+
+    discrepancies = []
+
+    records = map_combos(
+        partial(compute_uncertainty_chain, n_boot=n_boot, seed=seed), combos, workers,
+        args=(store, hom_data, stab_data), memo=memo,
+    )
+    all_rows = [row for rec in records for row in rec["rows"]]
+    edge_cases = [rec["edge_case"] for rec in records if rec["edge_case"]]
+    combos_processed = [rec["combo_id"] for rec in records if not rec["edge_case"]]
+    boot_rows = [row for rec in records for row in rec.get("bootstrap", [])]
 
     # Guardar resultados Python como CSV intermedio
     py_rows = []
@@ -318,47 +305,46 @@ def run_stage_04():
             "edge_case": False,
         })
 
-    os.makedirs(os.path.dirname(OUTPUT_PY_CSV), exist_ok=True)
-    with open(OUTPUT_PY_CSV, "w", newline="") as f:
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
+    with open(out_py_csv, "w", newline="") as f:
         writer = csv_mod.DictWriter(
             f,
             fieldnames=["combo_id", "pollutant", "level", "method", "metric", "value", "edge_case"],
         )
         writer.writeheader()
         writer.writerows(py_rows)
-    print(f"  CSV intermedio Python escrito: {OUTPUT_PY_CSV}")
+    print(f"  CSV intermedio Python escrito: {out_py_csv}")
+    if binary:
+        write_npz(
+            npz_path(out_py_csv), py_rows,
+            ["combo_id", "pollutant", "level", "method", "metric", "value", "edge_case"],
+        )
 
     # Leer CSV R y comparar
     comparison_rows = []
-    r_data = {}
-    r_csv_path = OUTPUT_PY_CSV.replace("_py.csv", "_r.csv")
-    if os.path.exists(r_csv_path):
-        with open(r_csv_path, "r") as f:
-            reader = csv_mod.DictReader(f)
-            for row in reader:
-                key = (row["combo_id"], row["method"], row["metric"])
-                r_data[key] = float(row["value"]) if row["value"] != "NA" else float("nan")
+    r_available = table_exists(r_csv_path)
+    if r_available:
+        r_index = KeyedIndex(load_rows(r_csv_path), ("combo_id", "method", "metric"), ("value",))
     else:
+        r_index = KeyedIndex([], ("combo_id", "method", "metric"), ("value",))
         print(f"  ADVERTENCIA: no existe el CSV R, se generara salida sin comparacion: {r_csv_path}")
 
-    for py_row in all_rows:
-        key = (py_row["combo_id"], py_row["section"], py_row["metric"])
-        r_value = r_data.get(key, float("nan"))
-        python_value = py_row["python_value"]
-
-        # Calcular diferencias
-        diff_rp = r_value - python_value if math.isfinite(r_value) and math.isfinite(python_value) else float("nan")
-
-        # Determinar status
-        if not os.path.exists(r_csv_path):
-            status = STATUS_EDGE
-        elif not math.isfinite(diff_rp):
-            status = STATUS_FAIL
-        elif abs(diff_rp) <= TOL_DEFAULT:
-            status = STATUS_PASS
-        else:
-            status = STATUS_FAIL
-
+    # Diferencia con signo R - Python y estado por columna
+    keys = [(row["combo_id"], row["section"], row["metric"]) for row in all_rows]
+    r_values = r_index.values("value", keys)
+    py_values = np.array([row["python_value"] for row in all_rows], dtype=float)
+    both = np.isfinite(r_values) & np.isfinite(py_values)
+    diff_rp = np.where(both, r_values - py_values, np.nan)
+    with np.errstate(invalid="ignore"):
+        codes = np.where(np.abs(diff_rp) <= TOL_DEFAULT, STATUS_CODE_PASS, STATUS_CODE_FAIL)
+    # Combos fuera de la referencia R: caso borde, no discrepancia
+    r_combos = {key[0] for key in r_index.positions}
+    no_ref = np.array([row["combo_id"] not in r_combos for row in all_rows], dtype=bool)
+    codes[no_ref] = STATUS_CODE_EDGE
+    statuses = status_labels(codes)
+    r_values, diff_rp = r_values.tolist(), diff_rp.tolist()
+
+    for i, py_row in enumerate(all_rows):
         comparison_row = {
             "combo_id": py_row["combo_id"],
             "pollutant": py_row["pollutant"],
@@ -368,19 +354,36 @@ def run_stage_04():
             "participant_id": py_row["participant_id"],
             "metric": py_row["metric"],
             "app_value": float("nan"),
-            "r_value": r_value,
-            "python_value": python_value,
+            "r_value": r_values[i],
+            "python_value": py_row["python_value"],
             "diff_app_r": float("nan"),
             "diff_app_python": float("nan"),
-            "diff_r_python": diff_rp,
-            "status": status,
+            "diff_r_python": diff_rp[i],
+            "status": statuses[i],
             "tolerance": TOL_DEFAULT,
-            "notes": "",
+            "notes": "sin referencia R" if no_ref[i] else "",
         }
         comparison_rows.append(comparison_row)
 
-    write_canonical_csv(comparison_rows, OUTPUT_CSV)
-    print(f"  CSV comparacion escrito: {OUTPUT_CSV}")
+    write_canonical_csv(comparison_rows, out_csv)
+    if binary:
+        write_npz(npz_path(out_csv), comparison_rows, CANONICAL_COLS)
+    print(f"  CSV comparacion escrito: {out_csv}")
+
+    out_boot_csv = resolve_path(OUTPUT_BOOT_CSV, output_dir)
+    if n_boot > 0:
+        with open(out_boot_csv, "w", newline="") as f:
+            writer = csv_mod.DictWriter(f, fieldnames=BOOT_FIELDS)
+            writer.writeheader()
+            writer.writerows(boot_rows)
+        print(f"  CSV bootstrap escrito: {out_boot_csv} (B={n_boot}, semilla={seed})")
+        if binary:
+            write_npz(npz_path(out_boot_csv), boot_rows, BOOT_FIELDS)
+    else:
+        # Sin bootstrap no queda una tabla de una corrida anterior
+        for path in (out_boot_csv, npz_path(out_boot_csv)):
+            if os.path.exists(path):
+                os.remove(path)
 
     # Generar reporte
     pass_count = sum(1 for r in comparison_rows if r["status"] == STATUS_PASS)
@@ -392,8 +395,10 @@ def run_stage_04():
         "",
         f"**Fecha**: {os.popen('date +%Y-%m-%d').read().strip()}",
         "",
-        "## Combos procesados",
     ]
+    if n_boot > 0:
+        report_lines.extend([seed_note(seed), ""])
+    report_lines.append("## Combos procesados")
     for cid in combos_processed:
         report_lines.append(f"- {cid}")
 
@@ -404,6 +409,26 @@ def run_stage_04():
         f"- FAIL: {fail_count}",
         f"- EDGE_CASE: {edge_count}",
         f"- KNOWN_DISCREPANCY: 0",
+    ])
+
+    if n_boot > 0:
+        report_lines.extend([
+            "",
+            f"## Bootstrap de x_pt (B={n_boot}, semilla={seed})",
+            "",
+            "| Combo | Metodo | n | u_xpt analitico | SE bootstrap | SE/u | IC 95% x_pt |",
+            "|---|---|---|---|---|---|---|",
+        ])
+        for row in boot_rows:
+            if row["metric"] != "x_pt":
+                continue
+            report_lines.append(
+                f"| {row['combo_id']} | {row['method']} | {row['n']} | "
+                f"{row['u_analytic']:.6g} | {row['boot_se']:.6g} | {row['se_ratio']:.3f} | "
+                f"[{row['ci_low']:.6g}, {row['ci_high']:.6g}] |"
+            )
+
+    report_lines.extend([
         "",
         "## Observaciones",
         "(pendiente)",
@@ -412,11 +437,12 @@ def run_stage_04():
         "Etapa PASS" if fail_count == 0 else "Etapa con FAIL pendientes de revision",
     ])
 
-    with open(OUTPUT_REPORT, "w") as f:
+    with open(out_report, "w") as f:
         f.write("\n".join(report_lines))
-    print(f"  Reporte escrito: {OUTPUT_REPORT}")
+    print(f"  Reporte escrito: {out_report}")
 
     print("Etapa 4: Cadena de incertidumbre — FIN")
+    return {"py_results": py_rows, "rows": comparison_rows}
 
 
 if __name__ == "__main__":
@@ -18,23 +18,62 @@ Scores validados (8 metricas por participante/metodo):
     z_prime_score, z_prime_score_eval
     zeta_score, zeta_score_eval
     En_score, En_score_eval
+
+Modo leave-one-out (opcional, loo=True / `run_pipeline.py --loo`): para
+cada combo y metodo de consenso retira cada participante y recalcula
+x_pt, sigma_pt y el z de los demas en un solo lote (ver influence.py).
+Escribe outputs/stage_05_loo_influence.csv (una fila por participante
+retirado) y outputs/stage_05_loo_z.csv (z de cada participante restante).
+
+Modo Monte Carlo (opcional, n_mc > 0 / `run_pipeline.py --monte-carlo M`):
+simula M draws de los resultados de participantes (correlacion mc_rho),
+de ss y de u_stab_mean y los propaga por las Etapas 4 y 5 en bloques de
+memoria acotada (ver monte_carlo.py). Escribe
+outputs/stage_05_monte_carlo.csv con media, sd, intervalo 95% y
+probabilidad de cada categoria de evaluacion de z, zeta y En.
 """
 
 import csv
 import math
 import os
+import sys
+from functools import partial
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from columnar_io import load_rows, npz_path, write_npz
+from comparison import KeyedIndex, compare_rounded, fmt_diff
+from data_store import first_seen_groups, is_ref_participant, load_data_store
+from helpers import (
+    CanonicalSummary, discover_combos, map_combos, resolve_path, status_labels,
+    write_canonical_rows,
+)
+from bootstrap import method_estimates
+from influence import LOO_FIELDS, LOO_METHODS, LOO_Z_FIELDS, leave_one_out_sorted, loo_estimates
+from monte_carlo import (
+    MC_CHAIN, MC_FIELDS, MC_SCORES, MonteCarloSummary, participant_errors,
+    uncertainty_chain_rows,
+)
+from random_streams import CHUNK_SIZE, DEFAULT_SEED, chunk_streams, seed_note
 
 DATA_SUMMARY     = "../data/for_validation/summary_n4.csv"
 DATA_PT_DATA     = "../data/pt_data_n13.csv"
 STAGE04_CSV      = "outputs/stage_04_uncertainty_chain.csv"
 R_CSV            = "outputs/stage_05_scores_r.csv"
 OUTPUT_PY_CSV    = "outputs/stage_05_scores_py.csv"
+OUTPUT_LOO_CSV   = "outputs/stage_05_loo_influence.csv"
+OUTPUT_LOO_Z_CSV = "outputs/stage_05_loo_z.csv"
+OUTPUT_MC_CSV    = "outputs/stage_05_monte_carlo.csv"
 OUTPUT_CSV       = "outputs/stage_05_scores.csv"
 OUTPUT_REPORT    = "outputs/stage_05_scores_report.md"
 
 TOL_DEFAULT = 1e-9
 STATUS_PASS = "PASS"
 STATUS_FAIL = "FAIL"
+STATUS_EDGE = "EDGE_CASE"
+NO_R_REFERENCE = "sin referencia R"
 K = 2  # Factor de cobertura
 
 METHODS = ["Referencia", "Consenso MADe", "Consenso nIQR", "Algoritmo A"]
@@ -60,23 +99,45 @@ CANONICAL_COLS = [
 # Evaluaciones
 # ---------------------------------------------------------------------------
 
+# Codigos enteros de evaluacion; las etiquetas solo se usan al escribir salidas
+EVAL_NA, EVAL_SATISFACTORY, EVAL_QUESTIONABLE, EVAL_UNSATISFACTORY = 0, 1, 2, 3
+EVAL_LABELS = np.array(
+    ["N/A", "Satisfactorio", "Cuestionable", "No satisfactorio"], dtype=object
+)
+
+
+def evaluate_z_codes(z):
+    """Evaluar z / z' / zeta como codigos (|z| <= 2, 2 < |z| < 3, |z| >= 3)."""
+    z = np.asarray(z, dtype=float)
+    az = np.abs(z)
+    codes = np.full(z.shape, EVAL_QUESTIONABLE, dtype=np.int8)
+    codes[az <= 2] = EVAL_SATISFACTORY
+    codes[az >= 3] = EVAL_UNSATISFACTORY
+    codes[~np.isfinite(z)] = EVAL_NA
+    return codes
+
+
+def evaluate_en_codes(en):
+    """Evaluar En como codigos (|En| <= 1 satisfactorio)."""
+    en = np.asarray(en, dtype=float)
+    codes = np.where(np.abs(en) <= 1, EVAL_SATISFACTORY, EVAL_UNSATISFACTORY).astype(np.int8)
+    codes[~np.isfinite(en)] = EVAL_NA
+    return codes
+
+
+def eval_labels(codes):
+    """Traducir codigos de evaluacion a etiquetas de texto."""
+    return EVAL_LABELS[np.asarray(codes, dtype=np.int64)]
+
+
 def evaluate_z(z):
     """Evaluar z / z' / zeta."""
-    if not math.isfinite(z):
-        return "N/A"
-    az = abs(z)
-    if az <= 2:
-        return "Satisfactorio"
-    if az >= 3:
-        return "No satisfactorio"
-    return "Cuestionable"
+    return str(eval_labels(evaluate_z_codes(z)))
 
 
 def evaluate_en(en):
     """Evaluar En."""
-    if not math.isfinite(en):
-        return "N/A"
-    return "Satisfactorio" if abs(en) <= 1 else "No satisfactorio"
+    return str(eval_labels(evaluate_en_codes(en)))
 
 
 # ---------------------------------------------------------------------------
@@ -90,7 +151,10 @@ def make_combo_id(pollutant, level):
 
 
 def parse_float(s):
-    """Parsear string a float; devuelve nan para NA/nan/vacío."""
+    """Parsear string a float; devuelve nan para NA/nan/vacío.
+    Los valores ya tipados (leidos de .npz) se devuelven como float."""
+    if isinstance(s, (int, float)):
+        return float(s)
     if s is None or s.strip() in ("", "NA", "NaN", "nan"):
         return float("nan")
     try:
@@ -106,66 +170,91 @@ def fmt_float(v):
     return f"{v:.4f}"
 
 
+def fmt_cell(v):
+    """Formatear una celda del CSV intermedio (texto tal cual, floats con fmt_float)."""
+    if isinstance(v, str):
+        return v
+    if isinstance(v, float):
+        return fmt_float(v)
+    return str(v)
+
+
 # ---------------------------------------------------------------------------
 # Carga de datos
 # ---------------------------------------------------------------------------
 
-def load_stage04_params(csv_path):
-    """Retorna dict (combo_id, method) -> {x_pt, sigma_pt, u_xpt_def}."""
+def _as_float(value):
+    return parse_float(value) if isinstance(value, str) else float(value)
+
+
+def stage04_params_from_rows(rows):
+    """Retorna dict (combo_id, method) -> {x_pt, sigma_pt, u_xpt_def, u_hom, u_stab}.
+
+    `rows` son filas canonicas de la Etapa 4 (leidas del CSV o en memoria).
+    Se usa el valor R; en combos sin referencia R, el valor Python.
+    """
     params = {}
-    with open(csv_path, "r", newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            if row["metric"] not in ("x_pt", "sigma_pt", "u_xpt_def"):
-                continue
-            key = (row["combo_id"], row["section"])
-            if key not in params:
-                params[key] = {
-                    "pollutant": row["pollutant"],
-                    "level": row["level"],
-                }
-            params[key][row["metric"]] = parse_float(row["r_value"])
+    for row in rows:
+        if row["metric"] not in ("x_pt", "sigma_pt", "u_xpt_def", "u_hom", "u_stab"):
+            continue
+        key = (row["combo_id"], row["section"])
+        if key not in params:
+            params[key] = {
+                "pollutant": row["pollutant"],
+                "level": row["level"],
+            }
+        source = "python_value" if row.get("notes") == NO_R_REFERENCE else "r_value"
+        params[key][row["metric"]] = _as_float(row[source])
     return params
 
 
-def load_pt_data(csv_path):
-    """Carga participants_data4.csv. Retorna dict (combo_id, participant_id) -> u_i."""
+
+def load_stage04_params(csv_path):
+    """Carga la salida canonica de la Etapa 4 (.npz si esta vigente, si no
+    CSV) y extrae parametros por combo/metodo."""
+    return stage04_params_from_rows(load_rows(csv_path))
+
+
+def load_pt_data(store):
+    """Toma u_i del almacen (pt_data). Retorna dict (combo_id, participant_id) -> u_i."""
     u_map = {}
-    if not os.path.exists(csv_path):
+    if not store.has_table("pt_data"):
         import warnings
         warnings.warn(
-            f"Archivo '{csv_path}' no encontrado. zeta y En no se calcularán sin u_i."
+            f"Archivo '{DATA_PT_DATA}' no encontrado. zeta y En no se calcularán sin u_i."
         )
         return u_map
-    with open(csv_path, "r", newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            combo_id = make_combo_id(row["pollutant"], row["level"])
-            key = (combo_id, row["participant_id"])
-            u_map[key] = parse_float(row["u_i"])
+    for (pollutant, level, participant_id), u_i in store.u_map().items():
+        u_map[(make_combo_id(pollutant, level), participant_id)] = u_i
     return u_map
 
 
-def load_participants(csv_path, u_map):
-    """Agrega summary_n4.csv por (combo_id, participant_id).
+def load_participants(store, u_map):
+    """Agrega summary_n4.csv (ya cargado en el almacen) por (combo_id, participant_id).
     Retorna dict (combo_id, participant_id) -> {result, sd_value, uncertainty_std, ...}.
     uncertainty_std = u_i reportada por el participante (presupuesto propio).
     Sin u_i, zeta y En quedan no calculables.
     """
+    tbl = store.table("summary")
+    cols, codes = tbl.columns, tbl.codes
+    # Grupos (pollutant, level, participant_id) sobre codigos enteros
+    n_levels = len(tbl.keys.labels["level"])
+    n_pids = len(tbl.keys.labels["participant_id"])
+    key = (codes["pollutant"].astype(np.int64) * n_levels + codes["level"]) * n_pids
+    key += codes["participant_id"]
     raw = {}
-    with open(csv_path, "r", newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            if row["participant_id"] == "ref":
-                continue
-            combo_id = make_combo_id(row["pollutant"], row["level"])
-            key = (combo_id, row["participant_id"])
-            if key not in raw:
-                raw[key] = {
-                    "mean_values": [],
-                    "sd_values": [],
-                    "pollutant": row["pollutant"],
-                    "level": row["level"],
-                }
-            raw[key]["mean_values"].append(float(row["mean_value"]))
-            raw[key]["sd_values"].append(float(row["sd_value"]))
+    for _, idx in zip(*first_seen_groups(key)):
+        first = idx[0]
+        participant_id = cols["participant_id"][first]
+        if is_ref_participant(participant_id):
+            continue
+        pollutant, level = cols["pollutant"][first], cols["level"][first]
+        raw[(make_combo_id(pollutant, level), participant_id)] = {
+            "mean_values": cols["mean_value"][idx].tolist(),
+            "sd_values": cols["sd_value"][idx].tolist(),
+            "pollutant": pollutant,
+            "level": level,
+        }
 
     result = {}
     missing_ui = []
@@ -213,53 +302,292 @@ def load_participants(csv_path, u_map):
 # Calculo de scores
 # ---------------------------------------------------------------------------
 
-def calculate_scores(result, uncertainty_std, x_pt, sigma_pt, u_xpt_def):
-    """Calcular 4 scores numericos + 4 evaluaciones categoriales."""
-    # Clip u_xpt_def no finito a 0 (igual que app.R compute_combo_scores)
-    if not math.isfinite(u_xpt_def) or u_xpt_def < 0:
-        u_xpt_def = 0.0
-
-    # z_score
-    if math.isfinite(sigma_pt) and sigma_pt > 0:
-        z = (result - x_pt) / sigma_pt
-    else:
-        z = float("nan")
-
-    # z_prime_score
-    if math.isfinite(sigma_pt):
-        zprime_den = math.sqrt(sigma_pt**2 + u_xpt_def**2)
-        zprime = (result - x_pt) / zprime_den if zprime_den > 0 else float("nan")
-    else:
-        zprime = float("nan")
-
-    # zeta_score
-    zeta_den_sq = uncertainty_std**2 + u_xpt_def**2
-    if math.isfinite(zeta_den_sq) and zeta_den_sq >= 0:
-        zeta_den = math.sqrt(zeta_den_sq)
-        zeta = (result - x_pt) / zeta_den if zeta_den > 0 else float("nan")
-    else:
-        zeta = float("nan")
+def score_kernel(result, uncertainty_std, x_pt, sigma_pt, u_xpt_def, k=K):
+    """Calcular z, z', zeta y En para arreglos alineados (o escalares).
 
-    # En_score (k=2)
-    en_den_sq = (K * uncertainty_std)**2 + (K * u_xpt_def)**2
-    if math.isfinite(en_den_sq) and en_den_sq >= 0:
-        en_den = math.sqrt(en_den_sq)
-        en = (result - x_pt) / en_den if en_den > 0 else float("nan")
-    else:
-        en = float("nan")
+    Retorna dict con los 4 arreglos de scores y 4 arreglos de codigos de
+    evaluacion (int8, ver EVAL_LABELS). Un denominador nulo o no finito
+    produce NaN, igual que la version por fila.
+    """
+    result, uncertainty_std, x_pt, sigma_pt, u_xpt_def = np.broadcast_arrays(
+        *(np.asarray(a, dtype=float) for a in
+          (result, uncertainty_std, x_pt, sigma_pt, u_xpt_def))
+    )
+    # Clip u_xpt_def no finito o negativo a 0 (igual que app.R compute_combo_scores)
+    u_xpt_def = np.where(np.isfinite(u_xpt_def) & (u_xpt_def >= 0), u_xpt_def, 0.0)
+    with np.errstate(invalid="ignore"):
+        diff = result - x_pt
+
+    def _ratio(den_sq, ok):
+        ok = ok & np.isfinite(den_sq) & (den_sq >= 0)
+        den = np.sqrt(np.where(ok, den_sq, 1.0))
+        ok = ok & (den > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(ok, diff / np.where(ok, den, 1.0), np.nan)
+
+    sigma_ok = np.isfinite(sigma_pt)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(sigma_ok & (sigma_pt > 0), diff / sigma_pt, np.nan)
+    # Cuadrados como x*x (igual que x^2 en R)
+    zprime = _ratio(np.square(sigma_pt) + np.square(u_xpt_def), sigma_ok)
+    zeta = _ratio(np.square(uncertainty_std) + np.square(u_xpt_def), True)
+    en = _ratio(np.square(k * uncertainty_std) + np.square(k * u_xpt_def), True)
 
     return {
         "z_score":             z,
         "z_prime_score":       zprime,
         "zeta_score":          zeta,
         "En_score":            en,
-        "z_score_eval":        evaluate_z(z),
-        "z_prime_score_eval":  evaluate_z(zprime),
-        "zeta_score_eval":     evaluate_z(zeta),
-        "En_score_eval":       evaluate_en(en),
+        "z_score_eval":        evaluate_z_codes(z),
+        "z_prime_score_eval":  evaluate_z_codes(zprime),
+        "zeta_score_eval":     evaluate_z_codes(zeta),
+        "En_score_eval":       evaluate_en_codes(en),
     }
 
 
+def calculate_scores(result, uncertainty_std, x_pt, sigma_pt, u_xpt_def):
+    """Calcular 4 scores numericos + 4 evaluaciones categoriales (una fila)."""
+    scores = score_kernel(result, uncertainty_std, x_pt, sigma_pt, u_xpt_def)
+    return {
+        name: (str(eval_labels(v)) if name.endswith("_eval") else float(v))
+        for name, v in scores.items()
+    }
+
+
+def compute_scores(params, by_combo, combo_ids):
+    """Scores de los participantes de `combo_ids` con una sola llamada al kernel.
+
+    params: (combo_id, metodo) -> {x_pt, sigma_pt, u_xpt_def};
+    by_combo: combo_id -> participant_id -> datos de load_participants.
+    """
+    # Columnas planas en el orden combo -> metodo -> participante
+    keys = []
+    cols = {name: [] for name in ("result", "uncertainty_std", "x_pt", "sigma_pt", "u_xpt_def")}
+    for combo_id in combo_ids:
+        for method in METHODS:
+            key = (combo_id, method)
+            if key not in params:
+                continue
+            p = params[key]
+            x_pt      = p.get("x_pt", float("nan"))
+            sigma_pt  = p.get("sigma_pt", float("nan"))
+            u_xpt_def = p.get("u_xpt_def", float("nan"))
+
+            for participant_id in sorted(by_combo[combo_id].keys()):
+                pt = by_combo[combo_id][participant_id]
+                keys.append((combo_id, pt["pollutant"], pt["level"], method, participant_id))
+                cols["result"].append(pt["result"])
+                cols["uncertainty_std"].append(pt["uncertainty_std"])
+                cols["x_pt"].append(x_pt)
+                cols["sigma_pt"].append(sigma_pt)
+                cols["u_xpt_def"].append(u_xpt_def)
+
+    arrays = {name: np.asarray(vals, dtype=float) for name, vals in cols.items()}
+    scores = score_kernel(
+        arrays["result"], arrays["uncertainty_std"],
+        arrays["x_pt"], arrays["sigma_pt"], arrays["u_xpt_def"],
+    )
+    # Las etiquetas de evaluacion se decodifican solo al construir filas
+    labels = {m: eval_labels(scores[m]) for m in EVAL_METRICS}
+
+    py_results = []
+    for i, (combo_id, pollutant, level, method, participant_id) in enumerate(keys):
+        row = {
+            "combo_id":       combo_id,
+            "pollutant":      pollutant,
+            "level":          level,
+            "method":         method,
+            "participant_id": participant_id,
+        }
+        for name, arr in arrays.items():
+            row[name] = float(arr[i])
+        for metric in NUMERIC_METRICS:
+            row[metric] = float(scores[metric][i])
+        for metric in EVAL_METRICS:
+            row[metric] = labels[metric][i]
+        py_results.append(row)
+    return py_results
+
+
+def compute_influence(store, by_combo, combo_ids):
+    """Influencia leave-one-out de cada participante sobre x_pt, sigma_pt
+    y el z de los demas, por combo y metodo de consenso.
+
+    Las P muestras reducidas de un combo se evaluan juntas (ver
+    influence.py) y los z de todos los escenarios salen de una llamada a
+    score_kernel sobre la matriz (P + 1) x P. Retorna una lista con un
+    registro por combo: {"combo_id", "rows" (LOO_FIELDS), "z_rows"
+    (LOO_Z_FIELDS)}.
+    """
+    records = []
+    for combo_id in combo_ids:
+        pids = sorted(by_combo[combo_id].keys())
+        first = by_combo[combo_id][pids[0]]
+        pollutant, level = first["pollutant"], first["level"]
+        data = store.participant_values(pollutant, level)
+        stats = leave_one_out_sorted(data["mean_value"], data["participant_id"], pids)
+        estimates = loo_estimates(stats)
+        results = np.array([by_combo[combo_id][pid]["result"] for pid in pids], dtype=float)
+        others = ~np.eye(len(pids), dtype=bool)
+
+        rows, z_rows = [], []
+        for method in LOO_METHODS:
+            x_pt, sigma_pt = estimates[method]
+            scores = score_kernel(
+                results[None, :], np.nan, x_pt[:, None], sigma_pt[:, None], np.nan
+            )
+            z_full, z_loo = scores["z_score"][0], scores["z_score"][1:]
+            eval_full, eval_loo = scores["z_score_eval"][0], scores["z_score_eval"][1:]
+            with np.errstate(invalid="ignore"):
+                delta_z = z_loo - z_full[None, :]
+            abs_delta = np.where(others & np.isfinite(delta_z), np.abs(delta_z), -1.0)
+            top = abs_delta.argmax(axis=1)
+            changes = (others & (eval_loo != eval_full[None, :])).sum(axis=1)
+            labels_full, labels_loo = eval_labels(eval_full), eval_labels(eval_loo)
+
+            for k, removed in enumerate(pids):
+                rows.append({
+                    "combo_id": combo_id,
+                    "pollutant": pollutant,
+                    "level": level,
+                    "method": method,
+                    "removed_participant": removed,
+                    "n_loo": int(stats.n[k + 1]),
+                    "x_pt": float(x_pt[0]),
+                    "x_pt_loo": float(x_pt[k + 1]),
+                    "delta_x_pt": float(x_pt[k + 1] - x_pt[0]),
+                    "sigma_pt": float(sigma_pt[0]),
+                    "sigma_pt_loo": float(sigma_pt[k + 1]),
+                    "delta_sigma_pt": float(sigma_pt[k + 1] - sigma_pt[0]),
+                    "max_abs_delta_z": (
+                        float(abs_delta[k, top[k]]) if abs_delta[k, top[k]] >= 0 else float("nan")
+                    ),
+                    "max_delta_z_participant": (
+                        pids[top[k]] if abs_delta[k, top[k]] >= 0 else ""
+                    ),
+                    "z_eval_changes": int(changes[k]),
+                })
+                for j, participant_id in enumerate(pids):
+                    if j == k:
+                        continue
+                    z_rows.append({
+                        "combo_id": combo_id,
+                        "pollutant": pollutant,
+                        "level": level,
+                        "method": method,
+                        "removed_participant": removed,
+                        "participant_id": participant_id,
+                        "z_score": float(z_full[j]),
+                        "z_score_loo": float(z_loo[k, j]),
+                        "delta_z": float(delta_z[k, j]),
+                        "z_score_eval": labels_full[j],
+                        "z_score_eval_loo": labels_loo[k, j],
+                    })
+        records.append({"combo_id": combo_id, "rows": rows, "z_rows": z_rows})
+    return records
+
+
+def compute_monte_carlo(store, by_combo, params, combo_ids, n_draws=0, rho=0.0,
+                        seed=DEFAULT_SEED, chunk_size=CHUNK_SIZE):
+    """Distribuciones Monte Carlo de x_pt_def, sigma_pt, u_xpt_def y de z,
+    zeta y En por combo y metodo (ver monte_carlo.py).
+
+    Incertidumbres propagadas por muestreo en cada draw:
+        - resultados de participantes (u_i reportada o sd/sqrt(3), con
+          correlacion rho); x_pt y sigma_pt se recalculan por metodo;
+        - u_hom y u_stab como desplazamientos aleatorios d_hom ~ N(0, u_hom)
+          y d_stab ~ N(0, u_stab) de x_pt_def, por lo que la dispersion de
+          z, z', zeta y En las incluye.
+    El denominador u_xpt_def se evalua por draw como en la Etapa 4
+    (cuadratura de u_xpt del draw con u_hom y u_stab fijos); no se
+    muestrea por separado.
+
+    Cada bloque de draws usa su propio flujo (random_streams), por lo que
+    el resultado no depende de como se repartan los combos entre workers.
+    Los combos sin parametros de la Etapa 4 se omiten. Retorna una lista
+    con un registro por combo: {"combo_id", "rows" (MC_FIELDS)}.
+    """
+    records = []
+    for combo_id in combo_ids:
+        methods = [m for m in METHODS if (combo_id, m) in params]
+        if not methods:
+            records.append({"combo_id": combo_id, "rows": []})
+            continue
+        pids = sorted(by_combo[combo_id].keys())
+        parts = [by_combo[combo_id][pid] for pid in pids]
+        pollutant, level = parts[0]["pollutant"], parts[0]["level"]
+        data = store.participant_values(pollutant, level)
+        values = np.asarray(data["mean_value"], dtype=float)
+        index = {pid: j for j, pid in enumerate(pids)}
+        unknown = sorted({str(p) for p in data["participant_id"]} - set(index))
+        if unknown:
+            raise ValueError(
+                f"{combo_id}: participantes sin resultado agregado: {', '.join(unknown)}"
+            )
+        owner = np.array([index[str(p)] for p in data["participant_id"]], dtype=np.int64)
+        results = np.array([pt["result"] for pt in parts], dtype=float)
+        u_std = np.array([pt["uncertainty_std"] for pt in parts], dtype=float)
+        # Desviacion de los draws: u_i reportada o, si falta, sd/sqrt(3)
+        u_draw = np.where(
+            np.isfinite(u_std) & (u_std > 0), u_std,
+            np.array([pt["u_i_check"] for pt in parts], dtype=float),
+        )
+        u_draw = np.where(np.isfinite(u_draw), u_draw, 0.0)
+        # u_hom y u_stab (Etapas 2 y 3) son comunes a los metodos del combo
+        first = params[(combo_id, methods[0])]
+        u_hom = first.get("u_hom", float("nan"))
+        u_stab = first.get("u_stab", float("nan"))
+        d_scale = np.array([u_hom, u_stab], dtype=float)
+        d_scale = np.where(np.isfinite(d_scale), d_scale, 0.0)
+
+        acc = MonteCarloSummary()
+        for size, rng in chunk_streams(seed, combo_id, n_draws, chunk_size):
+            errors = participant_errors(rng, size, u_draw, rho)
+            # d_hom ~ N(0, u_hom) y d_stab ~ N(0, u_stab): componentes
+            # aleatorias de x_pt_def, comunes a los participantes del draw
+            d_hom, d_stab = (rng.standard_normal((size, 2)) * d_scale[None, :]).T
+            estimates = method_estimates(values[None, :] + errors[:, owner])
+            for method in methods:
+                if method == "Referencia":
+                    p = params[(combo_id, method)]
+                    x_pt = np.full(size, p.get("x_pt", float("nan")))
+                    sigma_pt = np.full(size, p.get("sigma_pt", float("nan")))
+                else:
+                    x_pt, sigma_pt = estimates[method]
+                x_pt_def = x_pt + (d_hom + d_stab)
+                u_xpt_def = uncertainty_chain_rows(sigma_pt, values.size, u_hom, u_stab)
+                scores = score_kernel(
+                    results[None, :] + errors, u_std[None, :],
+                    x_pt_def[:, None], sigma_pt[:, None], u_xpt_def[:, None],
+                )
+                chain = {"x_pt": x_pt_def, "sigma_pt": sigma_pt, "u_xpt_def": u_xpt_def}
+                for metric in MC_CHAIN:
+                    acc.add((method, metric), chain[metric][:, None])
+                for metric in MC_SCORES:
+                    acc.add((method, metric), scores[metric], codes=scores[metric + "_eval"])
+
+        rows = []
+        for method in methods:
+            for metric in MC_CHAIN + MC_SCORES:
+                res = acc.result((method, metric))
+                targets = [""] if metric in MC_CHAIN else pids
+                for j, participant_id in enumerate(targets):
+                    row = {
+                        "combo_id": combo_id,
+                        "pollutant": pollutant,
+                        "level": level,
+                        "method": method,
+                        "participant_id": participant_id,
+                        "metric": metric,
+                        "draws": res["draws"],
+                    }
+                    for name in MC_FIELDS[7:]:
+                        row[name] = float(res[name][j])
+                    rows.append(row)
+        records.append({"combo_id": combo_id, "rows": rows})
+    return records
+
+
 # ---------------------------------------------------------------------------
 # Comparacion R vs Python
 # ---------------------------------------------------------------------------
@@ -291,116 +619,40 @@ def compare_categorical(r_val, py_val):
     return STATUS_PASS if normalize_eval(r_val) == normalize_eval(py_val) else STATUS_FAIL
 
 
-# ---------------------------------------------------------------------------
-# Main
-# ---------------------------------------------------------------------------
-
-def run_stage_05():
-    print("Etapa 5: Scores de Desempeño — INICIO")
-
-    # 1. Cargar parámetros de Etapa 4
-    params = load_stage04_params(STAGE04_CSV)
-    print(f"  Parámetros cargados: {len(params)} combinaciones combo × método")
-
-    # 2. Cargar u_i desde pt_data_n13.csv
-    u_map = load_pt_data(DATA_PT_DATA)
-    print(f"  u_i cargados: {len(u_map)} entradas (combo × participante)")
-
-    # 3. Cargar datos de participantes
-    participants = load_participants(DATA_SUMMARY, u_map)
-    print(f"  Participantes cargados: {len(participants)} (sin 'ref')")
-
-    # Organizar por combo_id
-    combos = {}
-    for (combo_id, participant_id), data in participants.items():
-        if combo_id not in combos:
-            combos[combo_id] = {}
-        combos[combo_id][participant_id] = data
-
-    # 3. Calcular scores en Python
-    py_results = []
-    for combo_id in sorted(combos.keys()):
-        for method in METHODS:
-            key = (combo_id, method)
-            if key not in params:
-                continue
-            p = params[key]
-            x_pt      = p.get("x_pt", float("nan"))
-            sigma_pt  = p.get("sigma_pt", float("nan"))
-            u_xpt_def = p.get("u_xpt_def", float("nan"))
-
-            for participant_id in sorted(combos[combo_id].keys()):
-                pt = combos[combo_id][participant_id]
-                scores = calculate_scores(
-                    pt["result"], pt["uncertainty_std"],
-                    x_pt, sigma_pt, u_xpt_def,
-                )
-                py_results.append({
-                    "combo_id":       combo_id,
-                    "pollutant":      pt["pollutant"],
-                    "level":          pt["level"],
-                    "method":         method,
-                    "participant_id": participant_id,
-                    "result":         pt["result"],
-                    "uncertainty_std": pt["uncertainty_std"],
-                    "x_pt":           x_pt,
-                    "sigma_pt":       sigma_pt,
-                    "u_xpt_def":      u_xpt_def,
-                    **scores,
-                })
-
-    expected_rows = len(py_results) * len(ALL_METRICS)
-    print(
-        f"  Scores calculados: {len(py_results)} filas base "
-        f"(esperado para comparacion: {expected_rows})"
-    )
-
-    # 4. Guardar CSV intermedio Python
-    os.makedirs(os.path.dirname(OUTPUT_PY_CSV), exist_ok=True)
-    py_fields = [
-        "combo_id", "pollutant", "level", "method", "participant_id",
-        "result", "uncertainty_std", "x_pt", "sigma_pt", "u_xpt_def",
-    ] + ALL_METRICS
+def iter_canonical_rows(py_results, r_index):
+    """Generar las filas canonicas (una por metrica) sin materializarlas.
 
-    with open(OUTPUT_PY_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=py_fields, extrasaction="ignore")
-        writer.writeheader()
-        for row in py_results:
-            out = {}
-            for k in py_fields:
-                v = row[k]
-                if isinstance(v, str):
-                    out[k] = v
-                elif isinstance(v, float):
-                    out[k] = fmt_float(v)
-                else:
-                    out[k] = str(v)
-            writer.writerow(out)
-    print(f"  CSV intermedio Python escrito: {OUTPUT_PY_CSV}")
+    r_index: KeyedIndex de la tabla R por (combo_id, metodo, participant_id,
+    metrica) con la columna tipada r_value. Las metricas numericas se
+    comparan por columna en una sola pasada; las filas se generan despues.
+    Los combos ausentes de la tabla R quedan como EDGE_CASE.
+    """
+    r_combos = {key[0] for key in r_index.positions}
+    numeric = {}
+    for metric in ALL_METRICS:
+        if metric.endswith("_eval"):
+            continue
+        keys = [
+            (row["combo_id"], row["method"], row["participant_id"], metric)
+            for row in py_results
+        ]
+        r_vals = r_index.values("r_value", keys)
+        py_vals = np.array([row[metric] for row in py_results], dtype=float)
+        status, diff = compare_rounded(r_vals, py_vals, 4, TOL_DEFAULT)
+        numeric[metric] = (r_vals.tolist(), status_labels(status), diff.tolist())
 
-    # 5. Leer CSV R para comparacion
-    r_data = {}  # (combo_id, method, participant_id, metric) -> str
-    with open(R_CSV, "r", newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            key = (row["combo_id"], row["section"], row["participant_id"], row["metric"])
-            r_data[key] = row.get("r_value", "")
-
-    # 6. Generar filas canonicas de comparacion
-    canonical_rows = []
-    pass_count = 0
-    fail_count = 0
-
-    for py_row in py_results:
+    for i, py_row in enumerate(py_results):
         combo_id       = py_row["combo_id"]
         method         = py_row["method"]
         participant_id = py_row["participant_id"]
 
+        no_ref = combo_id not in r_combos
         for metric in ALL_METRICS:
-            is_eval = metric.endswith("_eval")
             py_val  = py_row[metric]
-            r_str   = r_data.get((combo_id, method, participant_id, metric), "")
 
-            if is_eval:
+            if metric not in numeric:
+                r_row  = r_index.get((combo_id, method, participant_id, metric), {})
+                r_str  = str(r_row.get("r_value", ""))
                 status = compare_categorical(r_str, py_val)
                 crow = {
                     "combo_id":       combo_id,
@@ -416,13 +668,12 @@ def run_stage_05():
                     "diff_app_r":     "nan",
                     "diff_app_python":"nan",
                     "diff_r_python":  "",
-                    "status":         status,
+                    "status":         STATUS_EDGE if no_ref else status,
                     "tolerance":      "exact",
-                    "notes":          "",
+                    "notes":          NO_R_REFERENCE if no_ref else "",
                 }
             else:
-                r_val  = parse_float(r_str)
-                status, diff_str = compare_numeric(r_val, py_val)
+                r_vals, statuses, diffs = numeric[metric]
                 crow = {
                     "combo_id":       combo_id,
                     "pollutant":      py_row["pollutant"],
@@ -432,46 +683,173 @@ def run_stage_05():
                     "participant_id": participant_id,
                     "metric":         metric,
                     "app_value":      "nan",
-                    "r_value":        fmt_float(r_val),
+                    "r_value":        fmt_float(r_vals[i]),
                     "python_value":   fmt_float(py_val),
                     "diff_app_r":     "nan",
                     "diff_app_python":"nan",
-                    "diff_r_python":  diff_str,
-                    "status":         status,
+                    "diff_r_python":  fmt_diff(diffs[i]),
+                    "status":         STATUS_EDGE if no_ref else statuses[i],
                     "tolerance":      str(TOL_DEFAULT),
-                    "notes":          "",
+                    "notes":          NO_R_REFERENCE if no_ref else "",
                 }
 
-            canonical_rows.append(crow)
-            if status == STATUS_PASS:
-                pass_count += 1
-            else:
-                fail_count += 1
+            yield crow
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def run_stage_05(
+    store=None, output_dir=None, r_dir=None, stage04_rows=None, combos=None, workers=1,
+    binary=False, memo=None, loo=False, n_mc=0, mc_rho=0.0, seed=DEFAULT_SEED,
+):
+    print("Etapa 5: Scores de Desempeño — INICIO")
+
+    out_py_csv = resolve_path(OUTPUT_PY_CSV, output_dir)
+    out_csv = resolve_path(OUTPUT_CSV, output_dir)
+    out_report = resolve_path(OUTPUT_REPORT, output_dir)
+    r_csv = resolve_path(R_CSV, r_dir)
+
+    if store is None:
+        store = load_data_store(summary_path=DATA_SUMMARY, pt_data_path=DATA_PT_DATA)
+    if combos is None:
+        combos = discover_combos(store, tables=("summary",))
+    combo_order = [make_combo_id(c["pollutant"], c["level"]) for c in combos]
+
+    # 1. Cargar parámetros de Etapa 4
+    if stage04_rows is not None:
+        params = stage04_params_from_rows(stage04_rows)
+    else:
+        params = load_stage04_params(resolve_path(STAGE04_CSV, output_dir))
+    print(f"  Parámetros cargados: {len(params)} combinaciones combo × método")
+
+    # 2. Cargar u_i desde pt_data_n13.csv
+    u_map = load_pt_data(store)
+    print(f"  u_i cargados: {len(u_map)} entradas (combo × participante)")
+
+    # 3. Cargar datos de participantes
+    participants = load_participants(store, u_map)
+    print(f"  Participantes cargados: {len(participants)} (sin 'ref')")
+
+    # Organizar por combo_id (solo combos seleccionados)
+    selected = set(combo_order)
+    by_combo = {}
+    for (combo_id, participant_id), data in participants.items():
+        if combo_id not in selected:
+            continue
+        if combo_id not in by_combo:
+            by_combo[combo_id] = {}
+        by_combo[combo_id][participant_id] = data
+
+    # 3. Calcular scores en Python (kernel vectorizado por bloque de combos)
+    py_results = map_combos(
+        compute_scores, sorted(by_combo.keys()), workers, args=(params, by_combo), memo=memo
+    )
+
+    expected_rows = len(py_results) * len(ALL_METRICS)
+    print(
+        f"  Scores calculados: {len(py_results)} filas base "
+        f"(esperado para comparacion: {expected_rows})"
+    )
+
+    # 4. Guardar CSV intermedio Python
+    os.makedirs(os.path.dirname(out_py_csv), exist_ok=True)
+    py_fields = [
+        "combo_id", "pollutant", "level", "method", "participant_id",
+        "result", "uncertainty_std", "x_pt", "sigma_pt", "u_xpt_def",
+    ] + ALL_METRICS
+
+    with open(out_py_csv, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(py_fields)
+        for row in py_results:
+            writer.writerow([fmt_cell(row[k]) for k in py_fields])
+    print(f"  CSV intermedio Python escrito: {out_py_csv}")
+    if binary:
+        write_npz(npz_path(out_py_csv), py_results, py_fields)
+
+    # 4b. Influencia leave-one-out (opcional)
+    loo_rows = []
+    if loo:
+        loo_records = map_combos(
+            compute_influence, sorted(by_combo.keys()), workers, args=(store, by_combo)
+        )
+        loo_rows = [row for rec in loo_records for row in rec["rows"]]
+        loo_z_rows = [row for rec in loo_records for row in rec["z_rows"]]
+        for path, rows, fields in (
+            (resolve_path(OUTPUT_LOO_CSV, output_dir), loo_rows, LOO_FIELDS),
+            (resolve_path(OUTPUT_LOO_Z_CSV, output_dir), loo_z_rows, LOO_Z_FIELDS),
+        ):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=fields)
+                writer.writeheader()
+                writer.writerows(rows)
+            print(f"  CSV leave-one-out escrito: {path}")
+            if binary:
+                write_npz(npz_path(path), rows, fields)
+
+    # 4c. Propagacion Monte Carlo (opcional)
+    mc_rows = []
+    if n_mc > 0:
+        mc_records = map_combos(
+            partial(compute_monte_carlo, n_draws=n_mc, rho=mc_rho, seed=seed),
+            sorted(by_combo.keys()), workers, args=(store, by_combo, params),
+        )
+        mc_rows = [row for rec in mc_records for row in rec["rows"]]
+        out_mc_csv = resolve_path(OUTPUT_MC_CSV, output_dir)
+        with open(out_mc_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=MC_FIELDS)
+            writer.writeheader()
+            writer.writerows(mc_rows)
+        print(f"  CSV Monte Carlo escrito: {out_mc_csv} (M={n_mc}, rho={mc_rho}, semilla={seed})")
+        if binary:
+            write_npz(npz_path(out_mc_csv), mc_rows, MC_FIELDS)
 
-    # 7. Escribir CSV canonico
-    with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=CANONICAL_COLS)
-        writer.writeheader()
-        writer.writerows(canonical_rows)
-    print(f"  CSV canónico escrito: {OUTPUT_CSV}")
+    # 5. Leer CSV R para comparacion
+    r_index = KeyedIndex(
+        load_rows(r_csv), ("combo_id", "section", "participant_id", "metric"), ("r_value",)
+    )
+
+    # 6-7. Generar filas canonicas y escribirlas a medida que se producen
+    representative_method = "Referencia"
+    representative_participant = "part_1"
+    summary = CanonicalSummary(
+        keep={"section": representative_method, "participant_id": representative_participant},
+    )
+    # Con binary las filas se conservan ademas para el .npz
+    binary_rows = []
+
+    def observe(row):
+        summary(row)
+        binary_rows.append(row)
+
+    write_canonical_rows(
+        iter_canonical_rows(py_results, r_index), out_csv,
+        fieldnames=CANONICAL_COLS, observer=observe if binary else summary, encoding="utf-8",
+    )
+    if binary:
+        write_npz(npz_path(out_csv), binary_rows, CANONICAL_COLS)
+    pass_count = summary.count(STATUS_PASS)
+    fail_count = summary.total - pass_count - summary.count(STATUS_EDGE)
+    edge_count = summary.count(STATUS_EDGE)
+    print(f"  CSV canónico escrito: {out_csv}")
 
     # 8. Reporte
-    combos_processed = sorted(set(r["combo_id"] for r in canonical_rows))
-    level_by_combo = {}
-    for row in canonical_rows:
-        level_by_combo[row["combo_id"]] = row["level"]
-    fail_rows = [r for r in canonical_rows if r["status"] == STATUS_FAIL]
-    method_counts = {}
-    for row in canonical_rows:
-        method_counts[row["section"]] = method_counts.get(row["section"], 0) + 1
+    combos_processed = sorted(summary.levels)
+    level_by_combo = summary.levels
+    fail_rows = summary.fail_rows
+    method_counts = summary.section_counts
 
     report_lines = [
         "# Reporte: Etapa 5 — Scores de Desempeño",
         "",
         f"**Fecha**: {os.popen('date +%Y-%m-%d').read().strip()}",
         "",
-        "## Combos procesados",
     ]
+    if n_mc > 0:
+        report_lines.extend([seed_note(seed), ""])
+    report_lines.append("## Combos procesados")
     for cid in combos_processed:
         report_lines.append(f"- {cid}")
 
@@ -496,24 +874,17 @@ def run_stage_05():
         "## Resumen PASS/FAIL",
         f"- **PASS**: {pass_count}",
         f"- **FAIL**: {fail_count}",
-        "- EDGE_CASE: 0",
+        f"- EDGE_CASE: {edge_count}",
         "- KNOWN_DISCREPANCY: 0",
     ])
 
     report_lines.extend(["", "## Tabla resumida de resultados"])
-    representative_method = "Referencia"
-    representative_participant = "part_1"
 
-    for combo_id in ["O3_0", "O3_80", "O3_180"]:
+    for combo_id in combo_order:
         if combo_id not in combos_processed:
             continue
         representative_level = level_by_combo.get(combo_id, "")
-        rows = [
-            r for r in canonical_rows
-            if r["combo_id"] == combo_id
-            and r["section"] == representative_method
-            and r["participant_id"] == representative_participant
-        ]
+        rows = [r for r in summary.kept if r["combo_id"] == combo_id]
 
         report_lines.extend([
             "",
@@ -533,7 +904,10 @@ def run_stage_05():
             zp_row = by_metric.get("z_prime_score", {})
             zeta_row = by_metric.get("zeta_score", {})
             en_row = by_metric.get("En_score", {})
-            status = STATUS_PASS if all(r["status"] == STATUS_PASS for r in rows) else STATUS_FAIL
+            if all(r["status"] == STATUS_EDGE for r in rows):
+                status = STATUS_EDGE
+            else:
+                status = STATUS_PASS if all(r["status"] == STATUS_PASS for r in rows) else STATUS_FAIL
 
             def pick_value(row):
                 return fmt_float(parse_float(row.get("python_value", "nan"))) if row else "NA"
@@ -566,10 +940,70 @@ def run_stage_05():
         "",
         "## Nota",
         "La salida actual de Etapa 5 no exporta el valor del aplicativo ni una columna Excel separada.",
-        "El informe muestra un solo participante de referencia por cada combo O3 solicitado.",
+        "El informe muestra un solo participante de referencia por cada combo procesado.",
         "Los valores de Excel y App deben documentarse con pantallazos junto a la evidencia R/Python de cada combo.",
     ])
 
+    if loo:
+        report_lines.extend([
+            "",
+            "## Influencia leave-one-out",
+            "",
+            "Participante cuyo retiro mas desplaza x_pt en cada combo/metodo "
+            f"(detalle en {os.path.basename(OUTPUT_LOO_CSV)} y {os.path.basename(OUTPUT_LOO_Z_CSV)}).",
+            "",
+            "| Combo | Metodo | Retirado | Δx_pt | Δsigma_pt | max |Δz| | Cambios de evaluacion z |",
+            "|---|---|---|---:|---:|---:|---:|",
+        ])
+        for combo_id in combo_order:
+            for method in LOO_METHODS:
+                rows = [
+                    r for r in loo_rows
+                    if r["combo_id"] == combo_id and r["method"] == method
+                    and math.isfinite(r["delta_x_pt"])
+                ]
+                if not rows:
+                    continue
+                top = max(rows, key=lambda r: abs(r["delta_x_pt"]))
+                report_lines.append(
+                    f"| {combo_id} | {method} | {top['removed_participant']} | "
+                    f"{top['delta_x_pt']:.6g} | {top['delta_sigma_pt']:.6g} | "
+                    f"{top['max_abs_delta_z']:.4f} | {top['z_eval_changes']} |"
+                )
+
+    if n_mc > 0:
+        report_lines.extend([
+            "",
+            f"## Monte Carlo (M={n_mc}, rho={mc_rho}, semilla={seed})",
+            "",
+            "u_xpt_def en cuadratura (Etapa 4) frente a la desviacion Monte Carlo de x_pt_def "
+            f"(detalle por participante en {os.path.basename(OUTPUT_MC_CSV)}).",
+            "",
+            "Incertidumbres muestreadas: resultados de participantes (u_i o sd/sqrt(3)), "
+            "u_hom (d_hom ~ N(0, u_hom)) y u_stab (d_stab ~ N(0, u_stab)) como componentes "
+            "aleatorias de x_pt_def. u_xpt_def en los denominadores se evalua por draw en "
+            "cuadratura (u_xpt del draw, u_hom y u_stab fijos).",
+            "",
+            "| Combo | Metodo | u_xpt_def (cuadratura) | sd MC x_pt_def | IC 95% x_pt_def | "
+            "P(z satisfactorio) media |",
+            "|---|---|---:|---:|---|---:|",
+        ])
+        for combo_id in combo_order:
+            for method in METHODS:
+                combo_rows = [
+                    r for r in mc_rows if r["combo_id"] == combo_id and r["method"] == method
+                ]
+                if not combo_rows:
+                    continue
+                x_row = next(r for r in combo_rows if r["metric"] == "x_pt")
+                p_sat = [r["p_satisfactory"] for r in combo_rows if r["metric"] == "z_score"]
+                u_def = params[(combo_id, method)].get("u_xpt_def", float("nan"))
+                report_lines.append(
+                    f"| {combo_id} | {method} | {u_def:.6g} | {x_row['sd']:.6g} | "
+                    f"[{x_row['ci_low']:.6g}, {x_row['ci_high']:.6g}] | "
+                    f"{sum(p_sat) / len(p_sat):.4f} |"
+                )
+
     if fail_rows:
         report_lines.extend(["", "## Discrepancias"])
         for row in fail_rows[:20]:
@@ -578,8 +1012,8 @@ def run_stage_05():
                 f"{row['combo_id']} | {row['participant_id']} | {row['metric']}: "
                 f"R={fmt_float(parse_float(row['r_value']))} vs Py={fmt_float(parse_float(row['python_value']))}"
             )
-        if len(fail_rows) > 20:
-            report_lines.append(f"- ... y {len(fail_rows) - 20} más")
+        if fail_count > 20:
+            report_lines.append(f"- ... y {fail_count - 20} más")
 
     conclusion = "Etapa PASS" if fail_count == 0 else \
         f"Etapa con {fail_count} FAIL pendientes de revisión"
@@ -590,13 +1024,14 @@ def run_stage_05():
         "",
     ])
 
-    with open(OUTPUT_REPORT, "w", encoding="utf-8") as f:
+    with open(out_report, "w", encoding="utf-8") as f:
         f.write("\n".join(report_lines))
-    print(f"  Reporte escrito: {OUTPUT_REPORT}")
+    print(f"  Reporte escrito: {out_report}")
 
     total = pass_count + fail_count
     print(f"\n  RESUMEN: {pass_count} PASS, {fail_count} FAIL de {total} comparaciones")
     print("Etapa 5: Scores de Desempeño — FIN")
+    return {"py_results": py_results, "summary": summary}
 
 
 if __name__ == "__main__":
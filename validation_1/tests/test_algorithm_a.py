@@ -0,0 +1,69 @@
+"""
+Pruebas del Algoritmo A por lotes (algorithm_a.py): cada fila de la
+matriz rellena con NaN debe dar lo mismo que el combo corrido solo y que
+un ciclo escalar directo.
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import os
+import statistics
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from algorithm_a import algorithm_a_rows, run_algorithm_a
+from helpers import pad_rows
+
+ROWS = [
+    [80.12, 80.05, 79.98, 80.30, 80.07, 79.91, 80.11, 81.4, 78.2],
+    [2.014, 2.02, 1.99, 2.05, 2.014, 2.0],
+    [5.0, 5.0, 5.0, 5.0, 5.0],
+    [1.0, 2.0, 3.0],
+]
+
+
+def _loop_algorithm_a(values, max_iter=50, tol=0.5):
+    # x* fijo en la mediana inicial; solo se actualiza sigma (Etapas 4 y 4b)
+    x_star = statistics.median(values)
+    sigma = 1.483 * statistics.median([abs(v - x_star) for v in values])
+    if sigma < 1e-15:
+        return x_star, sigma, 0
+    for iteration in range(1, max_iter + 1):
+        lower, upper = x_star - 1.5 * sigma, x_star + 1.5 * sigma
+        x_w = [min(max(v, lower), upper) for v in values]
+        med_w = statistics.median(x_w)
+        sigma_w = 1.06 * statistics.median([abs(v - med_w) for v in x_w])
+        if abs(sigma_w - sigma) <= tol * sigma:
+            return x_star, sigma_w, iteration
+        sigma = sigma_w
+    return x_star, sigma, max_iter
+
+
+def test_batched_rows_match_single_combo_runs():
+    res = algorithm_a_rows(pad_rows(ROWS))
+    for i, row in enumerate(ROWS):
+        single = run_algorithm_a(row)
+        if len(row) < 4:
+            assert not res["valid"][i] and "error" in single
+            continue
+        assert res["assigned_value"][i] == single["assigned_value"]
+        assert res["robust_sd"][i] == single["robust_sd"]
+        assert res["iterations"][i] == single["iterations"]
+
+
+@pytest.mark.parametrize("tol", [0.5, 1e-6])
+@pytest.mark.parametrize("i", range(3))
+def test_batched_rows_match_plain_loop(i, tol):
+    # tol = 1e-6 obliga a varias iteraciones con filas activas y convergidas
+    res = algorithm_a_rows(pad_rows(ROWS), tol=tol)
+    x_star, sigma, iterations = _loop_algorithm_a(ROWS[i], tol=tol)
+    assert res["assigned_value"][i] == pytest.approx(x_star, rel=1e-15)
+    assert res["robust_sd"][i] == pytest.approx(sigma, rel=1e-12)
+    assert res["iterations"][i] == iterations
+    assert res["converged"][i]
+    assert np.isfinite(res["winsorized"][i, :len(ROWS[i])]).all()
@@ -0,0 +1,39 @@
+"""
+Pruebas de lectura/limpieza de archivos crudos CALAIRE (calaire_raw.py).
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from calaire_raw import clean_calaire_raw, read_calaire_raw, strip_comment
+
+
+def test_strip_comment_outside_quotes():
+    assert strip_comment("05/01/26 ;03:08;#VALUE!;0") == "05/01/26 ;03:08;"
+    assert strip_comment('a;"#1";2') == 'a;"#1";2'
+    assert strip_comment("a;1;2") == "a;1;2"
+
+
+def test_excel_error_cell_blanks_rest_of_row(tmp_path):
+    # read.table de R (comment.char = "#", fill = TRUE): NA en NO2_ref y NO2_gen
+    path = tmp_path / "datos_ronda_x_r.csv"
+    path.write_text(
+        "Date;Time;NO2_ref;NO2_gen\n"
+        "05/01/26 ;03:07;-0.808;0\n"
+        "05/01/26 ;03:08;#VALUE!;0\n"
+        "05/01/26 ;03:09;-1.139;0\n",
+        encoding="utf-8",
+    )
+    cleaned = clean_calaire_raw(read_calaire_raw(str(path)))
+    cols = cleaned["table"].columns
+    assert np.isnan(cols["no2_calaire_ppb"][1]) and np.isnan(cols["no2_gen_ppb"][1])
+    assert not np.isnat(cols["timestamp"][1])
+    na_counts = [e["message"] for e in cleaned["log"] if e["check"] == "na_counts"]
+    assert na_counts == ["no2_calaire_ppb:1; no2_gen_ppb:1"]
@@ -0,0 +1,43 @@
+"""
+Pruebas del almacen columnar y del descubrimiento de combos
+(data_store.py, helpers.discover_combos).
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from data_store import load_data_store
+from helpers import discover_combos
+
+HEADER = "pollutant,run,level,replicate,sample_id,value\n"
+
+
+def _store(tmp_path, body):
+    path = tmp_path / "homogeneity.csv"
+    path.write_text(HEADER + body, encoding="utf-8")
+    return load_data_store(homogeneity_path=str(path))
+
+
+def test_micro_sign_variants_are_one_combo(tmp_path):
+    store = _store(tmp_path, "co,corrida_2,2-μmol/mol,1,1,2.0\nco,corrida_2,2-µmol/mol,1,2,2.1\n")
+    assert store.combos() == [("co", "2-µmol/mol", "corrida_2")]
+    assert store.all_values("homogeneity", "co", "2-μmol/mol").tolist() == [2.0, 2.1]
+
+
+def test_same_level_in_two_runs_raises(tmp_path):
+    store = _store(tmp_path, "o3,corrida_1,80-nmol/mol,1,1,80.0\no3,corrida_2,80-nmol/mol,1,1,81.0\n")
+    with pytest.raises(ValueError, match="mas de una corrida"):
+        discover_combos(store)
+
+
+def test_combo_id_collision_across_units_raises(tmp_path):
+    store = _store(tmp_path, "o3,corrida_1,80-nmol/mol,1,1,80.0\no3,corrida_2,80-µmol/mol,1,1,0.08\n")
+    with pytest.raises(ValueError, match="combo_id repetido"):
+        discover_combos(store)
@@ -0,0 +1,105 @@
+"""
+Pruebas del ANOVA de homogeneidad por lotes (homogeneity_anova.py) en
+disenos desbalanceados y con mascara, frente a un ciclo escalar directo.
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import math
+import os
+import statistics
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from homogeneity_anova import homogeneity_anova, stack_matrices
+
+NAN = float("nan")
+
+# g x m = 5 x 3: replicas faltantes (NaN) y una muestra sin valores
+UNBALANCED = [
+    [10.2, 10.4, 10.1],
+    [10.0, NAN, 10.3],
+    [10.6, 10.5, NAN],
+    [NAN, NAN, NAN],
+    [9.9, 10.1, 10.2],
+]
+# La mascara excluye ademas un valor finito
+MASK = [
+    [True, True, True],
+    [True, True, True],
+    [True, True, True],
+    [True, True, True],
+    [True, False, True],
+]
+# g x m = 4 x 2 con un par incompleto
+PAIRS = [
+    [80.1, 80.3],
+    [79.8, NAN],
+    [80.4, 80.0],
+    [80.2, 80.25],
+]
+
+METRICS = ["general_mean", "x_pt", "s_x_bar_sq", "sw", "ss_sq", "ss", "sigma_pt", "u_sigma_pt"]
+
+
+def _loop_anova(matrix, mask=None):
+    present = [
+        [math.isfinite(v) and (mask is None or mask[i][j]) for j, v in enumerate(row)]
+        for i, row in enumerate(matrix)
+    ]
+    samples = [
+        [v for v, ok in zip(row, ok_row) if ok] for row, ok_row in zip(matrix, present)
+    ]
+    samples = [s for s in samples if s]
+    g = len(samples)
+    m = max(len(s) for s in samples)
+    n = sum(len(s) for s in samples)
+    means = [sum(s) / len(s) for s in samples]
+    mean_of_means = sum(means) / g
+    s_x_bar_sq = sum((v - mean_of_means) ** 2 for v in means) / (g - 1)
+    if m == 2:
+        diffs = [row[0] - row[1] for row, ok in zip(matrix, present) if ok[0] and ok[1]]
+        sw = math.sqrt(sum(d ** 2 for d in diffs) / (2 * len(diffs)))
+    else:
+        variances = [statistics.variance(s) for s in samples if len(s) >= 2]
+        sw = math.sqrt(sum(variances) / len(variances))
+    ss_sq = abs(s_x_bar_sq - sw ** 2 / (n / g))
+    x_pt = statistics.median([row[0] for row, ok in zip(matrix, present) if ok[0]])
+    sigma_pt = statistics.median(
+        [abs(row[1] - x_pt) for row, ok in zip(matrix, present) if ok[1]]
+    )
+    return {
+        "g": g,
+        "m": m,
+        "n": n,
+        "general_mean": sum(sum(s) for s in samples) / n,
+        "x_pt": x_pt,
+        "s_x_bar_sq": s_x_bar_sq,
+        "sw": sw,
+        "ss_sq": ss_sq,
+        "ss": math.sqrt(ss_sq),
+        "sigma_pt": sigma_pt,
+        "u_sigma_pt": 1.25 * 1.483 * sigma_pt / math.sqrt(g),
+    }
+
+
+@pytest.mark.parametrize("matrix, mask", [(UNBALANCED, None), (UNBALANCED, MASK), (PAIRS, None)])
+def test_unbalanced_matches_plain_loop(matrix, mask):
+    res = homogeneity_anova(np.array(matrix), mask=None if mask is None else np.array(mask))
+    ref = _loop_anova(matrix, mask)
+    assert (res["g"][0], res["m"][0], res["n"][0]) == (ref["g"], ref["m"], ref["n"])
+    for metric in METRICS:
+        assert res[metric][0] == pytest.approx(ref[metric], rel=1e-12), metric
+
+
+def test_stacked_combos_match_individual_calls():
+    stacked = homogeneity_anova(stack_matrices([UNBALANCED, PAIRS]))
+    for i, matrix in enumerate([UNBALANCED, PAIRS]):
+        single = homogeneity_anova(np.array(matrix))
+        for metric in METRICS + ["criterio_c", "criterio_expandido"]:
+            np.testing.assert_array_equal(stacked[metric][i], single[metric][0], err_msg=metric)
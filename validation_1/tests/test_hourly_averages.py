@@ -0,0 +1,60 @@
+"""
+Pruebas de promedios horarios de ronda (hourly_averages.py) sobre los
+archivos crudos de la ronda 2c (celdas "#VALUE!" en la hora 03:01).
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import csv
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from calaire_raw import clean_calaire_raw, read_calaire_raw
+from hourly_averages import hourly_rows
+
+DATA_DIR = os.path.join(HERE, "..", "..", "data_use_cases", "data")
+RAW_R = os.path.join(DATA_DIR, "raw", "datos_ronda_2c_r.csv")
+RAW_P = os.path.join(DATA_DIR, "raw", "datos_ronda_2c_p.csv")
+LEVELS = os.path.join(DATA_DIR, "metadata", "niveles_calaire.csv")
+HOUR = "2026-05-01 03:01:00"
+
+pytestmark = pytest.mark.skipif(
+    not all(os.path.exists(p) for p in (RAW_R, RAW_P, LEVELS)),
+    reason="archivos de la ronda 2c no disponibles",
+)
+
+
+def _columns(path):
+    return clean_calaire_raw(read_calaire_raw(path))["table"].columns
+
+
+def _levels():
+    with open(LEVELS, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def _hour(rows):
+    return next(r for r in rows if r["hour_start"] == HOUR)
+
+
+def test_ronda_2c_r_first_hour_matches_r():
+    # Valores de h_ronda_2c_r.csv (R): las filas con "#VALUE!" quedan fuera
+    # de la corrida y la hora se completa con 60 minutos validos
+    row = _hour(hourly_rows(_columns(RAW_R), _levels()))
+    assert row["n"] == 60
+    assert (row["mean_value"], row["sd_value"], row["u_value"]) == (-0.308, 0.812, 0.105)
+    assert row["valid_hour"] and row["validation_flags"] == ""
+
+
+def test_ronda_2c_p_first_hour_matches_r():
+    # Valores de h_ronda_2c_p_ronda.csv (R)
+    ref = _columns(RAW_R)
+    row = _hour(hourly_rows(_columns(RAW_P), _levels(), "p1", ref))
+    assert row["n"] == 60
+    assert (row["mean_value"], row["sd_value"], row["u_value"]) == (-0.708, 0.407, 0.052)
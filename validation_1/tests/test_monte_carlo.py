@@ -0,0 +1,42 @@
+"""
+Pruebas del acumulador Monte Carlo por bloques (monte_carlo.py).
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from monte_carlo import MonteCarloSummary
+from random_streams import CHUNK_SIZE, chunk_streams
+
+
+def _summarize(n_draws, chunk_size=CHUNK_SIZE):
+    acc, draws = MonteCarloSummary(), []
+    for size, rng in chunk_streams(13528, "N01", n_draws, chunk_size):
+        x = rng.standard_normal((size, 1))
+        draws.append(x[:, 0])
+        acc.add("x", x)
+    return acc.result("x"), np.concatenate(draws)
+
+
+@pytest.mark.parametrize("n_draws", [CHUNK_SIZE + 1, 2 * CHUNK_SIZE + 1, 2 * CHUNK_SIZE + 37])
+def test_ci_coverage_with_short_last_chunk(n_draws):
+    res, x = _summarize(n_draws)
+    lo, hi = res["ci_low"][0], res["ci_high"][0]
+    assert res["draws"] == n_draws
+    assert abs(lo + 1.96) < 0.1 and abs(hi - 1.96) < 0.1
+    coverage = np.mean((x >= lo) & (x <= hi))
+    assert abs(coverage - 0.95) < 0.01
+
+
+def test_ci_single_chunk_matches_pooled_percentiles():
+    res, x = _summarize(5000)
+    assert res["ci_low"][0] == pytest.approx(np.quantile(x, 0.025))
+    assert res["ci_high"][0] == pytest.approx(np.quantile(x, 0.975))
@@ -0,0 +1,60 @@
+"""
+Pruebas de la estructura de estadisticos de orden (order_stats.py): las
+consultas sobre el arreglo ordenado deben coincidir con recalcular desde
+los valores originales.
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from helpers import median_rows, pad_rows, quantile_type7_rows
+from order_stats import OrderStats
+
+ROWS = pad_rows([
+    [3.2, 1.5, 2.8, 9.1, 2.2, 2.9],
+    [0.5, float("nan"), 0.1, 0.3],
+    [7.0, 7.0, 7.0],
+    [4.4],
+])
+
+
+def test_median_and_quantile_match_recompute():
+    stats = OrderStats(ROWS)
+    np.testing.assert_array_equal(stats.median(), median_rows(ROWS))
+    for prob in (0.25, 0.75):
+        np.testing.assert_array_equal(stats.quantile(prob), quantile_type7_rows(ROWS, prob))
+
+
+def test_abs_dev_median_matches_recompute():
+    stats = OrderStats(ROWS)
+    center = stats.median()
+    expected = median_rows(np.abs(ROWS - center[:, None]))
+    np.testing.assert_array_equal(stats.abs_dev_median(center), expected)
+
+
+def test_replace_order_preserving_and_broken_rows():
+    stats = OrderStats(ROWS)
+    lower = np.array([2.0, 0.2, 6.0, 4.0])
+    upper = np.array([3.0, 0.4, 8.0, 5.0])
+    clipped = np.clip(stats.sorted, lower[:, None], upper[:, None])
+    # Fila 0: se rompe el orden a proposito para forzar el reordenamiento
+    clipped[0, :2] = clipped[0, 1::-1] + [0.5, 0.0]
+    replaced = stats.replace(clipped)
+    np.testing.assert_array_equal(replaced.n, stats.n)
+    np.testing.assert_array_equal(replaced.sorted[0], np.sort(clipped[0]))
+    np.testing.assert_array_equal(replaced.median(), median_rows(clipped))
+    np.testing.assert_array_equal(
+        replaced.abs_dev_median(replaced.median()),
+        median_rows(np.abs(clipped - median_rows(clipped)[:, None])),
+    )
+    np.testing.assert_array_equal(
+        stats.clamp(lower, upper).median(),
+        median_rows(np.clip(ROWS, lower[:, None], upper[:, None])),
+    )
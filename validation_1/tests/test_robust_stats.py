@@ -0,0 +1,82 @@
+"""
+Pruebas de los estadisticos robustos por filas (helpers.robust_stats_rows,
+helpers.quantile_sorted_rows) frente a las versiones escalares y a un
+calculo directo sobre cada fila sin relleno.
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import os
+import statistics
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from helpers import (
+    mad_e, median, pad_rows, quantile_sorted_rows, quantile_type7, robust_stats_rows, sort_rows,
+)
+
+# Filas de distinto largo (relleno NaN), con empates, un NaN interno y una fila vacia
+ROWS = [
+    [80.12, 80.05, 79.98, 80.30, 80.07, 79.91, 80.11],
+    [0.0, 0.0, 1e-05, 0.0],
+    [2.014, float("nan"), 2.02, 1.99, 2.05, 2.014, 2.0],
+    [180.5],
+    [4.0, 3.0],
+    [],
+]
+
+
+def _finite(row):
+    return [v for v in row if np.isfinite(v)]
+
+
+def _type7(values, prob):
+    # Definicion de R quantile(type = 7): x[lo] + h * (x[hi] - x[lo])
+    x = sorted(values)
+    index = (len(x) - 1) * prob
+    lo = int(np.floor(index))
+    hi = min(lo + 1, len(x) - 1)
+    return x[lo] + (index - lo) * (x[hi] - x[lo])
+
+
+def test_robust_stats_rows_match_scalar_helpers():
+    stats = robust_stats_rows(pad_rows(ROWS))
+    for i, row in enumerate(ROWS):
+        values = _finite(row)
+        assert stats["n"][i] == len(values)
+        if not values:
+            assert np.isnan(stats["median"][i]) and np.isnan(stats["MADe"][i])
+            continue
+        assert stats["median"][i] == median(values)
+        assert stats["MADe"][i] == mad_e(values)
+        q1, q3 = quantile_type7(values, [0.25, 0.75])
+        assert stats["nIQR"][i] == 0.7413 * (q3 - q1)
+
+
+def test_robust_stats_rows_match_direct_computation():
+    stats = robust_stats_rows(pad_rows(ROWS))
+    for i, row in enumerate(ROWS[:-1]):
+        values = _finite(row)
+        med = statistics.median(values)
+        mad = statistics.median([abs(v - med) for v in values])
+        assert stats["median"][i] == pytest.approx(med, rel=1e-15)
+        assert stats["mad"][i] == pytest.approx(mad, rel=1e-12)
+        assert stats["MADe"][i] == pytest.approx(1.483 * mad, rel=1e-12)
+
+
+@pytest.mark.parametrize("prob", [0.0, 0.25, 0.5, 0.75, 1.0])
+def test_quantile_sorted_rows_type7(prob):
+    sorted_arr, n = sort_rows(pad_rows(ROWS))
+    q = quantile_sorted_rows(sorted_arr, n, prob)
+    for i, row in enumerate(ROWS):
+        values = _finite(row)
+        if not values:
+            assert np.isnan(q[i])
+            continue
+        assert q[i] == pytest.approx(_type7(values, prob), rel=1e-14)
+        assert q[i] == quantile_type7(values, [prob])[0]
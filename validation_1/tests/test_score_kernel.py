@@ -0,0 +1,79 @@
+"""
+Pruebas del kernel de puntajes z, z', zeta y En (stage_05_scores.score_kernel)
+en casos borde: incertidumbres nulas, NaN y u_xpt_def negativo.
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from stage_05_scores import eval_labels, score_kernel
+
+NAN = float("nan")
+SCORES = ["z_score", "z_prime_score", "zeta_score", "En_score"]
+
+# (result, u_i, x_pt, sigma_pt, u_xpt_def) -> (z, z', zeta, En)
+CASES = [
+    ((10.5, 0.2, 10.0, 0.25, 0.1),
+     (2.0, 0.5 / math.sqrt(0.0725), 0.5 / math.sqrt(0.05), 0.5 / math.sqrt(0.2))),
+    # sigma_pt = 0: z indefinido, z' usa solo u_xpt_def
+    ((10.5, 0.2, 10.0, 0.0, 0.1),
+     (NAN, 5.0, 0.5 / math.sqrt(0.05), 0.5 / math.sqrt(0.2))),
+    # sigma_pt = 0 y u_xpt_def = 0: z y z' indefinidos
+    ((10.5, 0.2, 10.0, 0.0, 0.0), (NAN, NAN, 2.5, 1.25)),
+    # u_i = 0 y u_xpt_def = 0: zeta y En indefinidos
+    ((10.5, 0.0, 10.0, 0.25, 0.0), (2.0, 2.0, NAN, NAN)),
+    # u_xpt_def NaN o negativo se toma como 0
+    ((10.5, 0.2, 10.0, 0.25, NAN), (2.0, 2.0, 2.5, 1.25)),
+    ((10.5, 0.2, 10.0, 0.25, -0.1), (2.0, 2.0, 2.5, 1.25)),
+    # u_i NaN: zeta y En indefinidos
+    ((10.5, NAN, 10.0, 0.25, 0.1), (2.0, 0.5 / math.sqrt(0.0725), NAN, NAN)),
+    # sigma_pt NaN: z y z' indefinidos
+    ((10.5, 0.2, 10.0, NAN, 0.1), (NAN, NAN, 0.5 / math.sqrt(0.05), 0.5 / math.sqrt(0.2))),
+    # resultado NaN: todo indefinido
+    ((NAN, 0.2, 10.0, 0.25, 0.1), (NAN, NAN, NAN, NAN)),
+]
+
+
+def _columns():
+    return [np.array([case[0][j] for case in CASES]) for j in range(5)]
+
+
+def test_score_kernel_edge_cases():
+    scores = score_kernel(*_columns())
+    for i, (_, expected) in enumerate(CASES):
+        for name, value in zip(SCORES, expected):
+            if math.isnan(value):
+                assert np.isnan(scores[name][i]), (i, name)
+                assert eval_labels(scores[name + "_eval"][i]) == "N/A"
+            else:
+                assert scores[name][i] == pytest.approx(value, rel=1e-12), (i, name)
+
+
+def test_score_kernel_evaluation_thresholds():
+    # |z| = 2 satisfactorio, 2 < |z| < 3 cuestionable, |z| >= 3 no satisfactorio
+    result = np.array([12.0, 12.5, 13.0, 7.0])
+    scores = score_kernel(result, 1.0, 10.0, 1.0, 0.0)
+    assert eval_labels(scores["z_score_eval"]).tolist() == [
+        "Satisfactorio", "Cuestionable", "No satisfactorio", "No satisfactorio",
+    ]
+    # En = diff / (2 * sqrt(u_i^2 + u_xpt_def^2)): |En| <= 1 satisfactorio
+    assert eval_labels(scores["En_score_eval"]).tolist() == [
+        "Satisfactorio", "No satisfactorio", "No satisfactorio", "No satisfactorio",
+    ]
+
+
+def test_score_kernel_scalar_matches_vector():
+    vector = score_kernel(*_columns())
+    for i, (args, _) in enumerate(CASES):
+        scalar = score_kernel(*args)
+        for name in SCORES:
+            np.testing.assert_array_equal(scalar[name], vector[name][i])
@@ -0,0 +1,135 @@
+"""
+Pruebas de reproducibilidad de los modos aleatorios: con semilla fija el
+resultado no depende de cuantos workers repartan los combos (map_combos).
+
+Uso:
+    python3 -m pytest -q validation_1/tests
+"""
+
+import os
+import sys
+import warnings
+from functools import partial
+
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from bootstrap import bootstrap_rows
+from bootstrap_register import bootstrap_pools
+from data_store import load_data_store
+from helpers import discover_combos, make_combo_id, map_combos
+from influence import leave_one_out_sorted, loo_estimates
+from stage_04_uncertainty_chain import compute_uncertainty_chain
+from random_streams import CHUNK_SIZE
+from stage_05_scores import METHODS, compute_influence, compute_monte_carlo, load_participants
+
+SUMMARY = os.path.join(HERE, "..", "..", "data_use_cases", "data", "for_validation", "summary_n4.csv")
+SEED = 20240
+N_COMBOS = 8
+
+pytestmark = pytest.mark.skipif(not os.path.exists(SUMMARY), reason="summary_n4.csv no disponible")
+
+
+@pytest.fixture(scope="module")
+def store():
+    return load_data_store(summary_path=SUMMARY)
+
+
+@pytest.fixture(scope="module")
+def combos(store):
+    return discover_combos(store, tables=("summary",))[:N_COMBOS]
+
+
+@pytest.fixture(scope="module")
+def by_combo(store, combos):
+    ids = {make_combo_id(c["pollutant"], c["level"]) for c in combos}
+    grouped = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # sin pt_data: zeta y En quedan NaN
+        participants = load_participants(store, {})
+    for (combo_id, participant_id), data in participants.items():
+        if combo_id in ids:
+            grouped.setdefault(combo_id, {})[participant_id] = data
+    return grouped
+
+
+def _serial_and_parallel(func, items, args):
+    return map_combos(func, items, 1, args=args), map_combos(func, items, 4, args=args)
+
+
+def test_bootstrap_rows_independent_of_workers(store, combos):
+    ids = [make_combo_id(c["pollutant"], c["level"]) for c in combos]
+    hom = {cid: {"x_pt": 0.0, "sigma_pt": 1.0, "u_sigma_pt": 0.0, "ss": 0.1} for cid in ids}
+    stab = {cid: {"u_stab_mean": 0.1} for cid in ids}
+    func = partial(compute_uncertainty_chain, n_boot=300, seed=SEED)
+    serial, parallel = _serial_and_parallel(func, combos, (store, hom, stab))
+    np.testing.assert_equal(
+        [rec["bootstrap"] for rec in serial], [rec["bootstrap"] for rec in parallel]
+    )
+    # Mismo resultado que el combo corrido solo
+    combo = combos[-1]
+    values = store.participant_values(combo["pollutant"], combo["level"])["mean_value"]
+    alone = bootstrap_rows(ids[-1], combo["pollutant"], combo["level"], values, 300, SEED)
+    np.testing.assert_equal(serial[-1]["bootstrap"], alone)
+
+
+def test_loo_estimates_independent_of_workers(store, by_combo):
+    ids = sorted(by_combo)
+    serial, parallel = _serial_and_parallel(compute_influence, ids, (store, by_combo))
+    np.testing.assert_equal(serial, parallel)
+    # Cada fila reducida coincide con recalcular sin el participante
+    combo = by_combo[ids[0]]
+    pids = sorted(combo)
+    first = combo[pids[0]]
+    data = store.participant_values(first["pollutant"], first["level"])
+    estimates = loo_estimates(leave_one_out_sorted(data["mean_value"], data["participant_id"], pids))
+    for k, pid in enumerate(pids):
+        kept = data["mean_value"][np.asarray(data["participant_id"]) != pid]
+        alone = loo_estimates(leave_one_out_sorted(kept, np.zeros(kept.size), []))
+        for method, (x_pt, sigma_pt) in estimates.items():
+            assert x_pt[k + 1] == alone[method][0][0], (pid, method)
+            assert sigma_pt[k + 1] == alone[method][1][0], (pid, method)
+
+
+def test_monte_carlo_streams_independent_of_workers(store, by_combo):
+    # Mas de un bloque de draws por combo: cada bloque tiene su flujo
+    ids = sorted(by_combo)[:4]
+    params = {}
+    for cid in ids:
+        first = next(iter(by_combo[cid].values()))
+        for method in METHODS:
+            params[(cid, method)] = {
+                "pollutant": first["pollutant"], "level": first["level"],
+                "x_pt": first["result"], "sigma_pt": 0.5, "u_xpt_def": 0.1,
+                "u_hom": 0.05, "u_stab": 0.02,
+            }
+    func = partial(compute_monte_carlo, n_draws=CHUNK_SIZE + 7, rho=0.3, seed=SEED)
+    serial, parallel = _serial_and_parallel(func, ids, (store, by_combo, params))
+    np.testing.assert_equal(serial, parallel)
+    assert all(rec["rows"] for rec in serial)
+
+
+def _pools(n_pools=6, n_minutes=45):
+    rng = np.random.default_rng(0)
+    start = np.datetime64("2026-05-01T03:00")
+    pools = []
+    for k in range(n_pools):
+        pools.append({
+            "pollutant": "co", "run": f"corrida_{k + 1}", "level": f"{2 * k}-\u00b5mol/mol",
+            "timestamps": start + np.arange(n_minutes + k).astype("timedelta64[m]"),
+            "values": np.round(2 * k + rng.normal(0, 0.05, n_minutes + k), 3),
+            "source_column": "co_ref_ppm", "generator_column": "co_gen_ppm",
+        })
+    return pools
+
+
+def test_bootstrap_pools_independent_of_workers_and_order():
+    pools = _pools()
+    serial, parallel = _serial_and_parallel(bootstrap_pools, pools, (20, SEED))
+    np.testing.assert_equal(serial, parallel)
+    # Cada pool depende solo de la semilla y de su clave, no del orden
+    reverse = map_combos(bootstrap_pools, pools[::-1], 4, args=(20, SEED))
+    np.testing.assert_equal(serial, reverse[::-1])